@@ -13,39 +13,54 @@ Features:
 - Comprehensive reporting and tracking
 
 Version: 1.0.0
+
+Submodules (and pandas/requests with them) are imported on first attribute access,
+so `import amfi_ter_analysis` is cheap and has no side effects.
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "Rachit Jain"
 __author_email__ = "rachit.jain@example.com"
 __license__ = "MIT"
 
-from .ter_analysis import (
-    download_ter_file,
-    read_ter_file,
-    find_ter_columns,
-    compare_ter_data,
-    analyze_ter_changes
-)
-
-from .ter_daily_automation import (
-    get_current_month_year,
-    load_state,
-    save_state
-)
-
-from .ter_github_actions import (
-    analyze_and_report
-)
-
-__all__ = [
-    'download_ter_file',
-    'read_ter_file',
-    'find_ter_columns',
-    'compare_ter_data',
-    'analyze_ter_changes',
-    'get_current_month_year',
-    'load_state',
-    'save_state',
-    'analyze_and_report'
-]
+# Public name -> submodule that defines it
+_LAZY_ATTRIBUTES = {
+    'download_ter_file': 'ter_analysis',
+    'read_ter_file': 'ter_analysis',
+    'find_ter_columns': 'ter_analysis',
+    'compare_ter_data': 'ter_analysis',
+    'analyze_ter_changes': 'ter_analysis',
+    'parse_scheme_code': 'ter_analysis',
+    'categorize_fund': 'ter_analysis',
+    'get_current_month_year': 'ter_daily_automation',
+    'load_state': 'ter_daily_automation',
+    'save_state': 'ter_daily_automation',
+    'compare_ter_daily': 'ter_daily_automation',
+    'read_snapshot': 'ter_core',
+    'compare_snapshots': 'ter_core',
+    'analyze_and_report': 'ter_github_actions',
+    'notify_changes': 'ter_notifier',
+    'SubscriptionIndex': 'ter_subscriptions',
+    'load_subscriptions': 'ter_subscriptions',
+    'TerDaemon': 'ter_daemon',
+    'get_ter_history': 'ter_history',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        if name.startswith('ter_'):
+            return importlib.import_module(f'.{name}', __name__)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
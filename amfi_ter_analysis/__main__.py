@@ -0,0 +1,3 @@
+from .ter_cli import main
+
+raise SystemExit(main())
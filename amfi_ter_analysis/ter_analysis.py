@@ -1,39 +1,48 @@
 import requests
 import pandas as pd
+import numpy as np
 import os
 import warnings
+from . import ter_metrics
 warnings.filterwarnings('ignore')
 
-# Create directories
-os.makedirs('downloads', exist_ok=True)
-os.makedirs('output', exist_ok=True)
+def ter_file_url(month, year):
+    """Build the AMFI TER Excel export URL for a month"""
+    month_str = f"{month:02d}-{year}"
+    return f"https://www.amfiindia.com/api/populate-te-rdata-revised?MF_ID=All&Month={month_str}&strCat=-1&strType=-1&excel=true"
 
-def download_ter_file(month, year):
-    """Download TER file for a specific month and year"""
+def fetch_ter_workbook(month, year, session=None):
+    """Fetch the TER workbook for a month and return its bytes, or None on failure"""
     month_str = f"{month:02d}-{year}"
-    url = f"https://www.amfiindia.com/api/populate-te-rdata-revised?MF_ID=All&Month={month_str}&strCat=-1&strType=-1&excel=true"
-    
     print(f"Downloading TER file for {month_str}...")
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=60, verify=False)
+        response = (session or requests).get(ter_file_url(month, year), headers=headers, timeout=60, verify=False)
         print(f"Response status: {response.status_code}, Size: {len(response.content)} bytes")
         
         if response.status_code == 200 and len(response.content) > 100:
-            file_path = f"downloads/TER_{month_str}.xlsx"
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            print(f"✓ Downloaded: {file_path}")
-            return file_path
-        else:
-            print(f"✗ Failed to download")
-            return None
+            ter_metrics.incr('bytes_fetched', len(response.content))
+            return response.content
+        print(f"✗ Failed to download")
+        return None
     except Exception as e:
         print(f"✗ Error: {e}")
         return None
 
+def download_ter_file(month, year):
+    """Download TER file for a specific month and year"""
+    content = fetch_ter_workbook(month, year)
+    if content is None:
+        return None
+    os.makedirs('downloads', exist_ok=True)
+    file_path = f"downloads/TER_{month:02d}-{year}.xlsx"
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    print(f"✓ Downloaded: {file_path}")
+    return file_path
+
 def read_ter_file(file_path):
     """Read Excel file and return dataframe"""
     try:
@@ -65,6 +74,188 @@ def find_ter_columns(df):
     
     return scheme_code_col, scheme_name_col, regular_col, direct_col
 
+# Asset class letter in the third segment of an NSDL scheme code (e.g. ABSL/O/E/DYF/03/01/0020)
+ASSET_CLASSES = {
+    'E': 'Equity',
+    'D': 'Debt',
+    'H': 'Hybrid',
+    'S': 'Solution Oriented',
+    'O': 'Other'
+}
+
+def parse_scheme_code(code):
+    """Split an NSDL scheme code into AMC prefix, asset class and sub-category"""
+    parts = [part.strip() for part in str(code).split('/')]
+    amc = parts[0].upper() if parts and parts[0] else None
+    asset_class = ASSET_CLASSES.get(parts[2].upper()) if len(parts) > 2 else None
+    sub_category = parts[3].upper() if len(parts) > 3 and parts[3] else None
+    return amc, asset_class, sub_category
+
+def categorize_fund(scheme_name):
+    """Classify a scheme into a broad fund category from its name"""
+    scheme_lower = str(scheme_name).lower()
+    if 'equity' in scheme_lower or 'growth' in scheme_lower or 'largecap' in scheme_lower or 'midcap' in scheme_lower or 'smallcap' in scheme_lower:
+        return 'Equity'
+    elif 'debt' in scheme_lower or 'bond' in scheme_lower or 'duration' in scheme_lower or 'liquid' in scheme_lower or 'gilt' in scheme_lower:
+        return 'Debt'
+    elif 'hybrid' in scheme_lower or 'balanced' in scheme_lower or 'arbitrage' in scheme_lower or 'savings' in scheme_lower:
+        return 'Hybrid/Mixed'
+    elif 'index' in scheme_lower or 'nifty' in scheme_lower or 'sensex' in scheme_lower or 'etf' in scheme_lower:
+        return 'Index/ETF'
+    elif 'fof' in scheme_lower or 'fund of funds' in scheme_lower:
+        return 'Fund of Funds'
+    else:
+        return 'Other'
+
+# Canonical columns of a normalized TER snapshot (one row per scheme)
+NORMALIZED_COLUMNS = [
+    'NSDL Scheme Code',
+    'Scheme Name',
+    'Scheme Category',
+    'TER Date',
+    'Regular Plan - Base TER (%)',
+    'Direct Plan - Base TER (%)'
+]
+
+def is_normalized(df):
+    """Whether a frame is already normalize_ter_frame output (as stored in history/)
+
+    Canonical columns and dtypes, and stripped, non-blank scheme codes in strictly
+    increasing order; normalizing such a frame would return it unchanged.
+    """
+    if list(df.columns) != NORMALIZED_COLUMNS:
+        return False
+    codes = df['NSDL Scheme Code']
+    types = pd.api.types
+    if not (types.is_string_dtype(codes.dtype) and types.is_datetime64_dtype(df['TER Date'].dtype)
+            and all(types.is_float_dtype(df[col].dtype) for col in NORMALIZED_COLUMNS[4:])):
+        return False
+    if codes.hasnans or not (codes.is_monotonic_increasing and codes.is_unique):
+        return False
+    return not codes.isin(['', 'nan', 'None']).any() and bool((codes.str.strip() == codes).all())
+
+def normalize_ter_frame(df):
+    """Reduce a raw TER workbook frame to one row per scheme with canonical columns
+
+    The AMFI workbook carries one row per scheme per TER Date; the latest dated row
+    is kept as the scheme's current TER. Frames that are already normalized are
+    returned as they are (with a fresh index).
+    """
+    if is_normalized(df):
+        return df.reset_index(drop=True)
+    code_col, name_col, regular_col, direct_col = find_ter_columns(df)
+    if code_col is None:
+        raise ValueError("No NSDL scheme code column found")
+
+    normalized = pd.DataFrame({
+        'NSDL Scheme Code': df[code_col].astype(str).str.strip(),
+        'Scheme Name': df[name_col] if name_col else None,
+        'Scheme Category': df['Scheme Category'] if 'Scheme Category' in df.columns else None,
+        'TER Date': pd.to_datetime(df['TER Date'], errors='coerce') if 'TER Date' in df.columns else pd.NaT,
+        'Regular Plan - Base TER (%)': pd.to_numeric(df[regular_col], errors='coerce') if regular_col else float('nan'),
+        'Direct Plan - Base TER (%)': pd.to_numeric(df[direct_col], errors='coerce') if direct_col else float('nan'),
+    })
+    normalized = normalized[~normalized['NSDL Scheme Code'].isin(['', 'nan', 'None'])]
+    normalized = normalized.sort_values(['NSDL Scheme Code', 'TER Date'], kind='mergesort')
+    normalized = normalized.drop_duplicates(subset=['NSDL Scheme Code'], keep='last')
+    return normalized.reset_index(drop=True)
+
+def diff_ter_frames(previous_df, current_df, plan, change_date=None):
+    """Vectorized Base TER diff of two normalized snapshots for one plan
+
+    Returns one row per changed scheme, sorted by scheme code, in the layout of
+    output/<plan>_Plan_TER_Changes.csv (TER Reduction = old - new).
+    """
+    ter_col = f'{plan} Plan - Base TER (%)'
+    previous_codes = pd.Index(previous_df['NSDL Scheme Code'])
+    current_codes = pd.Index(current_df['NSDL Scheme Code'])
+    float_ters = all(pd.api.types.is_float_dtype(df[ter_col].dtype)
+                     for df in (previous_df, current_df))
+    if (previous_codes.is_unique and current_codes.is_unique and not previous_codes.hasnans
+            and float_ters):
+        # One row per scheme on both sides (normalized snapshots): align by position
+        # and only build rows for the schemes that changed
+        positions = previous_codes.get_indexer(current_codes)
+        found = positions >= 0
+        old_values = np.full(len(current_df), np.nan)
+        old_values[found] = previous_df[ter_col].to_numpy()[positions[found]]
+        new_values = current_df[ter_col].to_numpy()
+        rows = np.flatnonzero((old_values != new_values) & ~np.isnan(old_values)
+                              & ~np.isnan(new_values))
+        changed = current_df.iloc[rows][['NSDL Scheme Code', 'Scheme Name', 'TER Date']]
+        changed = changed.assign(**{f'{ter_col}_old': old_values[rows],
+                                    f'{ter_col}_new': new_values[rows]})
+    else:
+        merged = previous_df[['NSDL Scheme Code', ter_col]].merge(
+            current_df[['NSDL Scheme Code', 'Scheme Name', 'TER Date', ter_col]],
+            on='NSDL Scheme Code',
+            how='inner',
+            suffixes=('_old', '_new')
+        )
+        old = merged[f'{ter_col}_old']
+        new = merged[f'{ter_col}_new']
+        changed = merged[(old != new) & old.notna() & new.notna()]
+
+    if change_date is not None:
+        dates = pd.Series(str(change_date), index=changed.index)
+    else:
+        dates = changed['TER Date'].dt.strftime('%Y-%m-%d')
+
+    result = pd.DataFrame({
+        'NSDL Scheme Code': changed['NSDL Scheme Code'],
+        'Scheme Name': changed['Scheme Name'],
+        f'Old {ter_col}': changed[f'{ter_col}_old'].round(4),
+        f'New {ter_col}': changed[f'{ter_col}_new'].round(4),
+        'TER Date (Change)': dates,
+        'TER Reduction (%)': (changed[f'{ter_col}_old'] - changed[f'{ter_col}_new']).round(4)
+    })
+    return result.sort_values('NSDL Scheme Code', kind='mergesort').reset_index(drop=True)
+
+def compare_plan_changes(regular_changes, direct_changes):
+    """Join Regular and Direct change sets on scheme id and compute the change difference
+
+    Mirrors TER_Comparison_Comprehensive.csv: Difference = Regular change - Direct change,
+    sorted by difference descending.
+    """
+    regular = regular_changes.rename(columns={
+        'Old Regular Plan - Base TER (%)': 'Regular Base TER Old',
+        'New Regular Plan - Base TER (%)': 'Regular Base TER New',
+        'TER Date (Change)': 'Date of TER Change'
+    })[['NSDL Scheme Code', 'Scheme Name', 'Date of TER Change', 'Regular Base TER Old', 'Regular Base TER New']]
+    direct = direct_changes.rename(columns={
+        'Old Direct Plan - Base TER (%)': 'Direct Base TER Old',
+        'New Direct Plan - Base TER (%)': 'Direct Base TER New',
+        'TER Date (Change)': 'Date of TER Change'
+    })[['NSDL Scheme Code', 'Scheme Name', 'Date of TER Change', 'Direct Base TER Old', 'Direct Base TER New']]
+
+    from .ter_pairing import pair_plans
+
+    merged = pair_plans(regular, direct, suffixes=('', '_direct'))
+    merged['Date of TER Change'] = merged['Date of TER Change'].fillna(merged['Date of TER Change_direct'])
+
+    regular_change = merged['Regular Base TER New'] - merged['Regular Base TER Old']
+    direct_change = merged['Direct Base TER New'] - merged['Direct Base TER Old']
+    merged['Difference (Reg Change - Dir Change)'] = regular_change - direct_change
+
+    comparison = merged[[
+        'NSDL Scheme Code',
+        'Scheme Name',
+        'Date of TER Change',
+        'Regular Base TER Old',
+        'Regular Base TER New',
+        'Direct Base TER Old',
+        'Direct Base TER New',
+        'Difference (Reg Change - Dir Change)'
+    ]]
+    return comparison.sort_values('Difference (Reg Change - Dir Change)', ascending=False,
+                                  kind='mergesort').reset_index(drop=True)
+
+def classify_changes(comparison, threshold=0.02):
+    """Tag each compared scheme with its fund category and split out significant differences"""
+    comprehensive = comparison.assign(Fund_Category=comparison['Scheme Name'].map(categorize_fund))
+    significant = comprehensive[comprehensive['Difference (Reg Change - Dir Change)'].abs() >= threshold]
+    return comprehensive, significant.reset_index(drop=True)
+
 def compare_ter_data(jan_df, feb_df):
     """Compare TER data between two dataframes"""
     jan_code, jan_name, jan_regular, jan_direct = find_ter_columns(jan_df)
@@ -0,0 +1,199 @@
+"""
+Anomaly scoring for daily TER changes
+Scores every changed scheme in one vectorized pass over the day's comparison rows:
+robust z-scores of its Regular and Direct moves against its AMC peers, its category
+peers and its own revision history, plus regulatory Base TER cap breaches and
+Regular/Direct spread inversions. The highest-scoring schemes feed the change
+report and the Google Chat alerts.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .ter_analysis import categorize_fund
+from .ter_sharding import amc_prefix
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('Regular', 'Direct')
+
+# Highest Base TER (%) allowed for the smallest AUM slab (SEBI MF Regulation 52(6)),
+# by the broad categories of categorize_fund; 'Other' uses the equity ceiling
+TER_CAPS = {
+    'Equity': 2.25,
+    'Hybrid/Mixed': 2.25,
+    'Debt': 2.00,
+    'Index/ETF': 1.00,
+    'Fund of Funds': 2.25,
+    'Other': 2.25,
+}
+
+# Modified z-score (Iglewicz-Hoaglin): 0.6745 * (x - median) / MAD
+MAD_SCALE = 1.4826
+# TER is quoted to 0.01%, so a peer spread below one tick is treated as one tick
+MIN_SCALE = 0.01
+MIN_PEERS = 5
+Z_THRESHOLD = 3.5
+# Score added for each rule break (cap breach, spread inversion)
+RULE_SCORE = 10.0
+TOP_ANOMALIES = 20
+
+ANOMALY_COLUMNS = [
+    'NSDL Scheme Code', 'Scheme Name', 'AMC', 'Fund_Category', 'Date of TER Change',
+    'Regular Change', 'Direct Change', 'Regular New', 'Direct New',
+    'AMC Z', 'Category Z', 'History Z', 'Cap Breach', 'Spread Inversion', 'Score', 'Reasons',
+]
+
+
+def robust_z(values, groups=None, min_peers=MIN_PEERS):
+    """Modified z-score of each value against its group (or all values)
+
+    Groups smaller than min_peers are scored against the whole set. NaN values
+    score NaN and are left out of the medians.
+    """
+    values = pd.Series(values, dtype=float).reset_index(drop=True)
+    overall_median = values.median()
+    overall_scale = max(MAD_SCALE * (values - overall_median).abs().median(), MIN_SCALE) \
+        if values.notna().any() else MIN_SCALE
+    if groups is None:
+        return ((values - overall_median) / overall_scale).to_numpy()
+
+    groups = pd.Series(groups).reset_index(drop=True)
+    grouped = values.groupby(groups, sort=False)
+    median = grouped.transform('median')
+    mad = (values - median).abs().groupby(groups, sort=False).transform('median')
+    peers = grouped.transform('count')
+    scale = (MAD_SCALE * mad).clip(lower=MIN_SCALE)
+    small = peers < min_peers
+    median = median.mask(small, overall_median)
+    scale = scale.mask(small, overall_scale)
+    return ((values - median) / scale).to_numpy()
+
+
+def revision_volatility(history_dir='history', window=None, panel=None):
+    """Per-scheme standard deviation of past Regular / Direct revisions from the history
+
+    Returns a frame with NSDL Scheme Code and '<plan> Volatility' / '<plan> Revisions'
+    columns, or None when there is no history. Pass a TrendPanel that is already
+    up to date to skip reading the history directory.
+    """
+    from .ter_trends import TrendPanel
+
+    panel = panel if panel is not None else TrendPanel.from_history(history_dir)
+    if not panel.dates:
+        return None
+    frames = []
+    for plan in PLANS:
+        summary = panel.summary(plan, window=window).set_index('NSDL Scheme Code')
+        frames.append(summary[['Volatility', 'Revisions']].add_prefix(f'{plan} '))
+    return pd.concat(frames, axis=1).rename_axis('NSDL Scheme Code').reset_index()
+
+
+def score_anomalies(comparison, history=None, caps=TER_CAPS, min_peers=MIN_PEERS,
+                    threshold=Z_THRESHOLD):
+    """Score every row of a compare_plan_changes frame; returns ANOMALY_COLUMNS, unsorted
+
+    history is an optional revision_volatility frame. A move's history z is its size
+    in units of the scheme's past revision volatility (schemes with fewer than three
+    past revisions get NaN). Score is the largest |z| plus RULE_SCORE per rule break;
+    Reasons lists each |z| at or above threshold and each rule break.
+    """
+    codes = comparison['NSDL Scheme Code'].astype(str).str.strip().reset_index(drop=True)
+    names = comparison['Scheme Name'].reset_index(drop=True)
+    if 'Fund_Category' in comparison:
+        categories = comparison['Fund_Category'].reset_index(drop=True)
+    else:
+        categories = names.map({name: categorize_fund(name) for name in pd.unique(names)})
+    amcs = amc_prefix(codes.to_numpy())
+
+    frame = pd.DataFrame({
+        'NSDL Scheme Code': codes,
+        'Scheme Name': names,
+        'AMC': amcs,
+        'Fund_Category': categories,
+        'Date of TER Change': comparison['Date of TER Change'].reset_index(drop=True),
+    })
+    for plan in PLANS:
+        old = comparison[f'{plan} Base TER Old'].to_numpy(dtype=float)
+        new = comparison[f'{plan} Base TER New'].to_numpy(dtype=float)
+        frame[f'{plan} Change'] = np.round(new - old, 4)
+        frame[f'{plan} New'] = new
+
+    # Peer and history z per plan; keep the plan with the larger deviation
+    amc_z = np.full((len(PLANS), len(frame)), np.nan)
+    category_z = np.full_like(amc_z, np.nan)
+    history_z = np.full_like(amc_z, np.nan)
+    for p, plan in enumerate(PLANS):
+        change = frame[f'{plan} Change']
+        amc_z[p] = robust_z(change, frame['AMC'], min_peers)
+        category_z[p] = robust_z(change, frame['Fund_Category'], min_peers)
+        if history is not None and f'{plan} Volatility' in history:
+            past = history.set_index('NSDL Scheme Code').reindex(codes)
+            volatility = past[f'{plan} Volatility'].to_numpy(dtype=float)
+            enough = past[f'{plan} Revisions'].fillna(0).to_numpy() >= 3
+            scale = np.maximum(np.nan_to_num(volatility), MIN_SCALE)
+            history_z[p] = np.where(enough, change.to_numpy() / scale, np.nan)
+
+    def strongest(z):
+        # Signed z of the plan with the larger |z| (NaN when neither plan has one)
+        magnitude = np.where(np.isnan(z), -1.0, np.abs(z))
+        picked = z[np.argmax(magnitude, axis=0), np.arange(z.shape[1])]
+        return np.round(picked, 2)
+
+    frame['AMC Z'] = strongest(amc_z)
+    frame['Category Z'] = strongest(category_z)
+    frame['History Z'] = strongest(history_z)
+
+    cap = frame['Fund_Category'].map(caps).fillna(max(caps.values())).to_numpy(dtype=float)
+    regular_new, direct_new = frame['Regular New'].to_numpy(), frame['Direct New'].to_numpy()
+    frame['Cap Breach'] = (regular_new > cap) | (direct_new > cap)
+    frame['Spread Inversion'] = direct_new > regular_new
+
+    z = np.abs(np.vstack([amc_z, category_z, history_z]))
+    largest = np.nan_to_num(z).max(axis=0, initial=0.0)
+    rules = frame['Cap Breach'].astype(int) + frame['Spread Inversion'].astype(int)
+    frame['Score'] = np.round(largest + RULE_SCORE * rules.to_numpy(), 2)
+    frame['Reasons'] = _reasons(frame, cap, threshold)
+    return frame[ANOMALY_COLUMNS]
+
+
+def _reasons(frame, cap, threshold):
+    """Short explanation of why each row scored, e.g. '+45.3σ vs AMC; above 1.00% cap'"""
+    reasons = [[] for _ in range(len(frame))]
+    labels = (('AMC Z', 'AMC'), ('Category Z', 'category'), ('History Z', 'own history'))
+    for column, label in labels:
+        z = frame[column].to_numpy()
+        for i in np.flatnonzero(np.abs(np.nan_to_num(z)) >= threshold):
+            reasons[i].append(f"{z[i]:+.1f}σ vs {label}")
+    for i in np.flatnonzero(frame['Cap Breach'].to_numpy()):
+        reasons[i].append(f"above {cap[i]:.2f}% cap")
+    for i in np.flatnonzero(frame['Spread Inversion'].to_numpy()):
+        reasons[i].append("Direct above Regular")
+    return ['; '.join(parts) for parts in reasons]
+
+
+def detect_anomalies(comparison, history=None, top=TOP_ANOMALIES, threshold=Z_THRESHOLD,
+                     caps=TER_CAPS):
+    """Top anomalies of a day's comparison rows, highest score first
+
+    A row qualifies when any |z| reaches threshold or it breaks a rule.
+    """
+    if comparison is None or len(comparison) == 0:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    scored = score_anomalies(comparison, history, caps, threshold=threshold)
+    flagged = scored[scored['Reasons'] != '']
+    flagged = flagged.sort_values(['Score', 'NSDL Scheme Code'], ascending=[False, True],
+                                  kind='mergesort')
+    if top is not None:
+        flagged = flagged.head(top)
+    logger.info(f"Anomalies: {len(flagged)} flagged of {len(scored)} changed schemes")
+    return flagged.reset_index(drop=True)
+
+
+def format_anomaly_line(row):
+    """One anomaly as a compact line for text reports"""
+    changes = ' | '.join(f"{plan[:3]} {row[f'{plan} Change']:+.2f}" for plan in PLANS
+                         if not pd.isna(row[f'{plan} Change']))
+    return f"{row['Scheme Name']} | {changes} | {row['Reasons']}"
@@ -0,0 +1,48 @@
+"""
+Report-date batches of incrementally maintained aggregates
+The cube and the spread table fold in one batch of changes per report date. The
+daemon re-runs a report date whenever AMFI revises the day's workbook, so each
+batch is stored with a digest of its rows: a re-run with the same rows is skipped
+and one with different rows replaces the day's earlier contribution.
+"""
+
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+APPLY, REPLACE, SKIP = 'apply', 'replace', 'skip'
+
+
+def frame_digest(*frames):
+    """Content hash of frames (None for an absent one), independent of their row order"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        if frame is not None and len(frame):
+            hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+            digest.update(np.sort(hashes).tobytes())
+        digest.update(b'|')
+    return digest.hexdigest()[:16]
+
+
+def claim_batch(batches, batch, digest, replaceable, label):
+    """APPLY a new batch, REPLACE a revised one or SKIP it; records its digest in batches
+
+    batches maps batch id -> digest. A batch already applied with the same digest
+    is skipped; one with another digest is replaced when replaceable, else skipped.
+    """
+    if batch in batches:
+        if batches[batch] == digest:
+            logger.info(f"{label} already includes batch {batch}, skipping")
+            return SKIP
+        if not replaceable:
+            logger.warning(f"{label} batch {batch} was revised but cannot be replaced, skipping")
+            return SKIP
+        logger.info(f"Replacing {label} batch {batch} with its revised rows")
+        batches[batch] = digest
+        return REPLACE
+    batches[batch] = digest
+    return APPLY
@@ -0,0 +1,561 @@
+"""
+Command line entry point for AMFI TER Analysis
+Only argparse is imported up front; analysis modules load when a command runs
+
+    amfi-ter-analysis fetch | backfill | diff | history | trends | spreads | search
+                      compare | report | replay | notify | daemon | serve
+"""
+
+import os
+import sys
+import argparse
+import logging
+from datetime import datetime
+
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def _month(value):
+    """Parse MM-YYYY into (month, year)"""
+    try:
+        month, year = value.split('-')
+        return int(month), int(year)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MM-YYYY, got {value!r}")
+
+
+def _month_range(start, end):
+    """Inclusive list of (month, year) from start to end"""
+    month, year = start
+    months = []
+    while (year, month) <= (end[1], end[0]):
+        months.append((month, year))
+        month, year = (1, year + 1) if month == 12 else (month + 1, year)
+    return months
+
+
+def _save_workbook(content, download_dir, month, year):
+    """Keep a copy of a fetched workbook under the download directory"""
+    os.makedirs(download_dir, exist_ok=True)
+    path = os.path.join(download_dir, f"TER_{month:02d}-{year}.xlsx")
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def _fetch_snapshot(args, month, year, day=None):
+    """Download, parse and store one month's workbook as a history snapshot"""
+    from . import ter_metrics
+    from .ter_pipeline import fetch_stage, parse_stage, save_snapshot
+    from .ter_analysis import normalize_ter_frame
+
+    with ter_metrics.stage('fetch'):
+        content = fetch_stage(month, year)
+        workbook_path = _save_workbook(content, args.download_dir, month, year)
+    with ter_metrics.stage('parse'):
+        raw = parse_stage(content)
+    with ter_metrics.stage('normalize'):
+        snapshot = normalize_ter_frame(raw)
+    if day is None:
+        latest = snapshot['TER Date'].max()
+        day = latest.strftime('%Y-%m-%d') if latest == latest else f"{year}-{month:02d}-01"
+    path = save_snapshot(snapshot, args.history_dir, day)
+
+    from .ter_state_store import open_state_store
+
+    # Shared with the daily run; update() keeps concurrent writers from losing entries
+    with open_state_store().update() as state:
+        state['file_history'][f"{year}-{month:02d}"] = {
+            'filepath': workbook_path,
+            'date': day,
+            'snapshot': str(path),
+        }
+    print(f"{month:02d}-{year}: {len(snapshot)} schemes -> {workbook_path}, {path}")
+    return path
+
+
+def cmd_fetch(args):
+    """Fetch the current (or given) month and store today's snapshot"""
+    today = datetime.now()
+    month, year = args.month or (today.month, today.year)
+    _fetch_snapshot(args, month, year, day=today.strftime('%Y-%m-%d'))
+    return 0
+
+
+def cmd_backfill(args):
+    """Fetch a range of months into the history store"""
+    today = datetime.now()
+    end = args.end or (today.month, today.year)
+    failures = 0
+    for month, year in _month_range(args.start, end):
+        try:
+            _fetch_snapshot(args, month, year)
+        except Exception as e:
+            failures += 1
+            logger.error(f"{month:02d}-{year}: {e}")
+    return 1 if failures else 0
+
+
+def _resolve_snapshot(ref, history_dir):
+    """Load a snapshot given a file path or a date looked up in the history store"""
+    from .ter_pipeline import load_snapshot_file, find_snapshot
+
+    if os.path.exists(ref):
+        return load_snapshot_file(ref), os.path.basename(ref)
+    path = find_snapshot(history_dir, ref)
+    if path is None:
+        raise SystemExit(f"No snapshot found for {ref!r} in {history_dir}")
+    return load_snapshot_file(path), str(path)
+
+
+def cmd_diff(args):
+    """Diff two snapshots given as files or dates"""
+    from . import ter_metrics
+    from .ter_pipeline import diff_stage
+    from .ter_sinks import write_artifacts
+
+    with ter_metrics.stage('load'):
+        old, old_name = _resolve_snapshot(args.old, args.history_dir)
+        new, new_name = _resolve_snapshot(args.new, args.history_dir)
+    with ter_metrics.stage('diff'):
+        regular, direct = diff_stage(old, new, args.change_date, args.shards, args.shard_by)
+
+    print(f"{old_name} -> {new_name}")
+    print(f"Regular Plan: {len(regular)} changes")
+    print(f"Direct Plan: {len(direct)} changes")
+
+    if not args.no_write:
+        label = args.label or datetime.now().strftime('%Y-%m-%d')
+        artifacts = {
+            f'{plan.lower()}_changes': (
+                'changes', changes,
+                os.path.join(args.output_dir, f"{plan}_Plan_TER_Changes_{label}"))
+            for plan, changes in (('Regular', regular), ('Direct', direct)) if len(changes) > 0
+        }
+        with ter_metrics.stage('sink'):
+            write_artifacts(artifacts, args.formats)
+    return 0
+
+
+def cmd_history(args):
+    """Changes, trends and category aggregates over the whole history store"""
+    from . import ter_metrics
+    from .ter_streaming import stream_history, load_history, cleanup_spill
+
+    with ter_metrics.stage('history'):
+        if args.in_memory:
+            results = load_history(args.history_dir, args.start, args.end)
+        else:
+            results = stream_history(args.history_dir, args.start, args.end,
+                                     memory_limit=args.memory_limit, spill_dir=args.spill_dir)
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+        with ter_metrics.stage('sink'):
+            for plan, changes in results.changes.items():
+                path = os.path.join(args.output_dir, f"TER_History_{plan}_Changes.csv")
+                # DataFrame (in memory) or SpillBuffer (streamed), written the same way
+                changes.to_csv(path, index=False)
+                print(f"{plan} Plan: {len(changes)} changes -> {path}")
+            for name, frame in (('Trends', results.trends), ('Categories', results.categories)):
+                path = os.path.join(args.output_dir, f"TER_History_{name}.csv")
+                frame.to_csv(path, index=False)
+                print(f"{name}: {len(frame)} rows -> {path}")
+    finally:
+        cleanup_spill(results)
+    return 0
+
+
+def cmd_trends(args):
+    """Per-scheme trend and volatility statistics over the history store"""
+    from . import ter_metrics
+    from .ter_trends import TrendPanel
+
+    with ter_metrics.stage('trends'):
+        panel = TrendPanel.from_history(args.history_dir)
+        plans = args.plan or ['Regular', 'Direct']
+        summaries = {plan: panel.summary(plan, args.start, args.end, args.window) for plan in plans}
+    os.makedirs(args.output_dir, exist_ok=True)
+    for plan, summary in summaries.items():
+        path = os.path.join(args.output_dir, f"TER_Trends_{plan}.csv")
+        summary.to_csv(path, index=False)
+        revised = int((summary['Revisions'] > 0).sum())
+        print(f"{plan} Plan: {len(summary)} schemes, {revised} revised -> {path}")
+    return 0
+
+
+def cmd_spreads(args):
+    """Largest Regular - Direct spread widening (or narrowing) over a window"""
+    from .ter_spread import spread_table
+
+    table = spread_table(args.output_dir, args.history_dir)
+    if not len(table):
+        print("No spread data (run the daily report or fetch some snapshots first)")
+        return 1
+    moves = table.moves(args.days, as_of=args.as_of, limit=args.limit, narrowing=args.narrowing)
+    direction = 'narrowing' if args.narrowing else 'widening'
+    if moves.empty:
+        print(f"No spread {direction} in the last {args.days} days")
+        return 0
+    print(f"Largest spread {direction} over {args.days} days ({len(table)} schemes)")
+    for row in moves.to_dict('records'):
+        print(f"{row['Spread Change']:+.2f}  "
+              f"{row['Spread Before']:.2f} -> {row['Spread After']:.2f}  "
+              f"{row['NSDL Scheme Code']}  {row['Scheme Name']}")
+    return 0
+
+
+def cmd_search(args):
+    """Look up schemes by partial or misspelled name"""
+    from .ter_search import search_schemes
+
+    matches = search_schemes(' '.join(args.query), args.limit, args.history_dir)
+    if not matches:
+        print("No matching schemes")
+        return 1
+    for code, name, score in matches:
+        print(f"{score:.3f}  {code}  {name}")
+    return 0
+
+
+def cmd_compare(args):
+    """Build the Regular vs Direct comparison from the latest change files"""
+    from . import ter_metrics
+    from .ter_analysis import compare_plan_changes, classify_changes
+    from .ter_anomalies import detect_anomalies, format_anomaly_line
+    from .ter_notifier import latest_change_file
+    from .ter_sinks import read_artifact, write_artifacts
+
+    with ter_metrics.stage('load'):
+        frames = {}
+        for plan in ('Regular', 'Direct'):
+            path = latest_change_file(args.output_dir, plan)
+            if path is None:
+                raise SystemExit(f"No {plan} Plan change file in {args.output_dir}")
+            frames[plan] = read_artifact(path)
+            print(f"{plan} Plan: {path}")
+    with ter_metrics.stage('compare'):
+        comparison = compare_plan_changes(frames['Regular'], frames['Direct'])
+    with ter_metrics.stage('classify'):
+        comprehensive, significant = classify_changes(comparison, args.threshold)
+    with ter_metrics.stage('anomalies'):
+        anomalies = detect_anomalies(comprehensive)
+
+    print(f"Schemes with changes: {len(comprehensive)}")
+    print(f"Schemes above threshold ({args.threshold}): {len(significant)}")
+    for category, count in significant['Fund_Category'].value_counts().sort_index().items():
+        print(f"  {category}: {count} schemes")
+    print(f"Anomalies: {len(anomalies)}")
+    for _, row in anomalies.head(10).iterrows():
+        print(f"  {format_anomaly_line(row)}")
+
+    with ter_metrics.stage('sink'):
+        write_artifacts({
+            'comprehensive': ('comparison', comprehensive,
+                              os.path.join(args.output_dir, 'TER_Comparison_Comprehensive')),
+            'significant': ('comparison', significant.drop(columns=['Fund_Category']),
+                            os.path.join(args.output_dir, 'TER_Comparison_Significant')),
+            'anomalies': ('comparison', anomalies, os.path.join(args.output_dir, 'TER_Anomalies')),
+        }, args.formats)
+    return 0
+
+
+def cmd_report(args):
+    """Run the full daily pipeline"""
+    from .ter_pipeline import run_daily_pipeline, CACHE_DIR
+
+    webhooks = [url.strip() for url in os.environ.get('GOOGLE_CHAT_WEBHOOK_URL', '').split(',')
+                if url.strip()] if args.notify else []
+    context = run_daily_pipeline(write=not args.no_write, webhooks=webhooks, force=args.force,
+                                 formats=args.formats, output_dir=args.output_dir,
+                                 history_dir=args.history_dir, threshold=args.threshold,
+                                 cache_dir=None if args.no_cache else CACHE_DIR,
+                                 metrics_dir=args.metrics_dir, resend=args.resend)
+    for name, outcome in context['stage_status'].items():
+        print(f"{name:10s} {outcome}")
+    return 0
+
+
+def cmd_replay(args):
+    """Re-run the daily pipeline over stored snapshots with a simulated clock"""
+    from .ter_replay import replay_history
+
+    result = replay_history(args.history_dir, args.root, start=args.start, end=args.end,
+                            write=not args.no_write, threshold=args.threshold, formats=args.formats)
+    for summary in result.summaries:
+        print(f"{summary['date']}  Regular {summary['regular_count']:5d}  "
+              f"Direct {summary['direct_count']:5d}  Anomalies {summary['anomaly_count']:4d}")
+    rate = result.days / result.seconds if result.seconds else 0.0
+    print(f"Replayed {result.days} day(s), {result.schemes} scheme rows, {result.changes} changes "
+          f"in {result.seconds:.2f}s ({rate:.1f} days/s)")
+    return 0
+
+
+def cmd_notify(args):
+    """Send the latest change files to Google Chat"""
+    from .ter_notifier import main as notifier_main
+
+    argv = ['--output-dir', args.output_dir, '--format', args.format]
+    for url in args.webhook:
+        argv += ['--webhook', url]
+    if args.subscriptions:
+        argv += ['--subscriptions', args.subscriptions]
+    if args.dry_run:
+        argv.append('--dry-run')
+    return notifier_main(argv)
+
+
+def cmd_daemon(args):
+    """Poll AMFI continuously against a warm in-memory baseline"""
+    import signal
+    import threading
+    from .ter_daemon import TerDaemon, FixedSchedule
+    from .ter_scheduler import AdaptiveSchedule
+
+    webhooks = [url.strip() for url in os.environ.get('GOOGLE_CHAT_WEBHOOK_URL', '').split(',')
+                if url.strip()] if args.notify else []
+    if args.adaptive:
+        schedule = AdaptiveSchedule(budget=args.budget, min_interval=args.min_interval,
+                                    base_interval=args.interval)
+    else:
+        schedule = FixedSchedule(args.interval)
+    daemon = TerDaemon(checkpoint=args.checkpoint, history_dir=args.history_dir,
+                       output_dir=args.output_dir, webhooks=webhooks, formats=args.formats,
+                       write=not args.no_write, metrics_dir=args.metrics_dir,
+                       schedule=schedule)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    daemon.run(stop, max_checks=1 if args.once else None)
+    return 0
+
+
+def cmd_serve(args):
+    """Serve JSON queries over the history store (and output/ files) read-only over HTTP"""
+    from .ter_server import serve
+
+    print(f"Serving {args.history_dir} queries and {args.output_dir} files "
+          f"on http://{args.host}:{args.port}/")
+    serve(args.history_dir, args.output_dir, args.host, args.port, args.cache_size)
+    return 0
+
+
+SHARED_DEFAULTS = {
+    'download_dir': 'downloads',
+    'output_dir': 'output',
+    'history_dir': 'history',
+    'formats': None,
+    'metrics_dir': 'metrics',
+    'profile': False,
+    'log_level': None,
+    'log_format': 'text',
+}
+
+
+def build_parser():
+    """Build the argument parser"""
+    # Shared options are accepted before or after the command. They default to
+    # SUPPRESS so a subcommand does not reset an option given before it; real
+    # defaults are filled in by parse_args (SHARED_DEFAULTS)
+    shared = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    shared.add_argument('--download-dir',
+                        help='Workbook download directory (default: downloads)')
+    shared.add_argument('--output-dir',
+                        help='Change and comparison file directory (default: output)')
+    shared.add_argument('--history-dir', help='Daily snapshot directory (default: history)')
+    shared.add_argument('--formats',
+                        help="Output formats, e.g. 'csv,parquet' or "
+                             "'comparison=parquet;baseline=csv.zst'")
+    shared.add_argument('--metrics-dir',
+                        help='Prometheus / OpenMetrics file directory for report runs '
+                             '(default: metrics)')
+    shared.add_argument('--profile', action='store_true', default=argparse.SUPPRESS,
+                        help='Print wall time, CPU time and peak memory per stage')
+    shared.add_argument('--log-level',
+                        help='DEBUG, INFO, WARNING or ERROR (default: TER_LOG_LEVEL or INFO)')
+    shared.add_argument('--log-format', choices=('text', 'json'),
+                        help='Console log format; the log file is always JSON lines '
+                             '(default: text)')
+
+    parser = argparse.ArgumentParser(
+        prog='amfi-ter-analysis',
+        description='Download AMFI TER data, compare it with the previous snapshot '
+                    'and report changes',
+        parents=[shared]
+    )
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    fetch = commands.add_parser('fetch', parents=[shared],
+                                help='Download a month and store a snapshot')
+    fetch.add_argument('--month', type=_month, metavar='MM-YYYY',
+                       help='Defaults to the current month')
+    fetch.set_defaults(func=cmd_fetch)
+
+    backfill = commands.add_parser('backfill', parents=[shared], help='Download a range of months')
+    backfill.add_argument('--start', type=_month, metavar='MM-YYYY', required=True)
+    backfill.add_argument('--end', type=_month, metavar='MM-YYYY',
+                          help='Defaults to the current month')
+    backfill.set_defaults(func=cmd_backfill)
+
+    diff = commands.add_parser('diff', parents=[shared],
+                               help='Diff two snapshots (files or dates)')
+    diff.add_argument('old', help='Snapshot file or date (YYYY-MM-DD) in the history store')
+    diff.add_argument('new', help='Snapshot file or date (YYYY-MM-DD) in the history store')
+    diff.add_argument('--change-date',
+                      help="Value for 'TER Date (Change)' (defaults to each scheme's TER Date)")
+    diff.add_argument('--label', help='Suffix for the change file names (defaults to today)')
+    diff.add_argument('--no-write', action='store_true', help='Only print the change counts')
+    diff.add_argument('--shards', type=int,
+                      help='Diff in this many shards in a process pool')
+    diff.add_argument('--shard-by', choices=('amc', 'range'), default='amc',
+                      help='Split the code range at AMC boundaries or into equal ranges '
+                           '(default: amc)')
+    diff.set_defaults(func=cmd_diff)
+
+    history = commands.add_parser('history', parents=[shared],
+                                  help='Changes, trends and category aggregates '
+                                       'over the history store')
+    history.add_argument('--start', help='First snapshot date (YYYY-MM-DD)')
+    history.add_argument('--end', help='Last snapshot date (YYYY-MM-DD)')
+    history.add_argument('--memory-limit', default='256MB',
+                         help='Spill buffered results to disk above this size (default: 256MB)')
+    history.add_argument('--spill-dir', help='Directory for spilled parts (default: system temp)')
+    history.add_argument('--in-memory', action='store_true',
+                         help='Load the whole history at once instead')
+    history.set_defaults(func=cmd_history)
+
+    trends = commands.add_parser('trends', parents=[shared],
+                                 help='Cumulative change, revisions, mean and volatility '
+                                      'per scheme')
+    trends.add_argument('--start', help='First snapshot date (YYYY-MM-DD)')
+    trends.add_argument('--end', help='Last snapshot date (YYYY-MM-DD)')
+    trends.add_argument('--window', type=int, help='Only the last N snapshots up to --end')
+    trends.add_argument('--plan', action='append', choices=('Regular', 'Direct'),
+                        help='Plan to report (repeatable; default: both)')
+    trends.set_defaults(func=cmd_trends)
+
+    spreads = commands.add_parser('spreads', parents=[shared],
+                                  help='Largest Regular - Direct spread moves over a window')
+    spreads.add_argument('--days', type=int, default=30,
+                         help='Window length in days (default: 30)')
+    spreads.add_argument('--as-of', help='Window end (YYYY-MM-DD; default: the latest move)')
+    spreads.add_argument('--limit', type=int, default=20,
+                         help='Number of schemes (default: 20)')
+    spreads.add_argument('--narrowing', action='store_true',
+                         help='Largest narrowing instead of widening')
+    spreads.set_defaults(func=cmd_spreads)
+
+    search = commands.add_parser('search', parents=[shared],
+                                 help='Find scheme codes by (partial) name')
+    search.add_argument('query', nargs='+', help='Scheme name or part of it, e.g. "lic flexi"')
+    search.add_argument('--limit', type=int, default=10,
+                        help='Number of matches (default: 10)')
+    search.set_defaults(func=cmd_search)
+
+    compare = commands.add_parser('compare', parents=[shared], help='Regular vs Direct comparison')
+    compare.add_argument('--threshold', type=float, default=0.02)
+    compare.set_defaults(func=cmd_compare)
+
+    report = commands.add_parser('report', parents=[shared], help='Run the full daily pipeline')
+    report.add_argument('--threshold', type=float, default=0.02)
+    report.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help='Rerun this stage and everything downstream of it (repeatable)')
+    report.add_argument('--no-cache', action='store_true', help='Disable the stage cache')
+    report.add_argument('--no-write', action='store_true', help='Skip writing artifacts')
+    report.add_argument('--notify', action='store_true', help='Send to GOOGLE_CHAT_WEBHOOK_URL')
+    report.add_argument('--resend', action='store_true',
+                        help='With --notify, send even if the same messages were already '
+                             'sent today')
+    report.set_defaults(func=cmd_report)
+
+    replay = commands.add_parser('replay', parents=[shared],
+                                 help='Re-run the daily pipeline over stored snapshots, offline')
+    replay.add_argument('--start',
+                        help='First day to replay (YYYY-MM-DD; default: second snapshot)')
+    replay.add_argument('--end', help='Last day to replay (YYYY-MM-DD)')
+    replay.add_argument('--root', default='replay',
+                        help='Output and baseline root (default: replay)')
+    replay.add_argument('--threshold', type=float, default=0.02)
+    replay.add_argument('--no-write', action='store_true', help='Only print the daily counts')
+    replay.set_defaults(func=cmd_replay)
+
+    notify = commands.add_parser('notify', parents=[shared],
+                                 help='Send the latest changes to Google Chat')
+    notify.add_argument('--webhook', action='append', default=[])
+    notify.add_argument('--format', choices=['text', 'card'], default='text')
+    notify.add_argument('--subscriptions')
+    notify.add_argument('--dry-run', action='store_true')
+    notify.set_defaults(func=cmd_notify)
+
+    daemon = commands.add_parser('daemon', parents=[shared],
+                                 help='Keep the baseline in memory and poll AMFI on a schedule')
+    daemon.add_argument('--interval', type=float, default=900,
+                        help='Seconds between polls (default: 900)')
+    daemon.add_argument('--adaptive', action='store_true',
+                        help='Learn publication windows from past polls and poll around them')
+    daemon.add_argument('--budget', type=int, default=96,
+                        help='Adaptive: max polls per day (default: 96)')
+    daemon.add_argument('--min-interval', type=float, default=300,
+                        help='Adaptive: seconds between polls in a likely window (default: 300)')
+    daemon.add_argument('--checkpoint', default='.ter_daemon/state.pkl',
+                        help='Warm state checkpoint file')
+    daemon.add_argument('--notify', action='store_true',
+                        help='Send changes to GOOGLE_CHAT_WEBHOOK_URL')
+    daemon.add_argument('--no-write', action='store_true', help='Skip writing artifacts')
+    daemon.add_argument('--once', action='store_true', help='Poll once and exit')
+    daemon.set_defaults(func=cmd_daemon)
+
+    serve = commands.add_parser('serve', parents=[shared],
+                                help='Query service over HTTP (JSON API + output files)')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--cache-size', type=int, default=256,
+                       help='Cached responses (default: 256)')
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def parse_args(argv=None):
+    """Parse the command line, filling in shared option defaults"""
+    args = build_parser().parse_args(argv)
+    defaults = dict(SHARED_DEFAULTS, formats=os.environ.get('TER_OUTPUT_FORMATS'))
+    for name, value in defaults.items():
+        if not hasattr(args, name):
+            setattr(args, name, value)
+    return args
+
+
+def main(argv=None):
+    """Parse arguments and run the requested command (the daily analysis by default)"""
+    args = parse_args(argv)
+
+    from .ter_runtime import ensure_directories, setup_logging
+    from . import ter_metrics
+
+    from .ter_sinks import parse_formats
+
+    args.formats = parse_formats(args.formats)
+    if args.profile:
+        ter_metrics.enable_memory_tracing()
+
+    try:
+        setup_logging(args.log_level, console_format=args.log_format)
+        if not hasattr(args, 'func'):
+            from .ter_github_actions import analyze_and_report
+
+            analyze_and_report()
+            return 0
+
+        ensure_directories(args.output_dir, args.history_dir, 'logs')
+        return args.func(args)
+    finally:
+        if args.profile:
+            print(ter_metrics.format_profile(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,287 @@
+"""
+Pandas-free TER diff core for minimal runtimes
+Reads normalized TER snapshots (the baseline CSV written by the daily run, plain,
+gzip or zstd compressed) into lists and array('d') columns, and diffs two of them
+into the change records of compare_ter_daily using only the standard library;
+NumPy, when installed, can compare the aligned columns. Importing this module
+does not import pandas, so an edge job can diff a full universe in milliseconds:
+
+    python -m amfi_ter_analysis.ter_core previous.csv current.csv --output-dir output
+"""
+
+import io
+import os
+import csv
+import sys
+import gzip
+import argparse
+from array import array
+from datetime import datetime
+
+PLANS = ('Regular', 'Direct')
+CODE_COLUMN = 'NSDL Scheme Code'
+NAME_COLUMN = 'Scheme Name'
+DATE_COLUMN = 'TER Date'
+NAN = float('nan')
+# Raw workbook date layouts accepted besides ISO (YYYY-MM-DD[ HH:MM:SS])
+DATE_FORMATS = ('%d-%b-%Y', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y')
+# Below this many schemes the stdlib loop beats NumPy's conversion overhead
+NUMPY_MIN_ROWS = 20000
+
+
+def record_columns(plan):
+    """Field order of compare_ter_daily change records for one plan"""
+    return [CODE_COLUMN, NAME_COLUMN, f'Previous {plan} Plan - Base TER (%)',
+            f'Current {plan} Plan - Base TER (%)', 'TER Date (Change)', 'TER Reduction (%)']
+
+
+def _float(text):
+    """Float of a CSV field, NaN for blanks and non-numbers (like to_numeric(errors='coerce'))"""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _date(text):
+    """ISO date (YYYY-MM-DD) of a CSV field, '' when it is blank or unreadable"""
+    text = (text or '').strip()
+    if len(text) >= 10 and text[4] == '-' and text[7] == '-':
+        return text[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return ''
+
+
+def find_columns(header):
+    """Positions of the code, name, date, Regular and Direct Base TER columns in a header
+
+    Canonical names win; otherwise columns are matched the way find_ter_columns
+    matches workbook headers.
+    """
+    lowered = [str(col).lower() for col in header]
+    found = {}
+    for key, exact, words in (
+            ('code', CODE_COLUMN, ('nsdl', 'code')),
+            ('name', NAME_COLUMN, ('scheme name',)),
+            ('date', DATE_COLUMN, ('ter date',)),
+            ('Regular', 'Regular Plan - Base TER (%)', ('regular', 'base', 'ter')),
+            ('Direct', 'Direct Plan - Base TER (%)', ('direct', 'base', 'ter'))):
+        if exact in header:
+            found[key] = header.index(exact)
+            continue
+        matches = [i for i, col in enumerate(lowered) if all(word in col for word in words)]
+        found[key] = matches[-1] if matches else None
+    if found['code'] is None:
+        raise ValueError("No NSDL scheme code column found")
+    return found
+
+
+class Snapshot:
+    """One row per scheme: codes, names and ISO TER dates as lists, Base TER as array('d')"""
+
+    __slots__ = ('codes', 'names', 'dates', 'regular', 'direct', '_index')
+
+    def __init__(self, codes, names, dates, regular, direct):
+        self.codes = codes
+        self.names = names
+        self.dates = dates
+        self.regular = regular
+        self.direct = direct
+        self._index = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def index(self):
+        """Scheme code -> row"""
+        if self._index is None:
+            self._index = {code: row for row, code in enumerate(self.codes)}
+        return self._index
+
+    def values(self, plan):
+        return self.regular if plan == 'Regular' else self.direct
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Snapshot of (code, name, date, regular, direct) rows, keeping each scheme's latest
+
+        As in normalize_ter_frame: codes are stripped, blank codes dropped, and the
+        row with the latest TER Date (undated rows last, then file order) is kept.
+        """
+        latest = {}
+        for code, name, date, regular, direct in rows:
+            code = str(code).strip()
+            if code in ('', 'nan', 'None'):
+                continue
+            kept = latest.get(code)
+            if kept is None or (date or '9999') >= (kept[1] or '9999'):
+                latest[code] = (name, date, regular, direct)
+        codes = sorted(latest)
+        snapshot = cls(codes, [], [], array('d'), array('d'))
+        for code in codes:
+            name, date, regular, direct = latest[code]
+            snapshot.names.append(name)
+            snapshot.dates.append(date)
+            snapshot.regular.append(regular)
+            snapshot.direct.append(direct)
+        return snapshot
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Snapshot of a normalized DataFrame (the pandas adapter's entry point)"""
+        # tolist() converts whole columns at once; iterating Arrow-backed strings is slow
+        dates = frame[DATE_COLUMN] if DATE_COLUMN in frame else None
+        if dates is not None and hasattr(dates, 'dt'):
+            dates = dates.dt.strftime('%Y-%m-%d')
+        if dates is None:
+            dates = [''] * len(frame)
+        else:
+            dates = [date if isinstance(date, str) else '' for date in dates.tolist()]
+        return cls(
+            frame[CODE_COLUMN].astype(str).tolist(),
+            frame[NAME_COLUMN].tolist() if NAME_COLUMN in frame else [None] * len(frame),
+            dates,
+            array('d', frame['Regular Plan - Base TER (%)'].astype(float)),
+            array('d', frame['Direct Plan - Base TER (%)'].astype(float)),
+        )
+
+
+def _open_text(path):
+    """Text handle for a .csv, .csv.gz or .csv.zst file"""
+    path = str(path)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard is required to read .zst snapshots; "
+                              "install with: pip install amfi-ter-analysis[zstd]")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_snapshot(path):
+    """Load a snapshot CSV (normalized baseline or workbook export) without pandas"""
+    with _open_text(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return Snapshot([], [], [], array('d'), array('d'))
+        cols = find_columns(header)
+        code, name, date, regular, direct = (
+            cols[key] for key in ('code', 'name', 'date', 'Regular', 'Direct'))
+
+        def rows():
+            for row in reader:
+                if len(row) <= code:
+                    continue
+                yield (row[code],
+                       row[name] if name is not None else None,
+                       _date(row[date]) if date is not None else '',
+                       _float(row[regular]) if regular is not None else NAN,
+                       _float(row[direct]) if direct is not None else NAN)
+
+        return Snapshot.from_rows(rows())
+
+
+def _changed_rows(old, new, positions, use_numpy):
+    """Rows of `new` whose aligned `old` value differs (both present)"""
+    if use_numpy:
+        import numpy as np
+
+        positions = np.asarray(positions, dtype=np.int64)
+        known = np.flatnonzero(positions >= 0)
+        before = np.frombuffer(old, dtype=np.float64)[positions[known]]
+        after = np.frombuffer(new, dtype=np.float64)[known]
+        return known[(before != after) & ~np.isnan(before) & ~np.isnan(after)].tolist()
+    return [row for row, pos in enumerate(positions)
+            if pos >= 0 and old[pos] == old[pos] and new[row] == new[row] and old[pos] != new[row]]
+
+
+def _numpy_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def diff_snapshots(previous, current, plan, change_date=None, use_numpy=None):
+    """Change records of one plan, sorted by scheme code (compare_ter_daily layout)
+
+    'TER Date (Change)' is change_date when given, else each scheme's TER Date.
+    use_numpy=None uses NumPy for large universes when it is installed.
+    """
+    if use_numpy is None:
+        use_numpy = len(current) >= NUMPY_MIN_ROWS and _numpy_available()
+    get = previous.index.get
+    positions = [get(code, -1) for code in current.codes]
+    old, new = previous.values(plan), current.values(plan)
+    columns = record_columns(plan)
+    records = []
+    for row in _changed_rows(old, new, positions, use_numpy):
+        before, after = old[positions[row]], new[row]
+        records.append(dict(zip(columns, (
+            current.codes[row],
+            current.names[row],
+            round(before, 4),
+            round(after, 4),
+            change_date if change_date is not None else current.dates[row],
+            round(before - after, 4),
+        ))))
+    records.sort(key=lambda record: record[CODE_COLUMN])
+    return records
+
+
+def compare_snapshots(previous, current, change_date=None, use_numpy=None):
+    """(regular_changes, direct_changes) record lists, as returned by compare_ter_daily"""
+    return tuple(diff_snapshots(previous, current, plan, change_date, use_numpy) for plan in PLANS)
+
+
+def write_records(records, plan, path):
+    """Write change records as CSV in the compare_ter_daily field order"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=record_columns(plan))
+        writer.writeheader()
+        writer.writerows(records)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv=None):
+    """Diff two snapshot CSVs and write the daily change files"""
+    parser = argparse.ArgumentParser(
+        prog='python -m amfi_ter_analysis.ter_core',
+        description='Diff two normalized TER snapshots without pandas')
+    parser.add_argument('previous', help='Previous snapshot (.csv, .csv.gz or .csv.zst)')
+    parser.add_argument('current', help='Current snapshot (.csv, .csv.gz or .csv.zst)')
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--change-date',
+                        help="Value for 'TER Date (Change)' (defaults to each scheme's TER Date)")
+    parser.add_argument('--label', help='Date in the change file names (defaults to today)')
+    parser.add_argument('--no-write', action='store_true', help='Only print the change counts')
+    args = parser.parse_args(argv)
+
+    changes = compare_snapshots(read_snapshot(args.previous), read_snapshot(args.current),
+                                args.change_date)
+    label = args.label or datetime.now().strftime('%Y-%m-%d')
+    for plan, records in zip(PLANS, changes):
+        print(f"{plan} Plan: {len(records)} changes")
+        if records and not args.no_write:
+            os.makedirs(args.output_dir, exist_ok=True)
+            path = os.path.join(args.output_dir, f'Daily_{plan}_Plan_Changes_{label}.csv')
+            write_records(records, plan, path)
+            print(f"  Saved {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
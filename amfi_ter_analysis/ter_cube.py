@@ -0,0 +1,234 @@
+"""
+AMC x fund category x month aggregate cube of TER changes
+Maintains count, sum, min and max of Regular changes, Direct changes and their
+difference for every (AMC, category, month) cell and every roll-up of those keys,
+updated from each day's comparison rows. Any cell or roll-up is answered with one
+dict lookup, so dashboards and notifications never re-aggregate raw rows.
+"""
+
+import os
+import json
+import logging
+from itertools import product
+
+import pandas as pd
+
+from .ter_analysis import categorize_fund
+from .ter_batches import REPLACE, SKIP, claim_batch, frame_digest
+
+logger = logging.getLogger(__name__)
+
+CUBE_FILE = 'TER_Cube.json'
+CUBE_VERSION = 1
+ALL = '*'
+DIMENSIONS = ('amc', 'category', 'period')
+MEASURES = ('regular', 'direct', 'difference')
+STATS = ('count', 'sum', 'min', 'max')
+# Leaf cells of rows folded in without a batch id
+UNTRACKED = '*'
+
+
+def _cell_stats(cell):
+    """Readable stats (with mean) from a cell's flat value list"""
+    result = {}
+    for i, measure in enumerate(MEASURES):
+        count, total, low, high = cell[4 * i:4 * i + 4]
+        result[measure] = {
+            'count': int(count),
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else None,
+            'min': round(low, 6) if count else None,
+            'max': round(high, 6) if count else None,
+        }
+    return result
+
+
+def _leaf_rows(rows):
+    """[amc, category, period, *cell values] per (AMC, category, period) of prepared rows"""
+    leaves = {}
+    for amc, category, period, *values in rows.itertuples(index=False, name=None):
+        cell = leaves.get((amc, category, period))
+        if cell is None:
+            cell = leaves[(amc, category, period)] = [amc, category, period]
+            cell += [0.0] * (4 * len(MEASURES))
+        for m, value in enumerate(values):
+            i = 3 + 4 * m
+            if value != value:
+                continue
+            if cell[i]:
+                cell[i + 2], cell[i + 3] = min(cell[i + 2], value), max(cell[i + 3], value)
+            else:
+                cell[i + 2] = cell[i + 3] = value
+            cell[i] += 1.0
+            cell[i + 1] += value
+    return list(leaves.values())
+
+
+def _rollups(leaves):
+    """(key, cell values) of every cell and roll-up each leaf cell belongs to"""
+    for leaf in leaves:
+        for mask in product((False, True), repeat=len(DIMENSIONS)):
+            # mask[i] rolls dimension i up to '*'
+            key = tuple(ALL if rolled else value for value, rolled in zip(leaf[:3], mask))
+            yield key, leaf[3:]
+
+
+class TerCube:
+    """Incrementally maintained (AMC, category, period) aggregates with roll-ups
+
+    A key component of '*' means "all": ('*', 'Equity', '2026-02') aggregates every
+    AMC's Equity changes in February 2026. Each batch (one report date) keeps its own
+    leaf cells, so a revised batch can replace that day's contribution (see ter_batches).
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.batches = {}
+        self.leaves = {}
+
+    # Updates
+
+    @staticmethod
+    def prepare(comparison):
+        """Per-row AMC, category, period and changes from compare_plan_changes output"""
+        names = comparison['Scheme Name']
+        if 'Fund_Category' in comparison:
+            categories = comparison['Fund_Category']
+        else:
+            categories = names.map({name: categorize_fund(name) for name in pd.unique(names)})
+        if 'NSDL Scheme Code' in comparison:
+            codes = comparison['NSDL Scheme Code'].astype(str)
+            amcs = codes.str.split('/', n=1).str[0].str.strip()
+        else:
+            amcs = pd.Series('Unknown', index=comparison.index)
+        periods = pd.to_datetime(comparison['Date of TER Change'], errors='coerce')
+        periods = periods.dt.strftime('%Y-%m')
+        regular = comparison['Regular Base TER New'] - comparison['Regular Base TER Old']
+        direct = comparison['Direct Base TER New'] - comparison['Direct Base TER Old']
+        return pd.DataFrame({
+            'amc': amcs.fillna('Unknown').to_numpy(),
+            'category': categories.fillna('Other').to_numpy(),
+            'period': periods.fillna('Unknown').to_numpy(),
+            'regular': regular.to_numpy(dtype=float),
+            'direct': direct.to_numpy(dtype=float),
+            'difference': comparison['Difference (Reg Change - Dir Change)'].to_numpy(dtype=float),
+        })
+
+    def update(self, comparison, batch=None):
+        """Fold one day's comparison rows into every cell and roll-up they belong to
+
+        A batch already applied with the same rows is skipped (returns False); one
+        applied with different rows is replaced. Without a batch id the rows are
+        added for good.
+        """
+        rows = self.prepare(comparison)
+        if batch is None:
+            leaves = _leaf_rows(rows)
+            self.leaves.setdefault(UNTRACKED, []).extend(leaves)
+            self._merge(_rollups(leaves))
+            return True
+        batch = str(batch)
+        claim = claim_batch(self.batches, batch, frame_digest(rows), True, 'Cube')
+        if claim == SKIP:
+            return False
+        self.leaves[batch] = _leaf_rows(rows)
+        if claim == REPLACE:
+            self.cells = {}
+            self._merge(_rollups([leaf for leaves in self.leaves.values() for leaf in leaves]))
+        else:
+            self._merge(_rollups(self.leaves[batch]))
+        return True
+
+    def _merge(self, cells):
+        for key, new in cells:
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = [float(v) for v in new]
+                continue
+            for i in range(len(MEASURES)):
+                count, total, low, high = new[4 * i:4 * i + 4]
+                if not count:
+                    continue
+                if cell[4 * i]:
+                    cell[4 * i + 2] = min(cell[4 * i + 2], low)
+                    cell[4 * i + 3] = max(cell[4 * i + 3], high)
+                else:
+                    cell[4 * i + 2], cell[4 * i + 3] = low, high
+                cell[4 * i] += count
+                cell[4 * i + 1] += total
+
+    # Queries
+
+    def get(self, amc=ALL, category=ALL, period=ALL):
+        """Stats of one cell or roll-up (None when no changes fall in it)"""
+        cell = self.cells.get((amc, category, period))
+        return _cell_stats(cell) if cell is not None else None
+
+    def frame(self, amc=None, category=None, period=None, rollups=False):
+        """Cells as a table, optionally filtered on any dimension ('*' selects roll-ups)"""
+        records = []
+        for (cell_amc, cell_category, cell_period), cell in self.cells.items():
+            key = (cell_amc, cell_category, cell_period)
+            if not rollups and ALL in key:
+                if ALL not in (amc, category, period):
+                    continue
+            wanted = zip((amc, category, period), key)
+            if any(want is not None and have != want for want, have in wanted):
+                continue
+            record = {'AMC': cell_amc, 'Category': cell_category, 'Period': cell_period}
+            for measure, stats in _cell_stats(cell).items():
+                for stat, value in stats.items():
+                    record[f'{measure.title()} {stat.title()}'] = value
+            records.append(record)
+        result = pd.DataFrame(records)
+        if result.empty:
+            return result
+        result = result.sort_values(['Period', 'AMC', 'Category'], kind='mergesort')
+        return result.reset_index(drop=True)
+
+    # Persistence
+
+    def to_dict(self):
+        return {
+            'version': CUBE_VERSION,
+            'measures': list(MEASURES),
+            'stats': list(STATS),
+            'batches': dict(sorted(self.batches.items())),
+            'leaves': [[batch] + leaf for batch, leaves in self.leaves.items() for leaf in leaves],
+            'cells': [list(key) + cell for key, cell in self.cells.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        cube = cls()
+        version = data.get('version')
+        if version != CUBE_VERSION:
+            raise ValueError(f"Unsupported cube version {version}")
+        cube.cells = {tuple(row[:3]): list(row[3:]) for row in data.get('cells', [])}
+        cube.batches = dict(data.get('batches', {}))
+        for row in data.get('leaves', []):
+            cube.leaves.setdefault(row[0], []).append(row[1:])
+        return cube
+
+    def save(self, path):
+        from .ter_state_store import atomic_write_json
+
+        os.makedirs(os.path.dirname(str(path)) or '.', exist_ok=True)
+        atomic_write_json(str(path), self.to_dict())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Cube stored at path (an empty cube when the file does not exist)"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def update_cube_file(comparison, batch, path):
+    """Load the cube at path, fold in one day's comparison rows and save it back"""
+    cube = TerCube.load(path)
+    if cube.update(comparison, batch):
+        cube.save(path)
+    return path
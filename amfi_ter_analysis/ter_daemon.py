@@ -0,0 +1,278 @@
+"""
+Long-running service mode for AMFI TER Analysis
+Keeps the normalized baseline and its scheme index in memory, polls AMFI with
+conditional requests, diffs new content against the warm baseline and checkpoints
+the state to disk so a restart resumes without a cold reload
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import requests
+import numpy as np
+import pandas as pd
+
+from . import ter_metrics
+from .ter_analysis import ter_file_url, diff_ter_frames
+from .ter_pipeline import (
+    BASELINE_PATH,
+    DAILY_STAGES,
+    SINK_STAGE,
+    Stage,
+    PipelineError,
+    run_dag,
+    load_previous_snapshot
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = '.ter_daemon/state.pkl'
+CHECKPOINT_VERSION = 1
+# Poll state kept in the checkpoint besides the baseline
+CHECKPOINT_KEYS = ('month', 'year', 'etag', 'last_modified', 'content_hash', 'last_change')
+DEFAULT_INTERVAL = 900
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Poll outcomes reported by TerDaemon.check_once
+NOT_MODIFIED = 'not_modified'    # server answered 304
+UNCHANGED = 'unchanged'          # 200, but same content hash as last time
+NO_CHANGES = 'no_changes'        # new content, no Base TER changes against the baseline
+CHANGED = 'changed'              # new content with changes; downstream stages ran
+UNAVAILABLE = 'unavailable'      # workbook not published / request failed
+
+
+class FixedSchedule:
+    """Poll at a constant interval (seconds)"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+
+    def next_delay(self, now, outcome):
+        return self.interval
+
+
+def conditional_fetch(session, url, etag=None, last_modified=None, timeout=60):
+    """GET url with If-None-Match / If-Modified-Since
+
+    Returns (status_code, content, etag, last_modified); content is None on 304.
+    """
+    headers = dict(REQUEST_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response = session.get(url, headers=headers, timeout=timeout, verify=False)
+    ter_metrics.incr('bytes_fetched', len(response.content))
+    if response.status_code == 304:
+        return 304, None, etag, last_modified
+    return (response.status_code, response.content,
+            response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+
+class TerDaemon:
+    """Warm-state poller
+
+    The baseline is the last normalized snapshot; `index` maps its scheme codes to
+    row positions so a new snapshot is aligned with a hash lookup and only schemes
+    whose Base TER moved are passed to the diff.
+    """
+
+    def __init__(self, checkpoint=CHECKPOINT_FILE, history_dir='history', output_dir='output',
+                 webhooks=None, formats=None, threshold=0.02, write=True, metrics_dir='metrics',
+                 schedule=None, session=None, clock=datetime.now):
+        self.checkpoint = Path(checkpoint) if checkpoint else None
+        self.history_dir = history_dir
+        self.output_dir = output_dir
+        self.webhooks = list(webhooks or [])
+        self.formats = formats
+        self.threshold = threshold
+        self.write = write
+        self.metrics_dir = metrics_dir
+        self.schedule = schedule or FixedSchedule()
+        self.session = session or requests.Session()
+        self.clock = clock
+
+        self.month = None
+        self.year = None
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+        self.baseline = None
+        self.index = None
+        self.last_change = None
+
+    # State
+
+    def set_baseline(self, frame):
+        """Make a normalized snapshot the warm baseline and rebuild the scheme index"""
+        self.baseline = frame.reset_index(drop=True) if frame is not None else None
+        self.index = pd.Index(self.baseline['NSDL Scheme Code']) if frame is not None else None
+
+    def restore(self):
+        """Load the checkpoint, falling back to the newest history snapshot"""
+        if self.checkpoint and self.checkpoint.exists():
+            try:
+                with open(self.checkpoint, 'rb') as f:
+                    state = pickle.load(f)
+                if state.get('version') == CHECKPOINT_VERSION:
+                    for key in CHECKPOINT_KEYS:
+                        setattr(self, key, state.get(key))
+                    self.set_baseline(state.get('baseline'))
+                    schemes = len(self.baseline) if self.baseline is not None else 0
+                    logger.info(f"Restored daemon state from {self.checkpoint} ({schemes} schemes)")
+                    return True
+                logger.warning(f"Ignoring checkpoint with version {state.get('version')}")
+            except Exception as e:
+                logger.warning(f"Could not read checkpoint {self.checkpoint}: {e}")
+        self.set_baseline(load_previous_snapshot(self.history_dir))
+        return False
+
+    def save_checkpoint(self):
+        """Write the warm state atomically"""
+        if not self.checkpoint:
+            return
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        state = {key: getattr(self, key) for key in CHECKPOINT_KEYS}
+        state.update(version=CHECKPOINT_VERSION, baseline=self.baseline)
+        tmp = self.checkpoint.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.checkpoint)
+
+    # Diff
+
+    def diff_against_baseline(self, current, change_date):
+        """Diff a normalized snapshot against the warm baseline, touching only moved schemes"""
+        if self.baseline is None:
+            logger.info("No baseline yet, nothing to diff against")
+            empty = current.iloc[0:0]
+            return (diff_ter_frames(empty, empty, 'Regular', change_date),
+                    diff_ter_frames(empty, empty, 'Direct', change_date))
+
+        positions = self.index.get_indexer(current['NSDL Scheme Code'])
+        known = positions >= 0
+        moved = np.zeros(len(current), dtype=bool)
+        for plan in ('Regular', 'Direct'):
+            col = f'{plan} Plan - Base TER (%)'
+            old = self.baseline[col].to_numpy(dtype=float)[positions[known]]
+            new = current[col].to_numpy(dtype=float)[known]
+            moved[known] |= (old != new) & ~np.isnan(old) & ~np.isnan(new)
+
+        previous = self.baseline.iloc[positions[moved]]
+        candidates = current[moved]
+        regular = diff_ter_frames(previous, candidates, 'Regular', change_date)
+        direct = diff_ter_frames(previous, candidates, 'Direct', change_date)
+        ter_metrics.incr('rows_changed', len(regular) + len(direct))
+        logger.info(f"Regular Plan: {len(regular)} changes, Direct Plan: {len(direct)} changes "
+                    f"({int(moved.sum())} of {len(current)} schemes moved)")
+        return regular, direct
+
+    def _stages(self):
+        by_name = {stage.name: stage for stage in DAILY_STAGES}
+        diff = Stage('diff', self.diff_against_baseline, ('current', 'change_date'),
+                     ('regular_changes', 'direct_changes'))
+        detect = [by_name['parse'], by_name['normalize'], diff]
+        report = [by_name[name]
+                  for name in ('compare', 'classify', 'anomalies', 'render', 'notify')]
+        if self.write:
+            report.append(SINK_STAGE)
+        return detect, report
+
+    # Polling
+
+    def check_once(self):
+        """Poll once and process new content; returns the outcome name"""
+        now = self.clock()
+        ter_metrics.incr('polls')
+        if (now.month, now.year) != (self.month, self.year):
+            if self.month is not None:
+                logger.info(f"Month rolled over to {now.month:02d}-{now.year}")
+            self.month, self.year = now.month, now.year
+            self.etag = self.last_modified = self.content_hash = None
+
+        try:
+            status, content, etag, last_modified = conditional_fetch(
+                self.session, ter_file_url(self.month, self.year), self.etag, self.last_modified)
+        except requests.RequestException as e:
+            logger.warning(f"Poll failed: {e}")
+            return UNAVAILABLE
+        if status == 304:
+            ter_metrics.incr('polls_not_modified')
+            return NOT_MODIFIED
+        if status != 200 or not content or len(content) <= 100:
+            logger.info(f"TER workbook for {self.month:02d}-{self.year} not available "
+                        f"(HTTP {status})")
+            return UNAVAILABLE
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        self.etag, self.last_modified = etag, last_modified
+        if content_hash == self.content_hash:
+            ter_metrics.incr('polls_unchanged')
+            return UNCHANGED
+
+        outcome = self.process(content, now)
+        self.content_hash = content_hash
+        self.save_checkpoint()
+        return outcome
+
+    def process(self, content, now):
+        """Run new workbook content through the pipeline against the warm baseline"""
+        report_date = now.strftime('%Y-%m-%d')
+        context = {
+            'workbook': content,
+            'change_date': None,
+            'threshold': self.threshold,
+            'report_date': report_date,
+            'output_dir': self.output_dir,
+            'history_dir': self.history_dir,
+            'webhooks': self.webhooks,
+            'formats': self.formats,
+            'baseline_path': BASELINE_PATH,
+            'revision_history': None,
+            'history_version': None,
+            'resend': False,
+        }
+        detect, report = self._stages()
+        run_dag(detect, context, cache_dir=None)
+
+        has_changes = len(context['regular_changes']) or len(context['direct_changes'])
+        if has_changes:
+            run_dag(report, context, cache_dir=None)
+            self.last_change = now
+        self.set_baseline(context['current'])
+        if has_changes and self.write:
+            ter_metrics.export(self.metrics_dir, summary=context['summary'])
+        return CHANGED if has_changes else NO_CHANGES
+
+    def run(self, stop_event=None, max_checks=None):
+        """Poll until stop_event is set (or max_checks polls have run)"""
+        stop_event = stop_event or threading.Event()
+        self.restore()
+        checks = 0
+        while not stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                outcome = self.check_once()
+            except PipelineError as e:
+                logger.error(f"Pipeline failed: {e}")
+                outcome = UNAVAILABLE
+            checks += 1
+            logger.info(f"Poll {checks}: {outcome} ({time.perf_counter() - started:.2f}s)")
+            if self.metrics_dir:
+                ter_metrics.export(self.metrics_dir, summary_file=None)
+            if max_checks is not None and checks >= max_checks:
+                break
+            delay = self.schedule.next_delay(self.clock(), outcome)
+            logger.info(f"Next poll in {delay:.0f}s")
+            stop_event.wait(delay)
+        self.session.close()
+        return checks
@@ -2,39 +2,26 @@ import requests
 import pandas as pd
 import os
 from datetime import datetime, timedelta
-import json
 from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
-# Create directories
-os.makedirs('downloads', exist_ok=True)
-os.makedirs('output', exist_ok=True)
-os.makedirs('history', exist_ok=True)
+from .ter_state_store import open_state_store
 
 # State file to track last processed date and files
-STATE_FILE = 'ter_state.json'
+STATE_FILE = os.environ.get('TER_STATE_FILE', 'ter_state.json')
 
 def load_state():
     """Load the state of last processed date and files"""
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {
-        'last_processed_date': None,
-        'last_month': None,
-        'last_year': None,
-        'previous_day_file': None
-    }
+    return open_state_store(STATE_FILE).load()
 
 def save_state(state):
     """Save the state of processed date and files"""
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f, indent=2)
+    open_state_store(STATE_FILE).save(state)
 
-def get_current_month_year():
-    """Get current month and year"""
-    today = datetime.now()
+def get_current_month_year(now=None):
+    """Get current month and year (of `now` when given)"""
+    today = now or datetime.now()
     return today.month, today.year
 
 def download_ter_file(month, year):
@@ -51,6 +38,7 @@ def download_ter_file(month, year):
         print(f"Response status: {response.status_code}, Size: {len(response.content)} bytes")
         
         if response.status_code == 200 and len(response.content) > 100:
+            os.makedirs('downloads', exist_ok=True)
             file_path = f"downloads/TER_{month_str}.xlsx"
             with open(file_path, 'wb') as f:
                 f.write(response.content)
@@ -92,3 +80,17 @@ def find_ter_columns(df):
             direct_col = col
     
     return scheme_code_col, scheme_name_col, regular_col, direct_col
+
+def compare_ter_daily(current_df, previous_df, now=None):
+    """Compare TER changes between current and previous day (changes are dated `now`)
+
+    Thin pandas adapter over ter_core: both frames are normalized to one row per
+    scheme and diffed by the pandas-free core.
+    """
+    from .ter_analysis import normalize_ter_frame
+    from .ter_core import Snapshot, compare_snapshots
+
+    change_date = (now or datetime.now()).strftime('%Y-%m-%d')
+    previous = Snapshot.from_frame(normalize_ter_frame(previous_df))
+    current = Snapshot.from_frame(normalize_ter_frame(current_df))
+    return compare_snapshots(previous, current, change_date)
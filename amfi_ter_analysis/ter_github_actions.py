@@ -4,36 +4,22 @@ Runs daily to compare TER changes and generate reports
 """
 
 import os
-import json
 import requests
 import pandas as pd
 from datetime import datetime
-from pathlib import Path
 import logging
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/ter_analysis.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+from .ter_runtime import ensure_directories, setup_logging
+from .ter_state_store import open_state_store
 
-# Create directories
-Path('downloads').mkdir(exist_ok=True)
-Path('output').mkdir(exist_ok=True)
-Path('logs').mkdir(exist_ok=True)
-Path('history').mkdir(exist_ok=True)
+logger = logging.getLogger(__name__)
 
-STATE_FILE = 'ter_state.json'
+STATE_FILE = os.environ.get('TER_STATE_FILE', 'ter_state.json')
 API_URL = 'https://www.amfiindia.com/api/populate-te-rdata-revised'
 
-def get_default_state():
+def get_default_state(now=None):
     """Get default state structure"""
-    today = datetime.now().date()
+    today = (now or datetime.now()).date()
     return {
         'last_processed_date': str(today),
         'month_year': f"{today.year}-{today.month:02d}",
@@ -42,34 +28,16 @@ def get_default_state():
     }
 
 def load_state():
-    """Load state from JSON file and validate/migrate schema"""
-    default_state = get_default_state()
-    
-    if os.path.exists(STATE_FILE):
-        try:
-            with open(STATE_FILE, 'r') as f:
-                loaded_state = json.load(f)
-            
-            for key in default_state.keys():
-                if key not in loaded_state:
-                    logger.info(f"Missing key '{key}' in state, using default value")
-                    loaded_state[key] = default_state[key]
-            
-            if 'month_year' not in loaded_state and 'last_year' in loaded_state and 'last_month' in loaded_state:
-                loaded_state['month_year'] = f"{loaded_state['last_year']}-{loaded_state['last_month']:02d}"
-                logger.info(f"Migrated old state format to new format: month_year={loaded_state['month_year']}")
-            
-            return loaded_state
-        except Exception as e:
-            logger.error(f"Error loading state: {e}")
-            return default_state
-    return default_state
+    """Load state, migrating older schemas (see ter_state_store)"""
+    store = open_state_store(STATE_FILE)
+    if not os.path.exists(store.path):
+        return get_default_state()
+    return store.load()
 
 def save_state(state):
-    """Save state to JSON file"""
+    """Save state atomically under the state file lock"""
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=2)
+        open_state_store(STATE_FILE).save(state)
         logger.info("State saved successfully")
     except Exception as e:
         logger.error(f"Error saving state: {e}")
@@ -80,6 +48,7 @@ def download_ter_file(year, month):
         logger.info(f"Downloading TER file for {year}-{month:02d}...")
         response = requests.get(API_URL, timeout=30)
         response.raise_for_status()
+        ensure_directories('downloads')
         filename = f"downloads/TER_{year}_{month:02d}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         with open(filename, 'wb') as f:
             f.write(response.content)
@@ -89,9 +58,26 @@ def download_ter_file(year, month):
         logger.error(f"Error downloading TER file: {e}")
         return None
 
-def analyze_and_report():
-    """Main analysis function"""
+def analyze_and_report(now=None):
+    """Main analysis function (as of `now` when given)"""
+    ensure_directories()
+    setup_logging()
     logger.info("Starting AMFI TER Analysis")
-    state = load_state()
-    today = datetime.now().date()
+    today = (now or datetime.now()).date()
     logger.info(f"Current date: {today}")
+
+    from .ter_pipeline import run_daily_pipeline, PipelineError
+
+    try:
+        context = run_daily_pipeline(month=today.month, year=today.year, report_date=str(today), now=now)
+    except PipelineError as e:
+        logger.error(f"Analysis failed: {e}")
+        return None
+
+    # Locked read-modify-write so a concurrent backfill's file_history entries survive
+    with open_state_store(STATE_FILE).update() as state:
+        state['last_processed_date'] = str(today)
+        state['month_year'] = f"{today.year}-{today.month:02d}"
+        state['last_month'], state['last_year'] = today.month, today.year
+    logger.info(f"Summary: Regular={context['summary']['regular_count']}, Direct={context['summary']['direct_count']}")
+    return context['summary']
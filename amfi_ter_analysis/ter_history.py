@@ -0,0 +1,268 @@
+"""
+History store for AMFI TER snapshots
+Lists and loads the daily snapshots under history/ (TER_Data_MM-YYYY_YYYYMMDD.pkl)
+one at a time, and exposes a data version that changes whenever a snapshot is
+added, replaced or removed, for keying caches of history-wide results.
+get_ter_history answers per-scheme time-series queries from a persistent index.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .ter_analysis import normalize_ter_frame
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = 'history'
+SNAPSHOT_GLOB = 'TER_Data_*.pkl'
+PLANS = ('Regular', 'Direct')
+
+
+def _stamp(date):
+    """YYYYMMDD from a date, datetime, YYYY-MM-DD or YYYYMMDD value (None stays None)"""
+    if date is None:
+        return None
+    if hasattr(date, 'strftime'):
+        return date.strftime('%Y%m%d')
+    return str(date)[:10].replace('-', '')
+
+
+class HistoryStore:
+    """Read access to the snapshots of a history directory, oldest first"""
+
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = Path(history_dir)
+
+    def snapshots(self, start=None, end=None):
+        """[(date, path)] for snapshots dated start..end (inclusive), one per date
+
+        Dates are Timestamps. When two files share a date stamp (a backfilled month
+        and a daily run), the later file name wins.
+        """
+        start, end = _stamp(start), _stamp(end)
+        by_date = {}
+        for path in sorted(self.history_dir.glob(SNAPSHOT_GLOB)):
+            stamp = path.stem.rsplit('_', 1)[-1]
+            if (start and stamp < start) or (end and stamp > end):
+                continue
+            by_date[stamp] = path
+        return [(pd.Timestamp(datetime.strptime(stamp, '%Y%m%d')), path)
+                for stamp, path in sorted(by_date.items())]
+
+    def dates(self, start=None, end=None):
+        return [date for date, _ in self.snapshots(start, end)]
+
+    def load(self, path):
+        """One normalized snapshot"""
+        return normalize_ter_frame(pd.read_pickle(path))
+
+    def iter_snapshots(self, start=None, end=None):
+        """Yield (date, normalized frame) in date order, loading one snapshot at a time"""
+        for date, path in self.snapshots(start, end):
+            yield date, self.load(path)
+
+    def load_panel(self, start=None, end=None):
+        """All snapshots in one frame with a 'Snapshot Date' column (the in-memory path)"""
+        frames = [frame.assign(**{'Snapshot Date': date})
+                  for date, frame in self.iter_snapshots(start, end)]
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def data_version(self):
+        """Short hash of the snapshot file names, sizes and modification times"""
+        digest = hashlib.sha256()
+        for path in sorted(self.history_dir.glob(SNAPSHOT_GLOB)):
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()[:16]
+
+
+INDEX_FILE = '.ter_index.pkl'
+INDEX_VERSION = 1
+
+
+class HistoryIndex:
+    """Per-scheme TER index over a history directory, persisted next to the snapshots
+
+    Rows (scheme code, snapshot date, Regular TER, Direct TER) are kept sorted by code
+    then date, so one code's history is a contiguous slice found with a hash lookup.
+    refresh() appends newly added snapshots and rebuilds only when an existing one
+    changed; the index is saved to history/.ter_index.pkl for the next process.
+    """
+
+    def __init__(self, history_dir=HISTORY_DIR, path=None, cache_size=32, refresh_interval=1.0):
+        self.store = HistoryStore(history_dir)
+        self.path = Path(path) if path else self.store.history_dir / INDEX_FILE
+        self.cache_size = cache_size
+        self.refresh_interval = refresh_interval
+        self.files = {}
+        self.codes = np.array([], dtype=object)
+        self.dates = np.array([], dtype='datetime64[ns]')
+        self.values = np.empty((0, 2))
+        self.names = {}
+        self._lookup = pd.Index([], dtype=object)
+        self._bounds = np.zeros(1, dtype=np.int64)
+        self._cache = OrderedDict()
+        self._checked = None
+        self._lock = threading.RLock()
+        self._load()
+
+    # Persistence
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != INDEX_VERSION:
+                return
+            self.files, self.names = data['files'], data['names']
+            self._set_rows(data['codes'], data['dates'], data['values'])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable history index {self.path}: {e}")
+
+    def _save(self):
+        data = {'version': INDEX_VERSION, 'files': self.files, 'names': self.names,
+                'codes': self.codes, 'dates': self.dates, 'values': self.values}
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    # Building
+
+    def _set_rows(self, codes, dates, values):
+        order = np.lexsort((dates, codes))
+        self.codes, self.dates, self.values = codes[order], dates[order], values[order]
+        if len(self.codes):
+            starts = np.flatnonzero(np.r_[True, self.codes[1:] != self.codes[:-1]])
+        else:
+            starts = np.array([], dtype=np.int64)
+        self._lookup = pd.Index(self.codes[starts], dtype=object)
+        self._bounds = np.r_[starts, len(self.codes)].astype(np.int64)
+        self._cache.clear()
+
+    def _signatures(self):
+        signatures = {}
+        for date, path in self.store.snapshots():
+            stat = path.stat()
+            signatures[date.strftime('%Y%m%d')] = (path.name, stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the history directory; True if it changed"""
+        with self._lock:
+            now = time.monotonic()
+            recent = self._checked is not None and now - self._checked < self.refresh_interval
+            if recent and not force:
+                return False
+            self._checked = now
+            signatures = self._signatures()
+            if signatures == self.files:
+                return False
+            unchanged = all(signatures.get(stamp) == sig for stamp, sig in self.files.items())
+            if unchanged:
+                added = sorted(stamp for stamp in signatures if stamp not in self.files)
+                codes, dates, values = [self.codes], [self.dates], [self.values]
+            else:
+                logger.info(f"Rebuilding history index {self.path}")
+                added = sorted(signatures)
+                codes, dates, values = [], [], []
+                self.names = {}
+            for stamp in added:
+                frame = self.store.load(self.store.history_dir / signatures[stamp][0])
+                codes.append(frame['NSDL Scheme Code'].to_numpy(dtype=object))
+                day = np.datetime64(datetime.strptime(stamp, '%Y%m%d'), 'ns')
+                dates.append(np.full(len(frame), day))
+                ters = frame[['Regular Plan - Base TER (%)', 'Direct Plan - Base TER (%)']]
+                values.append(ters.to_numpy(dtype=float))
+                self.names.update(zip(frame['NSDL Scheme Code'], frame['Scheme Name']))
+            self._set_rows(np.concatenate(codes) if codes else self.codes,
+                           np.concatenate(dates) if dates else self.dates,
+                           np.concatenate(values) if values else self.values)
+            self.files = signatures
+            self._save()
+            logger.info(f"History index: {len(added)} snapshot(s) added, "
+                        f"{len(self._lookup)} schemes, {len(self.codes)} rows")
+            return True
+
+    # Queries
+
+    def query(self, codes, start=None, end=None, plans=PLANS):
+        """TER history of many schemes as one frame indexed by (NSDL Scheme Code, Date)
+
+        Columns are '<plan> Plan - Base TER (%)' for each plan, aligned on the same
+        dates. Codes without history are left out. Repeated queries are answered
+        from a small LRU cache until the index changes, so copy the result before
+        modifying it.
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+        codes = tuple(dict.fromkeys(codes))
+        start = np.datetime64(pd.Timestamp(start), 'ns') if start is not None else None
+        end = np.datetime64(pd.Timestamp(end), 'ns') if end is not None else None
+        plans = tuple(plans)
+        key = (codes, start, end, plans)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            # Concatenate the row range of every known code, in code order
+            slots = self._lookup.get_indexer(pd.Index(codes, dtype=object))
+            slots = np.sort(slots[slots >= 0])
+            lo, hi = self._bounds[slots], self._bounds[slots + 1]
+            lengths = hi - lo
+            offsets = lo - np.r_[0, np.cumsum(lengths)[:-1]]
+            rows = np.repeat(offsets, lengths) + np.arange(lengths.sum())
+            if start is not None:
+                rows = rows[self.dates[rows] >= start]
+            if end is not None:
+                rows = rows[self.dates[rows] <= end]
+
+            columns = {f'{plan} Plan - Base TER (%)': self.values[rows, PLANS.index(plan)]
+                       for plan in plans}
+            index = pd.MultiIndex.from_arrays([self.codes[rows], self.dates[rows]],
+                                              names=['NSDL Scheme Code', 'Date'])
+            result = pd.DataFrame(columns, index=index)
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def history_index(history_dir=HISTORY_DIR):
+    """Process-wide, refreshed HistoryIndex for a history directory (kept warm)"""
+    key = os.path.abspath(history_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = HistoryIndex(history_dir)
+    index.refresh()
+    return index
+
+
+def get_ter_history(codes, start=None, end=None, plans=PLANS, history_dir=HISTORY_DIR):
+    """Regular / Direct Base TER by date for one or many scheme codes
+
+    Returns a frame indexed by (NSDL Scheme Code, Date) with one column per plan,
+    sorted by code then date. Answers from the persistent per-scheme index, which
+    is updated for new snapshots on the way in.
+    """
+    return history_index(history_dir).query(codes, start, end, plans)
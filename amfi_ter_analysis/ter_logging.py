@@ -0,0 +1,105 @@
+"""
+Non-blocking structured logging for AMFI TER runs
+Loggers only put records on a queue; a background QueueListener thread formats them
+and writes JSON lines to the log file (and text or JSON to the console). Fields
+passed via `extra` (stage, duration, rows, ...) become top-level JSON keys.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_FILE = 'logs/ter_analysis.log'
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra fields"""
+
+    def format(self, record):
+        event = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                event[key] = value
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str, ensure_ascii=False)
+
+
+def resolve_level(level=None):
+    """Numeric level from an int, a name, TER_LOG_LEVEL, or INFO"""
+    level = level if level is not None else os.environ.get('TER_LOG_LEVEL', 'INFO')
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def configure_logging(level=None, log_file=LOG_FILE, console=True, console_format='text'):
+    """Route the root logger through a queue to file / console writers on a background thread
+
+    The level defaults to TER_LOG_LEVEL, or INFO. Safe to call more than once:
+    later calls only change the level, and only when one is given.
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    if _listener is not None:
+        if level is not None:
+            root.setLevel(resolve_level(level))
+        return _listener
+    root.setLevel(resolve_level(level))
+
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JsonFormatter() if console_format == 'json'
+                                    else logging.Formatter(TEXT_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = _queue_handler = None
+
+
+def log_event(logger, message, level=logging.INFO, **fields):
+    """Log a message with structured fields (e.g. stage=, duration=, rows=)"""
+    logger.log(level, message, extra=fields)
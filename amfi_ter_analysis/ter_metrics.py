@@ -0,0 +1,289 @@
+"""
+Stage timing and counters for AMFI TER runs
+Records wall time, CPU time and peak memory per pipeline stage plus run counters
+(bytes fetched, rows parsed, rows changed, cache hits), and exports them to
+analysis_summary.json and Prometheus / OpenMetrics text files.
+CPU time is that of the thread running the stage, so concurrent DAG stages do not
+count each other's work (work a stage hands to a thread or process pool is not
+included). Peak RSS is the process RSS sampled while the stage runs; stages that
+overlap in time see the same process-wide samples.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_records = []
+_counters = {}
+_active = 0
+_memory_tracing = False
+_rss_watchers = []
+_rss_wakeup = threading.Event()
+_rss_sampler = None
+
+# Seconds between RSS samples while a stage is running
+RSS_SAMPLE_INTERVAL = 0.01
+
+METRIC_PREFIX = 'ter'
+
+# Counter name -> help text for exported metrics
+COUNTERS = {
+    'bytes_fetched': 'Bytes of TER workbook downloaded',
+    'rows_parsed': 'Rows read from TER workbooks',
+    'rows_normalized': 'Schemes in normalized snapshots',
+    'rows_changed': 'Regular and Direct Base TER changes detected',
+    'cache_hits': 'Pipeline stages served from the stage cache',
+    'cache_misses': 'Pipeline stages executed',
+    'messages_sent': 'Notification messages delivered',
+    'polls': 'Daemon polls of the AMFI endpoint',
+    'polls_not_modified': 'Daemon polls answered 304 Not Modified',
+    'polls_unchanged': 'Daemon polls returning an already processed workbook',
+}
+
+
+def enable_memory_tracing():
+    """Trace Python allocations so stages report their peak memory (adds overhead)"""
+    global _memory_tracing
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _memory_tracing = True
+
+
+def current_rss_bytes():
+    """Resident set size of this process now, or None where unsupported (non-Linux)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sample_rss():
+    """Background loop raising the peak of every running stage to the current RSS"""
+    while True:
+        _rss_wakeup.wait()
+        rss = current_rss_bytes()
+        with _lock:
+            for watcher in _rss_watchers:
+                watcher[0] = max(watcher[0], rss)
+            if not _rss_watchers:
+                _rss_wakeup.clear()
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+
+def _watch_rss():
+    """Start tracking a stage's peak RSS; returns its [peak] cell or None"""
+    global _rss_sampler
+    rss = current_rss_bytes()
+    if rss is None:
+        return None
+    watcher = [rss]
+    with _lock:
+        _rss_watchers.append(watcher)
+        if _rss_sampler is None:
+            _rss_sampler = threading.Thread(target=_sample_rss, name='ter-rss-sampler', daemon=True)
+            _rss_sampler.start()
+        _rss_wakeup.set()
+    return watcher
+
+
+def _unwatch_rss(watcher):
+    """Stop tracking a stage and return its peak RSS"""
+    if watcher is None:
+        return None
+    rss = current_rss_bytes()
+    with _lock:
+        # By identity: cells of concurrent stages can hold equal values
+        _rss_watchers[:] = [cell for cell in _rss_watchers if cell is not watcher]
+        return max(watcher[0], rss or 0)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a named stage and record the result"""
+    global _active
+    with _lock:
+        # reset_peak is Python 3.9+; on 3.8 the peak is the high-water mark since
+        # tracing started, still reported relative to the stage's starting size
+        if _memory_tracing and _active == 0 and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        _active += 1
+    start_traced = tracemalloc.get_traced_memory()[0] if _memory_tracing else 0
+    watcher = _watch_rss()
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        record = {
+            'stage': name,
+            'wall_seconds': time.perf_counter() - start_wall,
+            'cpu_seconds': time.thread_time() - start_cpu,
+            'peak_memory_bytes': (tracemalloc.get_traced_memory()[1] - start_traced
+                                  if _memory_tracing else None),
+            'peak_rss_bytes': _unwatch_rss(watcher),
+        }
+        with _lock:
+            _active -= 1
+            _records.append(record)
+
+
+def incr(name, value=1):
+    """Add to a run counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def counters():
+    """Current counter values"""
+    with _lock:
+        return dict(_counters)
+
+
+def records():
+    """Stage records collected so far, in completion order"""
+    with _lock:
+        return list(_records)
+
+
+def reset():
+    """Forget collected records and counters"""
+    with _lock:
+        _records.clear()
+        _counters.clear()
+
+
+def stage_totals(stage_records=None):
+    """Aggregate records per stage name (summed times, max memory, run count)"""
+    totals = {}
+    for record in records() if stage_records is None else stage_records:
+        total = totals.setdefault(record['stage'], {
+            'runs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+            'peak_memory_bytes': None, 'peak_rss_bytes': None,
+        })
+        total['runs'] += 1
+        total['wall_seconds'] += record['wall_seconds']
+        total['cpu_seconds'] += record['cpu_seconds']
+        for key in ('peak_memory_bytes', 'peak_rss_bytes'):
+            if record[key] is not None:
+                total[key] = max(total[key] or 0, record[key])
+    return totals
+
+
+def snapshot():
+    """All metrics of the run as a JSON-serializable dict"""
+    return {
+        'generated_at': time.time(),
+        'stages': {name: {key: (round(value, 6) if isinstance(value, float) else value)
+                          for key, value in total.items()}
+                   for name, total in stage_totals().items()},
+        # Known counters are always present so exported series do not come and go
+        'counters': dict(dict.fromkeys(COUNTERS, 0), **counters()),
+    }
+
+
+def _atomic_write(path, text):
+    """Replace a file in one step so scrapers never read a partial file"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _metric_lines(openmetrics=False):
+    """Exposition lines shared by the Prometheus text and OpenMetrics formats"""
+    data = snapshot()
+    lines = []
+
+    stage_metrics = [
+        ('stage_duration_seconds', 'wall_seconds', 'Wall time spent in a stage', 'seconds'),
+        ('stage_cpu_seconds', 'cpu_seconds', 'CPU time of the thread running a stage', 'seconds'),
+        ('stage_peak_rss_bytes', 'peak_rss_bytes', 'Peak process RSS sampled while a stage ran', 'bytes'),
+        ('stage_peak_traced_bytes', 'peak_memory_bytes', 'Peak traced allocations in a stage', 'bytes'),
+    ]
+    for metric, key, help_text, unit in stage_metrics:
+        samples = [(name, total[key]) for name, total in data['stages'].items() if total[key] is not None]
+        if not samples:
+            continue
+        name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if openmetrics:
+            lines.append(f"# UNIT {name} {unit}")
+        lines.extend(f'{name}{{stage="{stage_name}"}} {value}' for stage_name, value in samples)
+
+    for counter, value in sorted(data['counters'].items()):
+        # OpenMetrics names the counter family without the _total sample suffix; in the
+        # Prometheus text format the TYPE line must name the sample itself
+        name = f"{METRIC_PREFIX}_{counter}" if openmetrics else f"{METRIC_PREFIX}_{counter}_total"
+        lines.append(f"# HELP {name} {COUNTERS.get(counter, counter.replace('_', ' '))}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{METRIC_PREFIX}_{counter}_total {value}")
+
+    name = f"{METRIC_PREFIX}_last_run_timestamp_seconds"
+    lines.append(f"# HELP {name} Unix time the metrics were exported")
+    lines.append(f"# TYPE {name} gauge")
+    if openmetrics:
+        lines.append(f"# UNIT {name} seconds")
+    lines.append(f"{name} {data['generated_at']:.3f}")
+    return lines
+
+
+def to_prometheus():
+    """Metrics in the Prometheus text exposition format (node_exporter textfile collector)"""
+    return '\n'.join(_metric_lines()) + '\n'
+
+
+def to_openmetrics():
+    """Metrics in the OpenMetrics text format"""
+    return '\n'.join(_metric_lines(openmetrics=True) + ['# EOF']) + '\n'
+
+
+def export(metrics_dir='metrics', summary_file='analysis_summary.json', summary=None):
+    """Write the run's metrics to the summary JSON and to .prom / OpenMetrics files
+
+    Existing keys in the summary file (the change counts) are kept; metrics go
+    under a 'metrics' key.
+    """
+    written = []
+    if summary_file:
+        data = dict(summary or {})
+        if summary is None and os.path.exists(summary_file):
+            with open(summary_file, 'r') as f:
+                data = json.load(f)
+        data['metrics'] = snapshot()
+        _atomic_write(summary_file, json.dumps(data, indent=2))
+        written.append(summary_file)
+    if metrics_dir:
+        prom = os.path.join(metrics_dir, 'ter_analysis.prom')
+        openmetrics = os.path.join(metrics_dir, 'ter_analysis.openmetrics.txt')
+        _atomic_write(prom, to_prometheus())
+        _atomic_write(openmetrics, to_openmetrics())
+        written += [prom, openmetrics]
+    return written
+
+
+def _megabytes(value):
+    return f"{value / 1048576:10.1f}" if value is not None else f"{'n/a':>10s}"
+
+
+def format_profile(stage_records=None):
+    """Render stage records as a fixed-width table"""
+    stage_records = records() if stage_records is None else stage_records
+    lines = [f"{'Stage':<14s} {'Wall (s)':>9s} {'CPU (s)':>9s} {'Peak MB':>10s} {'RSS MB':>10s}",
+             '-' * 56]
+    for record in stage_records:
+        lines.append(f"{record['stage']:<14s} {record['wall_seconds']:9.3f} {record['cpu_seconds']:9.3f} "
+                     f"{_megabytes(record['peak_memory_bytes'])} {_megabytes(record['peak_rss_bytes'])}")
+    lines.append('-' * 56)
+    lines.append(f"{'total':<14s} {sum(r['wall_seconds'] for r in stage_records):9.3f} "
+                 f"{sum(r['cpu_seconds'] for r in stage_records):9.3f}")
+    return '\n'.join(lines)
@@ -0,0 +1,461 @@
+"""
+Google Chat notifier for TER change reports
+Renders the daily change set into size-bounded messages or cards and posts them
+over a pooled, retrying HTTP session
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .ter_sinks import EXTENSIONS, read_artifact, split_extension
+
+logger = logging.getLogger(__name__)
+
+# Google Chat rejects text messages above 4096 characters and cards above ~32KB
+MAX_MESSAGE_CHARS = 4000
+MAX_CARD_BYTES = 30000
+MAX_CARD_WIDGETS = 50
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THREAD_REPLY_OPTION = 'REPLY_MESSAGE_FALLBACK_TO_NEW_THREAD'
+
+
+def _first_column(df, *candidates):
+    """Return the first candidate column present in the dataframe"""
+    for col in candidates:
+        if col in df.columns:
+            return col
+    return None
+
+
+def _plan_frame(df, plan):
+    """Reduce a plan change file to code, name, old, new and reduction columns"""
+    import pandas as pd
+
+    old_col = _first_column(df, f'Old {plan} Plan - Base TER (%)',
+                            f'Previous {plan} Plan - Base TER (%)', 'Old TER (%)')
+    new_col = _first_column(df, f'New {plan} Plan - Base TER (%)',
+                            f'Current {plan} Plan - Base TER (%)', 'New TER (%)')
+    frame = pd.DataFrame({
+        'NSDL Scheme Code': df['NSDL Scheme Code'].astype(str).str.strip(),
+        'Scheme Name': df['Scheme Name'],
+        f'{plan} Old': pd.to_numeric(df[old_col], errors='coerce'),
+        f'{plan} New': pd.to_numeric(df[new_col], errors='coerce'),
+    })
+    if 'TER Reduction (%)' in df.columns:
+        frame[f'{plan} Reduction'] = pd.to_numeric(df['TER Reduction (%)'], errors='coerce')
+    else:
+        frame[f'{plan} Reduction'] = frame[f'{plan} Old'] - frame[f'{plan} New']
+    return frame.drop_duplicates(subset=['NSDL Scheme Code'], keep='first')
+
+
+def build_change_rows(regular_df=None, direct_df=None):
+    """Combine Regular and Direct change frames into rows sorted by |difference|"""
+    frames = [_plan_frame(df, plan) for df, plan in ((regular_df, 'Regular'), (direct_df, 'Direct'))
+              if df is not None and len(df) > 0]
+    if not frames:
+        return []
+
+    combined = frames[0]
+    if len(frames) > 1:
+        from .ter_pairing import pair_plans
+
+        combined = pair_plans(*frames).drop(columns=['Scheme ID'])
+
+    for plan in ('Regular', 'Direct'):
+        for suffix in ('Old', 'New', 'Reduction'):
+            if f'{plan} {suffix}' not in combined.columns:
+                combined[f'{plan} {suffix}'] = float('nan')
+
+    combined['Difference'] = (combined['Regular Reduction']
+                              - combined['Direct Reduction']).fillna(0.0)
+    combined = combined.sort_values('Difference', ascending=False, key=abs, kind='mergesort')
+    return combined.to_dict('records')
+
+
+def _fmt(value, signed=False):
+    """Format a TER value, using N/A for missing plans"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'N/A'
+    return f"{value:+.2f}" if signed else f"{value:.2f}"
+
+
+def format_change_line(row):
+    """Render one scheme's Regular and Direct movement as a compact line"""
+    return (f"{row['Scheme Name']} | Reg {_fmt(row['Regular Old'])}→{_fmt(row['Regular New'])} "
+            f"({_fmt(row['Regular Reduction'], True)}) | Dir {_fmt(row['Direct Old'])}→"
+            f"{_fmt(row['Direct New'])} ({_fmt(row['Direct Reduction'], True)}) | "
+            f"Diff {row['Difference']:+.2f}")
+
+
+def build_header(rows, report_date=None):
+    """Build the summary header that starts the report thread"""
+    report_date = report_date or datetime.now().strftime('%Y-%m-%d')
+    regular = sum(1 for row in rows if _fmt(row['Regular Reduction']) != 'N/A')
+    direct = sum(1 for row in rows if _fmt(row['Direct Reduction']) != 'N/A')
+    return (f"🔔 AMFI TER Daily Analysis Report - {report_date}\n"
+            f"Regular Plan: {regular} schemes with TER changes\n"
+            f"Direct Plan: {direct} schemes with TER changes\n"
+            f"Sorted by |Regular reduction - Direct reduction|")
+
+
+def render_text_messages(rows, max_chars=MAX_MESSAGE_CHARS, report_date=None):
+    """Split the change set into text messages no longer than max_chars each"""
+    header = build_header(rows, report_date)
+    if not rows:
+        return [header + "\nNo TER changes detected today."]
+
+    pages = []
+    current = []
+    size = 0
+    for row in rows:
+        line = format_change_line(row)
+        if len(line) > max_chars - 20:
+            line = line[:max_chars - 21] + '…'
+        if current and size + len(line) + 1 > max_chars - 20:
+            pages.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+
+    if current:
+        pages.append(current)
+
+    total = len(pages)
+    messages = [header + f"\n{total} page(s) in this thread"]
+    for number, lines in enumerate(pages, 1):
+        messages.append(f"Page {number}/{total}\n" + "\n".join(lines))
+    return messages
+
+
+def _card_widget(row):
+    """Render one scheme as a decoratedText card widget"""
+    return {
+        'decoratedText': {
+            'topLabel': str(row['Scheme Name']),
+            'text': (f"Reg {_fmt(row['Regular Old'])}→{_fmt(row['Regular New'])} · "
+                     f"Dir {_fmt(row['Direct Old'])}→{_fmt(row['Direct New'])} · "
+                     f"Diff {row['Difference']:+.2f}"),
+        }
+    }
+
+
+def _card_message(title, subtitle, widgets, card_id):
+    """Wrap widgets into a cardsV2 message body"""
+    return {
+        'cardsV2': [{
+            'cardId': card_id,
+            'card': {
+                'header': {'title': title, 'subtitle': subtitle},
+                'sections': [{'widgets': widgets}],
+            },
+        }]
+    }
+
+
+def render_card_messages(rows, max_widgets=MAX_CARD_WIDGETS, max_bytes=MAX_CARD_BYTES,
+                         report_date=None):
+    """Split the change set into cardsV2 messages bounded by widget count and size"""
+    header = build_header(rows, report_date)
+    title = header.splitlines()[0]
+    pages = []
+    current = []
+    size = 0
+    for row in rows:
+        widget = _card_widget(row)
+        widget_size = len(json.dumps(widget, ensure_ascii=False).encode('utf-8'))
+        if current and (len(current) >= max_widgets or size + widget_size > max_bytes - 1000):
+            pages.append(current)
+            current, size = [], 0
+        current.append(widget)
+        size += widget_size
+
+    if current:
+        pages.append(current)
+
+    messages = [{'text': header + f"\n{len(pages)} card(s) in this thread"}]
+    for number, widgets in enumerate(pages, 1):
+        messages.append(_card_message(title, f"Page {number}/{len(pages)}", widgets,
+                                      f"ter-page-{number}"))
+    return messages
+
+
+def render_anomaly_message(anomalies, max_chars=MAX_MESSAGE_CHARS):
+    """Render the day's top anomalies (ter_anomalies.detect_anomalies) as one text message"""
+    from .ter_anomalies import format_anomaly_line
+
+    lines = [f"⚠️ {len(anomalies)} unusual TER change(s)"]
+    size = len(lines[0])
+    for row in anomalies.to_dict('records'):
+        line = format_anomaly_line(row)
+        if size + len(line) + 1 > max_chars - 20:
+            lines.append('…')
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def render_messages(rows, fmt='text', report_date=None, anomalies=None, **limits):
+    """Render the change set into message payloads for the requested format
+
+    A non-empty anomalies frame adds an alert message right after the header.
+    """
+    if fmt == 'card':
+        messages = render_card_messages(rows, report_date=report_date, **limits)
+    else:
+        texts = render_text_messages(rows, report_date=report_date, **limits)
+        messages = [{'text': text} for text in texts]
+    if anomalies is not None and len(anomalies) > 0:
+        messages.insert(1, {'text': render_anomaly_message(anomalies)})
+    return messages
+
+
+def create_session(retries=5, backoff_factor=1.0, pool_size=10):
+    """Create a pooled requests session that retries POSTs with backoff and honours Retry-After
+
+    Only the statuses in RETRY_STATUSES are retried. A connection or read error
+    can come after Google Chat accepted the message, and posting it again would
+    show it twice, so those fail the send instead.
+    """
+    retry_kwargs = dict(
+        total=retries,
+        connect=0,
+        read=0,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        retry = Retry(allowed_methods=frozenset(['POST']), **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        retry = Retry(method_whitelist=frozenset(['POST']), **retry_kwargs)
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Content-Type': 'application/json; charset=UTF-8'})
+    return session
+
+
+def _thread_url(webhook_url):
+    """Add the reply option so messages sharing a threadKey land in one thread"""
+    parts = urlsplit(webhook_url)
+    query = dict(parse_qsl(parts.query))
+    query['messageReplyOption'] = THREAD_REPLY_OPTION
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def send_messages(webhook_url, messages, thread_key=None, session=None, timeout=30,
+                  min_interval=0.0):
+    """Post messages to one webhook in order, keeping them in a single thread"""
+    own_session = session is None
+    session = session or create_session()
+    url = _thread_url(webhook_url) if thread_key else webhook_url
+    sent = 0
+    try:
+        for message in messages:
+            payload = dict(message)
+            if thread_key:
+                payload['thread'] = {'threadKey': thread_key}
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            response = session.post(url, data=body, timeout=timeout)
+            if response.status_code != 200:
+                logger.error(f"Webhook returned HTTP {response.status_code}: {response.text[:200]}")
+                break
+            sent += 1
+            if min_interval:
+                time.sleep(min_interval)
+    except requests.RequestException as e:
+        logger.error(f"Error sending notification: {e}")
+    finally:
+        if own_session:
+            session.close()
+    logger.info(f"Sent {sent}/{len(messages)} message(s) to webhook")
+    return sent
+
+
+def fan_out(webhook_urls, messages, thread_key=None, max_workers=4, **kwargs):
+    """Send the same messages to several webhooks in parallel over one shared session"""
+    session = create_session(pool_size=max(max_workers, 1))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {url: executor.submit(send_messages, url, messages, thread_key, session,
+                                            **kwargs)
+                       for url in webhook_urls}
+            return {url: future.result() for url, future in futures.items()}
+    finally:
+        session.close()
+
+
+def notify_changes(webhook_urls, regular_df=None, direct_df=None, fmt='text', report_date=None,
+                   anomalies=None, **kwargs):
+    """Render today's change set and deliver it to every configured webhook"""
+    if isinstance(webhook_urls, str):
+        webhook_urls = [webhook_urls]
+    report_date = report_date or datetime.now().strftime('%Y-%m-%d')
+    rows = build_change_rows(regular_df, direct_df)
+    messages = render_messages(rows, fmt=fmt, report_date=report_date, anomalies=anomalies)
+    return fan_out(webhook_urls, messages, thread_key=f"amfi-ter-{report_date}", **kwargs)
+
+
+def latest_change_file(output_dir, plan):
+    """Pick the most recent change file for a plan, preferring dated files
+
+    Files in any registered sink format count (see ter_sinks.EXTENSIONS); when one
+    date was written in several formats, the earlier registered format wins.
+    """
+    output_dir = Path(output_dir)
+    prefix = f'{plan}_Plan_TER_Changes'
+    order = {fmt: rank for rank, fmt in enumerate(EXTENSIONS)}
+    candidates = []
+    for path in output_dir.glob(f'{prefix}*'):
+        stem, fmt = split_extension(path.name)
+        if fmt is None:
+            continue
+        if stem == prefix:
+            candidates.append(('', -order[fmt], path))
+        elif stem.startswith(f'{prefix}_'):
+            candidates.append((stem[len(prefix) + 1:], -order[fmt], path))
+    return max(candidates)[2] if candidates else None
+
+
+class LocalWebhook:
+    """In-process Google Chat webhook stand-in that records payloads for testing
+
+    Pass fail_first=N to answer the first N requests with HTTP 429.
+    """
+
+    def __init__(self, fail_first=0, retry_after=0):
+        self.payloads = []
+        self.requests = []
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/spaces/LOCAL/messages?key=test"
+
+    def _handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with webhook._lock:
+                    webhook.requests.append(self.path)
+                    failing = webhook.fail_first > 0
+                    if failing:
+                        webhook.fail_first -= 1
+                    else:
+                        webhook.payloads.append(json.loads(body.decode('utf-8')))
+                status = 429 if failing else 200
+                self.send_response(status)
+                if failing:
+                    self.send_header('Retry-After', str(webhook.retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    """Send the latest change files in output/ to Google Chat"""
+    parser = argparse.ArgumentParser(description='Send AMFI TER changes to Google Chat')
+    parser.add_argument('--webhook', action='append', default=[],
+                        help='Webhook URL (repeatable; defaults to GOOGLE_CHAT_WEBHOOK_URL, '
+                             'comma separated)')
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--format', choices=['text', 'card'], default='text')
+    parser.add_argument('--subscriptions', default=None,
+                        help='Subscription registry JSON for per-team filtered alerts')
+    parser.add_argument('--dry-run', action='store_true', help='Print messages instead of sending')
+    args = parser.parse_args(argv)
+
+    configured = os.environ.get('GOOGLE_CHAT_WEBHOOK_URL', '').split(',')
+    webhooks = args.webhook or [url.strip() for url in configured if url.strip()]
+
+    frames = {}
+    for plan in ('Regular', 'Direct'):
+        path = latest_change_file(args.output_dir, plan)
+        frames[plan] = read_artifact(path) if path else None
+        logger.info(f"{plan} Plan changes: {path or 'not found'}")
+
+    anomalies = None
+    if frames['Regular'] is not None and frames['Direct'] is not None:
+        from .ter_analysis import compare_plan_changes
+        from .ter_anomalies import detect_anomalies
+
+        anomalies = detect_anomalies(compare_plan_changes(frames['Regular'], frames['Direct']))
+
+    rows = build_change_rows(frames['Regular'], frames['Direct'])
+    messages = render_messages(rows, fmt=args.format, anomalies=anomalies)
+    report_date = datetime.now().strftime('%Y-%m-%d')
+
+    if args.subscriptions:
+        from .ter_subscriptions import SubscriptionIndex, load_subscriptions, notify_subscribers
+
+        index = SubscriptionIndex(load_subscriptions(args.subscriptions))
+        if args.dry_run:
+            for name, matched in index.route(rows).items():
+                print(f"{name}: {len(matched)} matching changes")
+        else:
+            notify_subscribers(index, rows, report_date=report_date)
+
+    if args.dry_run or not webhooks:
+        if not webhooks:
+            logger.warning("No webhook configured, printing messages instead")
+        for message in messages:
+            print(json.dumps(message, ensure_ascii=False, indent=2))
+        return 0
+
+    results = fan_out(webhooks, messages, thread_key=f"amfi-ter-{report_date}")
+    return 0 if all(sent == len(messages) for sent in results.values()) else 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    raise SystemExit(main())
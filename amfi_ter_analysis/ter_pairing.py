@@ -0,0 +1,165 @@
+"""
+Regular <-> Direct plan pairing by scheme id
+Assigns every scheme a small integer id keyed by its normalized NSDL code (upper case,
+no whitespace), falling back to its normalized name only when a record has no code.
+Plan change sets are then joined on the integer id instead of on scheme-name strings,
+which are duplicated and inconsistently cased across files. The id assignments can
+be kept in a file in the history directory so ids stay stable across runs.
+"""
+
+import os
+import pickle
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .ter_search import name_tokens
+
+logger = logging.getLogger(__name__)
+
+PAIRING_FILE = '.ter_pairing.pkl'
+PAIRING_VERSION = 1
+PLAN_WORDS = frozenset({'regular', 'direct'})
+
+
+def code_keys(codes):
+    """Normalized NSDL codes ('' for missing ones)"""
+    codes = pd.Series(codes, dtype=object)
+    keys = codes.where(codes.notna(), '').astype(str).str.upper()
+    keys = keys.str.replace(r'\s+', '', regex=True)
+    return keys.where(~keys.isin(('NAN', 'NONE')), '').to_numpy(dtype=object)
+
+
+def name_key(name):
+    """Normalized scheme name: lower-case words without punctuation, noise or plan words"""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ''
+    return ' '.join(token for token in name_tokens(name) if token not in PLAN_WORDS)
+
+
+class PairingIndex:
+    """Scheme id registry: normalized code -> id, and name -> id for code-less records"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.codes = []
+        self.names = []
+        self._by_code = {}
+        self._by_name = {}
+        self._dirty = False
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != PAIRING_VERSION:
+                return
+            self.codes, self.names = data['codes'], data['names']
+            self._by_code, self._by_name = data['by_code'], data['by_name']
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable pairing index {self.path}: {e}")
+
+    def save(self, path=None):
+        """Write the id assignments (only when they changed); returns the path or None"""
+        path = Path(path) if path else self.path
+        if path is None or not self._dirty:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': PAIRING_VERSION, 'codes': self.codes, 'names': self.names,
+                'by_code': self._by_code, 'by_name': self._by_name}
+        tmp = path.with_name(f"{path.name}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._dirty = False
+        return path
+
+    # Ids
+
+    def _new_id(self, code, name, key):
+        scheme_id = len(self.codes)
+        self.codes.append(code or None)
+        self.names.append(name)
+        if code:
+            self._by_code[code] = scheme_id
+        if key and key not in self._by_name:
+            self._by_name[key] = scheme_id
+        self._dirty = True
+        return scheme_id
+
+    def ids(self, codes, names=None):
+        """Integer scheme id for every record, registering schemes seen for the first time"""
+        keys = code_keys(codes)
+        names = np.asarray(names if names is not None else [None] * len(keys), dtype=object)
+        get = self._by_code.get
+        ids = np.fromiter((get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        for i in np.flatnonzero(ids < 0):
+            code, name = keys[i], names[i]
+            if code:
+                scheme_id = self._by_code.get(code)
+                if scheme_id is None:
+                    scheme_id = self._new_id(code, name, name_key(name))
+            else:
+                key = name_key(name)
+                scheme_id = self._by_name.get(key) if key else None
+                if scheme_id is None:
+                    scheme_id = self._new_id('', name, key)
+            ids[i] = scheme_id
+        return ids
+
+    def frame_ids(self, frame):
+        """Scheme ids for a frame with 'NSDL Scheme Code' and/or 'Scheme Name' columns"""
+        codes = frame['NSDL Scheme Code'] if 'NSDL Scheme Code' in frame else [None] * len(frame)
+        names = frame['Scheme Name'] if 'Scheme Name' in frame else None
+        return self.ids(codes, names)
+
+    # Joins
+
+    def pair(self, regular, direct, how='outer', suffixes=('_Regular', '_Direct')):
+        """Join two plan frames on scheme id (one row per scheme, first record wins)
+
+        Rows are sorted by code, then name. Returns 'Scheme ID', 'NSDL Scheme Code' and
+        'Scheme Name' (Regular side first, then Direct) followed by the remaining columns
+        of both frames; columns present on both sides get the suffixes, as with
+        DataFrame.merge.
+        """
+        sides = []
+        for frame in (regular, direct):
+            frame = frame.assign(**{'Scheme ID': self.frame_ids(frame)})
+            sides.append(frame.drop_duplicates(subset=['Scheme ID'], keep='first'))
+        left, right = sides
+        keys = [col for col in ('NSDL Scheme Code', 'Scheme Name') if col in left or col in right]
+        merged = left.merge(right, on='Scheme ID', how=how, suffixes=suffixes)
+
+        # Identity columns: Regular side first, then the Direct side
+        for col in keys:
+            if col in left and col in right:
+                first, second = (f'{col}{suffix}' for suffix in suffixes)
+                values = merged[first].fillna(merged[second])
+                merged = merged.drop(columns=[first, second]).assign(**{col: values})
+        rest = [col for col in merged.columns if col not in keys and col != 'Scheme ID']
+        merged = merged[['Scheme ID'] + keys + rest]
+        # Ids depend on when a scheme was first seen, so order rows by code and name instead
+        if keys:
+            merged = merged.sort_values(keys, kind='mergesort')
+        return merged.reset_index(drop=True)
+
+
+def pairing_index(history_dir='history'):
+    """PairingIndex kept in history_dir (PAIRING_FILE), so ids follow the snapshots"""
+    return PairingIndex(os.path.join(history_dir, PAIRING_FILE))
+
+
+def pair_plans(regular, direct, how='outer', suffixes=('_Regular', '_Direct'), index=None):
+    """Join Regular and Direct plan frames on scheme id (see PairingIndex.pair)"""
+    index = index if index is not None else PairingIndex()
+    return index.pair(regular, direct, how, suffixes)
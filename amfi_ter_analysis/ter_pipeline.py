@@ -0,0 +1,555 @@
+"""
+In-process TER analysis pipeline
+Stages hand DataFrames to each other in memory (fetch -> parse -> normalize -> diff ->
+compare -> classify -> render -> notify); writing artifacts is an optional sink stage.
+The DAG runner memoizes stage outputs by input fingerprint and runs independent
+stages concurrently.
+"""
+
+import io
+import os
+import json
+import pickle
+import hashlib
+import time
+import logging
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from . import ter_metrics
+from .ter_logging import log_event
+from .ter_history import HistoryStore
+from .ter_analysis import (
+    fetch_ter_workbook,
+    read_ter_file,
+    normalize_ter_frame,
+    diff_ter_frames,
+    compare_plan_changes,
+    classify_changes
+)
+
+logger = logging.getLogger(__name__)
+
+# A stage reads named values from the pipeline context and publishes its outputs
+# back under the names in `outputs`. Values are passed by reference, never copied.
+# Stages with cacheable=False always run and have their outputs fingerprinted by
+# content: fetch, whose inputs do not determine the workbook it returns, and the
+# notify and sink stages, whose side effects a cache hit would silently skip.
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs', 'cacheable'], defaults=(True,))
+
+# Bump to invalidate every cached stage output after changing stage logic
+CACHE_VERSION = 1
+CACHE_DIR = '.ter_cache'
+BASELINE_PATH = 'baseline_ter_data'
+# Messages delivered per report date and webhook, so a rerun does not resend them
+NOTIFY_LOG = '.ter_notified.json'
+NOTIFY_LOG_DAYS = 31
+
+
+class PipelineError(RuntimeError):
+    """Raised when a stage cannot produce its outputs"""
+
+
+def run_pipeline(stages, context):
+    """Run stages in order against a shared context dict and return the context"""
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in context]
+        if missing:
+            raise PipelineError(f"Stage '{stage.name}' is missing inputs: {', '.join(missing)}")
+
+        with ter_metrics.stage(stage.name):
+            result = stage.func(*[context[name] for name in stage.inputs])
+        if len(stage.outputs) == 1:
+            result = (result,)
+        context.update(zip(stage.outputs, result))
+        logger.info(f"Stage '{stage.name}' complete")
+    return context
+
+
+def fingerprint(value):
+    """Stable content hash of a context value"""
+    digest = hashlib.sha256()
+    if value is None:
+        digest.update(b'none')
+    elif isinstance(value, (bytes, bytearray)):
+        digest.update(value)
+    elif isinstance(value, pd.DataFrame):
+        digest.update(json.dumps([str(c) for c in value.columns]).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(pd.util.hash_pandas_object(value, index=False).values.tobytes())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def downstream_of(stages, names):
+    """Names of the given stages and every stage that depends on them"""
+    affected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        produced = {output for stage in stages if stage.name in affected for output in stage.outputs}
+        for stage in stages:
+            if stage.name not in affected and produced.intersection(stage.inputs):
+                affected.add(stage.name)
+                changed = True
+    return affected
+
+
+def _cache_key(stage, input_prints):
+    """Memo key for a stage from its name, cache version and input fingerprints"""
+    payload = json.dumps([CACHE_VERSION, stage.name, stage.outputs, input_prints])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def _load_cached(cache_dir, stage, key):
+    """Return cached outputs for a stage key, or None"""
+    path = Path(cache_dir) / f"{stage.name}-{key}.pkl"
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+        return None
+
+
+def _store_cached(cache_dir, stage, key, outputs):
+    """Persist stage outputs atomically under their memo key"""
+    path = Path(cache_dir) / f"{stage.name}-{key}.pkl"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    for stale in path.parent.glob(f"{stage.name}-*.pkl"):
+        if stale != path:
+            stale.unlink()
+
+
+def _row_count(outputs):
+    """Rows across the DataFrame outputs of a stage (None when there are none)"""
+    frames = [value for value in outputs if isinstance(value, pd.DataFrame)]
+    return sum(len(frame) for frame in frames) if frames else None
+
+
+def run_dag(stages, context, cache_dir=CACHE_DIR, force=(), max_workers=4):
+    """Run stages as a DAG, reusing cached outputs whose input fingerprints are unchanged
+
+    A stage becomes ready once every input is in the context; ready stages run
+    concurrently. `force` names stages to rerun along with everything downstream.
+    Only the latest entry per stage is kept in cache_dir. Returns the context, with
+    per-stage 'ran' / 'cached' outcomes under context['stage_status'].
+    """
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    for stage in stages:
+        unknown = [name for name in stage.inputs if name not in producers and name not in context]
+        if unknown:
+            raise PipelineError(f"Stage '{stage.name}' is missing inputs: {', '.join(unknown)}")
+
+    forced = downstream_of(stages, force)
+    # Fingerprints only feed cache keys; without a cache they just mark what is available
+    prints = {name: fingerprint(value) if cache_dir else None for name, value in context.items()}
+    status = {}
+    pending = list(stages)
+    running = {}
+
+    def execute(stage, key):
+        started = time.perf_counter()
+        outputs, outcome = _execute(stage, key)
+        log_event(logger, f"Stage '{stage.name}' {outcome}", stage=stage.name, status=outcome,
+                  duration=round(time.perf_counter() - started, 6), rows=_row_count(outputs))
+        return outputs, outcome
+
+    def _execute(stage, key):
+        with ter_metrics.stage(stage.name):
+            reuse = cache_dir and key is not None and stage.name not in forced
+            outputs = _load_cached(cache_dir, stage, key) if reuse else None
+            if outputs is not None:
+                ter_metrics.incr('cache_hits')
+                return outputs, 'cached'
+            ter_metrics.incr('cache_misses')
+            result = stage.func(*[context[name] for name in stage.inputs])
+            outputs = (result,) if len(stage.outputs) == 1 else tuple(result)
+            if key is not None and cache_dir:
+                _store_cached(cache_dir, stage, key, outputs)
+            return outputs, 'ran'
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stage in [s for s in pending if all(name in prints for name in s.inputs)]:
+                pending.remove(stage)
+                key = (_cache_key(stage, [prints[name] for name in stage.inputs])
+                       if stage.cacheable and cache_dir else None)
+                running[executor.submit(execute, stage, key)] = (stage, key)
+
+            if not running:
+                raise PipelineError(f"Unresolvable stages: {', '.join(s.name for s in pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                outputs, status[stage.name] = future.result()
+                context.update(zip(stage.outputs, outputs))
+                for name, value in zip(stage.outputs, outputs):
+                    if not cache_dir:
+                        prints[name] = None
+                    else:
+                        prints[name] = fingerprint(value) if key is None else f"{key}:{name}"
+
+    context['stage_status'] = status
+    return context
+
+
+def fetch_stage(month, year):
+    """Fetch the month's workbook into memory"""
+    content = fetch_ter_workbook(month, year)
+    if content is None:
+        raise PipelineError(f"Could not download TER workbook for {month:02d}-{year}")
+    return content
+
+
+def parse_stage(workbook):
+    """Parse workbook bytes without touching disk"""
+    df = read_ter_file(io.BytesIO(workbook))
+    if df is None:
+        raise PipelineError("Could not parse TER workbook")
+    ter_metrics.incr('rows_parsed', len(df))
+    return df
+
+
+def normalize_stage(raw):
+    """Reduce the parsed workbook to one row per scheme"""
+    current = normalize_ter_frame(raw)
+    ter_metrics.incr('rows_normalized', len(current))
+    return current
+
+
+def diff_stage(previous, current, change_date, shards=None, shard_by='amc'):
+    """Diff the previous and current normalized snapshots for both plans
+
+    With shards, large snapshots are diffed in a process pool (see ter_sharding).
+    """
+    if previous is None:
+        logger.info("No previous snapshot, nothing to diff against")
+        previous = current.iloc[0:0]
+    if shards:
+        from .ter_sharding import sharded_diff
+
+        regular, direct = sharded_diff(previous, current, ('Regular', 'Direct'), change_date,
+                                       shards=shards, by=shard_by)
+    else:
+        regular = diff_ter_frames(previous, current, 'Regular', change_date)
+        direct = diff_ter_frames(previous, current, 'Direct', change_date)
+    logger.info(f"Regular Plan: {len(regular)} changes, Direct Plan: {len(direct)} changes")
+    ter_metrics.incr('rows_changed', len(regular) + len(direct))
+    return regular, direct
+
+
+def anomaly_stage(comprehensive, history_dir, revision_history=None, history_version=None):
+    """Score the day's changes against peers and each scheme's past revisions
+
+    revision_history is a precomputed revision_volatility frame; without one it is
+    read from history_dir. history_version (HistoryStore.data_version) is only an
+    input so the cached scores are invalidated when the history contents change.
+    """
+    from .ter_anomalies import detect_anomalies, revision_volatility
+
+    history = revision_history
+    if (history is None and comprehensive is not None and len(comprehensive) > 0
+            and Path(history_dir).is_dir()):
+        try:
+            history = revision_volatility(history_dir)
+        except Exception as e:
+            logger.warning(f"Scoring anomalies without revision history: {e}")
+    return detect_anomalies(comprehensive, history)
+
+
+def render_stage(regular_changes, direct_changes, comparison, anomalies, report_date):
+    """Render notification messages and the run summary"""
+    from .ter_notifier import build_change_rows, render_messages
+
+    rows = build_change_rows(regular_changes, direct_changes)
+    messages = render_messages(rows, report_date=report_date, anomalies=anomalies)
+    summary = {
+        'date': report_date,
+        'regular_count': len(regular_changes),
+        'direct_count': len(direct_changes),
+        'comparison_count': len(comparison),
+        'anomaly_count': len(anomalies)
+    }
+    return messages, summary
+
+
+def _load_notify_log(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_notify_log(path, log):
+    """Write the delivery log atomically, keeping the newest NOTIFY_LOG_DAYS report dates"""
+    log = {date: log[date] for date in sorted(log)[-NOTIFY_LOG_DAYS:]}
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(log, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def notify_stage(messages, webhooks, report_date, resend=False, notify_log=NOTIFY_LOG):
+    """Send rendered messages to the configured webhooks
+
+    Deliveries are recorded in notify_log by report date and a digest of the webhook
+    and messages. A webhook that already received the same messages for the report
+    date is skipped unless `resend` is set; a revised change set renders different
+    messages and is sent.
+    """
+    if not webhooks:
+        logger.info("No webhooks configured, skipping notification")
+        return {}
+    from .ter_notifier import fan_out
+
+    log = _load_notify_log(notify_log) if notify_log else {}
+    delivered = set(log.get(report_date, []))
+    digests = {url: hashlib.sha256(json.dumps([url, messages], default=str).encode('utf-8')).hexdigest()[:16]
+               for url in webhooks}
+    targets = [url for url in webhooks if resend or digests[url] not in delivered]
+    if len(targets) < len(webhooks):
+        logger.info(f"{len(webhooks) - len(targets)} webhook(s) already received these messages for "
+                    f"{report_date}; pass resend to send them again")
+    if not targets:
+        return {}
+
+    sent = fan_out(targets, messages, thread_key=f"amfi-ter-{report_date}")
+    ter_metrics.incr('messages_sent', sum(sent.values()))
+    if notify_log:
+        delivered.update(digests[url] for url, count in sent.items() if count == len(messages))
+        log[report_date] = sorted(delivered)
+        _save_notify_log(notify_log, log)
+    return sent
+
+
+def sink_stage(regular_changes, direct_changes, comprehensive, significant, anomalies, current,
+               report_date, output_dir, history_dir, formats, baseline_path=BASELINE_PATH,
+               now=None):
+    """Write the run's artifacts to disk in their configured formats, stamped with `now`
+
+    analysis_summary.json is written after the run by ter_metrics.export, so it
+    carries the metrics of every stage including this one. The day's comparison rows
+    are also folded into the aggregate cube (output/TER_Cube.json) and its changes
+    into the spread table (output/TER_Spread.pkl).
+    """
+    from .ter_sinks import write_artifacts
+    from .ter_cube import CUBE_FILE, update_cube_file
+    from .ter_spread import SPREAD_FILE, update_spread_file
+
+    output_dir = Path(output_dir)
+
+    artifacts = {
+        'comprehensive': ('comparison', comprehensive, output_dir / 'TER_Comparison_Comprehensive'),
+        'significant': ('comparison', significant.drop(columns=['Fund_Category']),
+                        output_dir / 'TER_Comparison_Significant'),
+        'baseline': ('baseline', current, Path(baseline_path)),
+    }
+    for plan, changes in (('Regular', regular_changes), ('Direct', direct_changes)):
+        if len(changes) > 0:
+            artifacts[f'{plan.lower()}_changes'] = (
+                'changes', changes, output_dir / f"{plan}_Plan_TER_Changes_{report_date}")
+    if len(anomalies) > 0:
+        artifacts['anomalies'] = ('comparison', anomalies, output_dir / f"TER_Anomalies_{report_date}")
+    written = write_artifacts(artifacts, formats, now=now)
+
+    written.append(update_cube_file(comprehensive, report_date, output_dir / CUBE_FILE))
+    written.append(update_spread_file(regular_changes, direct_changes, current, report_date,
+                                      output_dir / SPREAD_FILE, history_dir))
+    written.append(save_snapshot(current, history_dir, report_date))
+    return written
+
+
+DAILY_STAGES = [
+    Stage('fetch', fetch_stage, ('month', 'year'), ('workbook',), cacheable=False),
+    Stage('parse', parse_stage, ('workbook',), ('raw',)),
+    Stage('normalize', normalize_stage, ('raw',), ('current',)),
+    Stage('diff', diff_stage, ('previous', 'current', 'change_date'),
+          ('regular_changes', 'direct_changes')),
+    Stage('compare', compare_plan_changes, ('regular_changes', 'direct_changes'), ('comparison',)),
+    Stage('classify', classify_changes, ('comparison', 'threshold'), ('comprehensive', 'significant')),
+    Stage('anomalies', anomaly_stage,
+          ('comprehensive', 'history_dir', 'revision_history', 'history_version'), ('anomalies',)),
+    Stage('render', render_stage,
+          ('regular_changes', 'direct_changes', 'comparison', 'anomalies', 'report_date'),
+          ('messages', 'summary')),
+    Stage('notify', notify_stage, ('messages', 'webhooks', 'report_date', 'resend'), ('sent',),
+          cacheable=False),
+]
+
+SINK_STAGE = Stage(
+    'sink', sink_stage,
+    ('regular_changes', 'direct_changes', 'comprehensive', 'significant', 'anomalies', 'current',
+     'report_date', 'output_dir', 'history_dir', 'formats', 'baseline_path', 'now'),
+    ('written',),
+    cacheable=False
+)
+
+
+def save_snapshot(frame, history_dir, day):
+    """Store a snapshot as history/TER_Data_MM-YYYY_YYYYMMDD.pkl and return its path"""
+    day = datetime.strptime(str(day)[:10], '%Y-%m-%d')
+    history_dir = Path(history_dir)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    path = history_dir / f"TER_Data_{day.month:02d}-{day.year}_{day.strftime('%Y%m%d')}.pkl"
+    frame.to_pickle(path)
+    return path
+
+
+def snapshot_date(path):
+    """Date stamp (YYYYMMDD) at the end of a history snapshot file name"""
+    return Path(path).stem.rsplit('_', 1)[-1]
+
+
+def load_snapshot_file(path):
+    """Load a workbook, history pickle or written snapshot and normalize it"""
+    suffix = ''.join(Path(path).suffixes[-2:]) if str(path).endswith('.zst') else Path(path).suffix
+    if suffix in ('.xlsx', '.xls'):
+        raw = read_ter_file(path)
+        if raw is None:
+            raise PipelineError(f"Could not read workbook {path}")
+    elif suffix == '.pkl':
+        raw = pd.read_pickle(path)
+    else:
+        from .ter_sinks import read_artifact
+
+        raw = read_artifact(path)
+    return normalize_ter_frame(raw)
+
+
+def find_snapshot(history_dir, date):
+    """Path of the newest history snapshot taken on or before a date (YYYY-MM-DD or YYYYMMDD)"""
+    stamp = str(date).replace('-', '')
+    snapshots = [path for path in Path(history_dir).glob('TER_Data_*.pkl') if snapshot_date(path) <= stamp]
+    return max(snapshots, key=snapshot_date) if snapshots else None
+
+
+def load_previous_snapshot(history_dir='history', before=None):
+    """Load the newest normalized history snapshot, optionally strictly before a YYYYMMDD stamp"""
+    # Newest stamp wins, then the later file name (as in HistoryStore.snapshots)
+    candidates = [(snapshot_date(path), path.name, path)
+                  for path in Path(history_dir).glob('TER_Data_*.pkl')]
+    if before is not None:
+        candidates = [candidate for candidate in candidates if candidate[0] < before]
+    if not candidates:
+        return None
+    path = max(candidates)[2]
+    logger.info(f"Previous snapshot: {path}")
+    return normalize_ter_frame(pd.read_pickle(path))
+
+
+def daily_run_inputs(now=None, month=None, year=None, report_date=None, previous=None,
+                     history_dir='history'):
+    """Month, year, report date and baseline snapshot of a daily run as of `now`
+
+    The workbook month follows the clock, so the first run of a month fetches the
+    new month's workbook. Unless `previous` is given, the baseline is the newest
+    history snapshot taken before the report date, which on that first run is the
+    previous month's last snapshot.
+    """
+    today = now or datetime.now()
+    report_date = report_date or today.strftime('%Y-%m-%d')
+    if previous is None:
+        previous = load_previous_snapshot(history_dir, before=report_date.replace('-', ''))
+    return {
+        'month': month or today.month,
+        'year': year or today.year,
+        'report_date': report_date,
+        'previous': previous,
+    }
+
+
+def run_daily_pipeline(month=None, year=None, previous=None, workbook=None, write=True,
+                       output_dir='output', history_dir='history', threshold=0.02,
+                       report_date=None, change_date=None, webhooks=None, formats=None,
+                       cache_dir=CACHE_DIR, force=(), max_workers=4, metrics_dir='metrics',
+                       current=None, now=None, baseline_path=BASELINE_PATH,
+                       summary_file='analysis_summary.json', revision_history=None, resend=False):
+    """Run the full daily analysis in memory and return the pipeline context
+
+    Pass `workbook` (bytes) to skip the download, or `current` (a normalized frame) to
+    skip fetching and parsing too, and `previous` (a normalized frame) to diff against
+    something other than the newest history snapshot. `now` replaces the wall clock
+    for the default month, year and report date, and `revision_history` (see
+    anomaly_stage) replaces reading the history for anomaly scoring. Stages whose
+    inputs match the cached run are skipped; pass cache_dir=None to disable caching.
+    The notify and sink stages always run, but messages already delivered for the
+    report date are only sent again with resend=True.
+    `formats` maps artifact kinds to output formats (see ter_sinks.parse_formats).
+    When writing, the summary and stage metrics go to analysis_summary.json and
+    Prometheus / OpenMetrics files under metrics_dir (None to skip those files).
+    """
+    context = daily_run_inputs(now, month, year, report_date, previous, history_dir)
+    context.update({
+        'now': now,
+        'change_date': change_date,
+        'threshold': threshold,
+        'output_dir': output_dir,
+        'history_dir': history_dir,
+        'webhooks': list(webhooks or []),
+        'formats': formats,
+        'baseline_path': baseline_path,
+        'revision_history': revision_history,
+        'history_version': HistoryStore(history_dir).data_version() if cache_dir else None,
+        'resend': resend,
+    })
+    stages = list(DAILY_STAGES)
+    if current is not None:
+        context['current'] = current
+        stages = [stage for stage in stages if stage.name not in ('fetch', 'parse', 'normalize')]
+    elif workbook is not None:
+        context['workbook'] = workbook
+        stages = stages[1:]
+    if write:
+        stages.append(SINK_STAGE)
+    context = run_dag(stages, context, cache_dir=cache_dir, force=force, max_workers=max_workers)
+    if write:
+        ter_metrics.export(metrics_dir, summary_file=summary_file, summary=context['summary'])
+    return context
+
+
+def main(argv=None):
+    """Run the daily pipeline from the command line"""
+    stage_names = [stage.name for stage in DAILY_STAGES + [SINK_STAGE]]
+    parser = argparse.ArgumentParser(description='Run the AMFI TER daily pipeline')
+    parser.add_argument('--force', action='append', default=[], choices=stage_names,
+                        help='Rerun this stage and everything downstream of it (repeatable)')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the stage cache')
+    parser.add_argument('--no-write', action='store_true', help='Skip the file sink stage')
+    parser.add_argument('--resend', action='store_true',
+                        help='Send notifications even if the same messages were already sent today')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--formats', default=os.environ.get('TER_OUTPUT_FORMATS'),
+                        help="Output formats, e.g. 'csv,parquet' or 'comparison=parquet;baseline=csv.zst'")
+    args = parser.parse_args(argv)
+
+    webhooks = [url.strip() for url in os.environ.get('GOOGLE_CHAT_WEBHOOK_URL', '').split(',')
+                if url.strip()]
+    from .ter_sinks import parse_formats
+
+    context = run_daily_pipeline(write=not args.no_write, webhooks=webhooks, force=args.force,
+                                 formats=parse_formats(args.formats), resend=args.resend,
+                                 cache_dir=None if args.no_cache else args.cache_dir)
+    for name, outcome in context['stage_status'].items():
+        print(f"{name:10s} {outcome}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    raise SystemExit(main())
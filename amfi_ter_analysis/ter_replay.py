@@ -0,0 +1,179 @@
+"""
+Deterministic replay of the daily pipeline over stored history
+Feeds each stored snapshot, oldest first, through the same stage functions as a
+daily run (diff, compare, classify, anomalies and the sink's artifacts) with a
+simulated clock set to the snapshot's date, so past reports can be re-derived and
+month rollovers exercised without waiting for real days or touching the network.
+Outputs go to a separate root (replay/ by default) and the run's throughput is
+measured end to end.
+"""
+
+import time
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .ter_analysis import classify_changes, compare_plan_changes
+from .ter_cube import CUBE_FILE, TerCube
+from .ter_history import HistoryStore
+from .ter_pipeline import daily_run_inputs, diff_stage
+from .ter_sinks import write_artifacts
+from .ter_spread import SPREAD_FILE, SpreadTable
+
+logger = logging.getLogger(__name__)
+
+REPLAY_ROOT = 'replay'
+
+ReplayResult = namedtuple('ReplayResult', ['days', 'schemes', 'changes', 'seconds', 'summaries'])
+
+
+class ReplayClock:
+    """Injectable clock: calling it returns the simulated time instead of datetime.now()
+
+    Usable wherever a `clock` or `now` is accepted (TerDaemon, run_daily_pipeline,
+    the automation scripts' main / analyze_daily).
+    """
+
+    def __init__(self, start=None):
+        self.now = start or datetime(2000, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+    def set(self, when):
+        """Jump to a datetime, date, Timestamp or YYYY-MM-DD string"""
+        if isinstance(when, str):
+            when = datetime.strptime(when[:10], '%Y-%m-%d')
+        elif not isinstance(when, datetime):
+            when = datetime(when.year, when.month, when.day)
+        self.now = when.to_pydatetime() if hasattr(when, 'to_pydatetime') else when
+        return self.now
+
+    def advance(self, **delta):
+        """Move forward by a timedelta given as keywords, e.g. advance(days=1)"""
+        self.now += timedelta(**delta)
+        return self.now
+
+
+def replay_history(history_dir='history', root=REPLAY_ROOT, start=None, end=None, write=True,
+                   threshold=0.02, formats=None, clock=None):
+    """Run the daily pipeline's stages once per stored snapshot dated start..end
+
+    Each day runs with the clock set to the snapshot date. As in a daily run
+    (ter_pipeline.daily_run_inputs), the clock picks the workbook month, so month
+    rollovers are logged and recorded in the summaries, and the baseline is the
+    newest stored snapshot before that date (the first stored snapshot when there
+    is no `start`). Changes are dated by each scheme's TER Date. Anomalies are
+    scored against a TrendPanel of the days before the one being replayed, kept in
+    memory and appended to as the replay advances.
+    The stage functions are called directly rather than through the DAG, and
+    messages are not rendered since nothing is sent or fetched.
+    When writing, each day's change files and anomalies go under root/output. The
+    cube and spread table (rebuilt up to the baseline day first) are updated in
+    memory, then saved once at the end. The comparisons and baseline, which a daily
+    run overwrites, are also written once, for the last day. Artifact metadata is
+    stamped with the clock, so replaying the same days twice writes identical files.
+    Returns a ReplayResult with the day, scheme and change counts, the wall time
+    and each day's summary.
+    """
+    from .ter_anomalies import detect_anomalies, revision_volatility
+    from .ter_trends import TrendPanel
+
+    store = HistoryStore(history_dir)
+    snapshots = store.snapshots(end=end)
+    if start is None:
+        first = 1
+    else:
+        start = datetime.strptime(str(start)[:10], '%Y-%m-%d')
+        first = next((i for i, (date, _) in enumerate(snapshots) if date >= start), len(snapshots))
+    if first >= len(snapshots):
+        logger.info("Nothing to replay")
+        return ReplayResult(0, 0, 0, 0.0, [])
+    clock = clock or ReplayClock()
+    output_dir = Path(root) / 'output'
+
+    started = time.perf_counter()
+    panel = TrendPanel()
+    cube = table = None
+    month = None
+    if first > 0:
+        if write:
+            # The spread table as it stood on the baseline day, updated daily from there
+            table = SpreadTable.from_history(history_dir, end=snapshots[first - 1][0])
+            cube = TerCube.load(output_dir / CUBE_FILE)
+        if first > 1:
+            panel = TrendPanel.from_history(history_dir, end=snapshots[first - 1][0])
+        else:
+            panel.append(snapshots[0][0], store.load(snapshots[0][1]))
+
+    schemes = changes = 0
+    summaries = []
+    for date, path in snapshots[first:]:
+        clock.set(date)
+        run = daily_run_inputs(clock(), history_dir=history_dir)
+        if (run['month'], run['year']) != month:
+            if month is not None:
+                logger.info(f"Month rolled over to {run['month']:02d}-{run['year']}")
+            month = (run['month'], run['year'])
+        current = store.load(path)
+        report_date = run['report_date']
+        regular, direct = diff_stage(run['previous'], current, None)
+        comparison = compare_plan_changes(regular, direct)
+        comprehensive, significant = classify_changes(comparison, threshold)
+        volatility = revision_volatility(panel=panel) if panel.dates else None
+        anomalies = detect_anomalies(comprehensive, volatility)
+        summary = {
+            'date': report_date,
+            'month': f"{run['month']:02d}-{run['year']}",
+            'regular_count': len(regular),
+            'direct_count': len(direct),
+            'comparison_count': len(comparison),
+            'anomaly_count': len(anomalies),
+        }
+        if write:
+            _write_day(output_dir, report_date, regular, direct, anomalies, formats, clock())
+            cube = cube if cube is not None else TerCube.load(output_dir / CUBE_FILE)
+            cube.update(comprehensive, report_date)
+            if table is None or not len(table):
+                table = SpreadTable()
+                table.apply_snapshot(current, report_date, batch=report_date)
+            else:
+                table.update(regular, direct, report_date, batch=report_date, snapshot=current)
+        summaries.append(summary)
+        schemes += len(current)
+        changes += summary['regular_count'] + summary['direct_count']
+        logger.info(f"Replayed {report_date}: Regular={summary['regular_count']}, "
+                    f"Direct={summary['direct_count']}")
+        panel.append(date, current)
+
+    if write and summaries:
+        write_artifacts({
+            'comprehensive': ('comparison', comprehensive,
+                              output_dir / 'TER_Comparison_Comprehensive'),
+            'significant': ('comparison', significant.drop(columns=['Fund_Category']),
+                            output_dir / 'TER_Comparison_Significant'),
+            'baseline': ('baseline', current, Path(root) / 'baseline_ter_data'),
+        }, formats, now=clock())
+        cube.save(output_dir / CUBE_FILE)
+        table.save(output_dir / SPREAD_FILE)
+
+    seconds = time.perf_counter() - started
+    days = len(summaries)
+    logger.info(f"Replayed {days} day(s), {schemes} scheme rows, {changes} changes in "
+                f"{seconds:.2f}s ({days / seconds if seconds else 0:.1f} days/s)")
+    return ReplayResult(days, schemes, changes, seconds, summaries)
+
+
+def _write_day(output_dir, report_date, regular, direct, anomalies, formats, now):
+    """The dated artifacts of one replayed day (what the sink keeps per report date)"""
+    artifacts = {}
+    for plan, plan_changes in (('Regular', regular), ('Direct', direct)):
+        if len(plan_changes) > 0:
+            artifacts[f'{plan.lower()}_changes'] = (
+                'changes', plan_changes, output_dir / f"{plan}_Plan_TER_Changes_{report_date}")
+    if len(anomalies) > 0:
+        artifacts['anomalies'] = ('comparison', anomalies,
+                                  output_dir / f"TER_Anomalies_{report_date}")
+    if artifacts:
+        write_artifacts(artifacts, formats, now=now)
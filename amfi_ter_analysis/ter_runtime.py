@@ -0,0 +1,25 @@
+"""
+Run-time setup for AMFI TER Analysis
+Working directories and log handlers are created when a run starts, never at import
+"""
+
+import os
+
+WORK_DIRS = ('downloads', 'output', 'history', 'logs')
+LOG_FILE = 'logs/ter_analysis.log'
+
+
+def ensure_directories(*dirs):
+    """Create the working directories used by a run (all of them by default)"""
+    for directory in dirs or WORK_DIRS:
+        os.makedirs(directory, exist_ok=True)
+
+
+def setup_logging(level=None, log_file=LOG_FILE, console_format='text'):
+    """Route logging through the queue-backed writer (see ter_logging) once per process
+
+    The level defaults to TER_LOG_LEVEL, or INFO.
+    """
+    from .ter_logging import configure_logging
+
+    configure_logging(level, log_file, console_format=console_format)
@@ -0,0 +1,180 @@
+"""
+Adaptive polling schedule for the TER daemon
+Learns when AMFI publishes new content from the daemon's own poll history, polls
+often around those windows, backs off while the content stays the same, keeps to a
+daily request budget and wakes up promptly at month boundaries (new workbook URL)
+"""
+
+import os
+import json
+import math
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_FILE = '.ter_daemon/schedule.json'
+
+# Outcomes (see ter_daemon) that mean the server had content we had not seen
+NEW_CONTENT = ('changed', 'no_changes')
+STABLE = ('not_modified', 'unchanged')
+
+DAY_SECONDS = 24 * 3600
+
+
+class AdaptiveSchedule:
+    """Poll-delay policy learned from past publication times
+
+    The day is split into bins of bin_minutes. Every poll that returns new content
+    adds a weight to its bin; weights decay with a half-life of half_life_days so the
+    schedule follows changes in AMFI's habits. Bins whose share of the weight is at
+    least hot_factor times the uniform share are hot windows, polled every
+    min_interval. Outside them the delay doubles after every stable poll, from
+    base_interval up to max_interval, but never sleeps past the next hot window or
+    month start. At most `budget` polls are made per calendar day; polls for the
+    rest of today's hot windows are reserved before cold polls are spent.
+    """
+
+    def __init__(self, path=SCHEDULE_FILE, budget=96, min_interval=300, base_interval=900,
+                 max_interval=6 * 3600, bin_minutes=30, half_life_days=30, hot_factor=2.0,
+                 max_events=500):
+        self.path = path
+        self.budget = budget
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.bin_minutes = bin_minutes
+        self.bins = (24 * 60) // bin_minutes
+        self.half_life_days = half_life_days
+        self.hot_factor = hot_factor
+        self.max_events = max_events
+
+        self.events = []          # ISO timestamps of polls that found new content
+        self.polls = {}           # YYYY-MM-DD -> polls made that day
+        self.backoff = 0
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self.events = data.get('events', [])
+                self.polls = data.get('polls', {})
+                self.backoff = data.get('backoff', 0)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable schedule file {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'events': self.events, 'polls': self.polls, 'backoff': self.backoff}, f,
+                      indent=2)
+        os.replace(tmp, self.path)
+
+    # Learning
+
+    def record(self, now, outcome):
+        """Account for one poll and learn from its outcome"""
+        day = now.strftime('%Y-%m-%d')
+        # Only today's counter matters for the budget
+        self.polls = {day: self.polls.get(day, 0) + 1}
+        if outcome in NEW_CONTENT:
+            self.events = (self.events + [now.isoformat(timespec='seconds')])[-self.max_events:]
+            self.backoff = 0
+        elif outcome in STABLE:
+            self.backoff += 1
+
+    def _bin(self, moment):
+        return (moment.hour * 60 + moment.minute) // self.bin_minutes
+
+    def weights(self, now):
+        """Decayed publication weight per time-of-day bin"""
+        weights = [0.0] * self.bins
+        for stamp in self.events:
+            moment = datetime.fromisoformat(stamp)
+            age_days = max((now - moment).total_seconds(), 0) / DAY_SECONDS
+            weights[self._bin(moment)] += 0.5 ** (age_days / self.half_life_days)
+        return weights
+
+    def hot_bins(self, now):
+        """Bins whose publication share is well above uniform"""
+        weights = self.weights(now)
+        total = sum(weights)
+        if not total:
+            return set()
+        cutoff = self.hot_factor * total / self.bins
+        return {index for index, weight in enumerate(weights) if weight >= cutoff}
+
+    # Scheduling
+
+    def _bin_start(self, now, index, day_offset=0):
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        midnight += timedelta(days=day_offset)
+        return midnight + timedelta(minutes=index * self.bin_minutes)
+
+    def seconds_to_next_hot(self, now, hot):
+        """Seconds until the next hot bin starts (inf when there are none)"""
+        current = self._bin(now)
+        for day_offset in (0, 1):
+            for index in sorted(hot):
+                if day_offset == 0 and index <= current:
+                    continue
+                return (self._bin_start(now, index, day_offset) - now).total_seconds()
+        return math.inf
+
+    def _seconds_to_month_start(self, now):
+        first = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        next_month = (first + timedelta(days=32)).replace(day=1)
+        return (next_month - now).total_seconds()
+
+    def _reserved_hot_polls(self, now, hot):
+        """Polls needed for the rest of today's hot windows at min_interval"""
+        seconds = 0.0
+        end_of_day = self._bin_start(now, 0, 1)
+        for index in hot:
+            start = max(self._bin_start(now, index), now)
+            end = min(self._bin_start(now, index) + timedelta(minutes=self.bin_minutes), end_of_day)
+            seconds += max((end - start).total_seconds(), 0)
+        return math.ceil(seconds / self.min_interval)
+
+    def next_delay(self, now, outcome):
+        """Seconds to wait before the next poll, given the outcome of the one just made"""
+        self.record(now, outcome)
+        hot = self.hot_bins(now)
+        used = self.polls.get(now.strftime('%Y-%m-%d'), 0)
+        remaining = self.budget - used
+        to_midnight = (self._bin_start(now, 0, 1) - now).total_seconds()
+        to_month = self._seconds_to_month_start(now)
+
+        if remaining <= 0:
+            delay = to_midnight
+        elif self._bin(now) in hot:
+            # Stretch the hot interval if the budget cannot cover the window at min_interval
+            reserved = self._reserved_hot_polls(now, hot)
+            delay = self.min_interval
+            if reserved > remaining:
+                delay *= reserved / remaining
+        else:
+            if outcome == 'unavailable':
+                # New month's workbook not published yet or a failed request: do not back off
+                delay = self.base_interval
+            else:
+                delay = min(self.base_interval * 2 ** self.backoff, self.max_interval)
+            cold_budget = remaining - self._reserved_hot_polls(now, hot)
+            if cold_budget <= 0:
+                delay = max(delay, min(self.seconds_to_next_hot(now, hot), to_midnight))
+            delay = min(delay, self.seconds_to_next_hot(now, hot))
+
+        # The workbook URL changes with the month; look for the new one right away
+        delay = min(delay, to_month + 60)
+        delay = max(delay, 1.0)
+        self.save()
+        logger.debug(f"Schedule: outcome={outcome} hot_bins={sorted(hot)} polls_today={used} "
+                     f"delay={delay:.0f}s")
+        return delay
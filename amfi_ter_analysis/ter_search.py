@@ -0,0 +1,209 @@
+"""
+Scheme-name search for interactive lookups
+A trigram index over normalized scheme names (lower case, no punctuation, without
+noise words such as "Fund" and "Plan") answers partial or misspelled queries like
+"lic flexi" or "icici quant" with ranked NSDL scheme codes. New or renamed schemes
+are added incrementally; the index is kept next to the history snapshots.
+"""
+
+import os
+import re
+import pickle
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FILE = '.ter_search.pkl'
+SEARCH_VERSION = 1
+NOISE_WORDS = frozenset({'fund', 'funds', 'plan', 'scheme', 'the', 'of', 'and', 'a', 'an', 'mf'})
+# Share of the score given to query words that start a word of the name
+PREFIX_WEIGHT = 0.5
+# Candidates re-ranked with the prefix bonus, per requested result
+RERANK_FACTOR = 5
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def name_tokens(name):
+    """Lower-case words of a scheme name without punctuation or noise words"""
+    words = _NON_WORD.sub(' ', str(name).lower()).split()
+    return [word for word in words if word not in NOISE_WORDS] or words
+
+
+def trigrams(tokens):
+    """Padded character trigrams of each word ('  ic', ' ici', 'ici', ...)"""
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SchemeSearchIndex:
+    """Incremental trigram index from scheme code to name
+
+    Each indexed name is a document; a code's document is replaced when its name
+    changes. search() counts shared trigrams for every document with one bincount,
+    ranks by trigram (Jaccard) similarity and re-ranks the best candidates with a
+    bonus for query words that are prefixes of words in the name.
+    """
+
+    def __init__(self):
+        self.codes = []
+        self.names = []
+        self.tokens = []
+        self.sizes = []
+        self.live = []
+        self.postings = {}
+        self._doc = {}
+        self._arrays = {}
+        self._sizes = None
+        self._live = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc)
+
+    # Updates
+
+    def add(self, code, name):
+        """Index one scheme; returns True when the index changed"""
+        code = str(code).strip()
+        with self._lock:
+            doc = self._doc.get(code)
+            if doc is not None:
+                if self.names[doc] == name:
+                    return False
+                self.live[doc] = False
+            doc = len(self.codes)
+            tokens = name_tokens(name)
+            grams = trigrams(tokens)
+            self.codes.append(code)
+            self.names.append(name)
+            self.tokens.append(tokens)
+            self.sizes.append(len(grams))
+            self.live.append(True)
+            self._doc[code] = doc
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(doc)
+                self._arrays.pop(gram, None)
+            self._sizes = self._live = None
+            return True
+
+    def update(self, names):
+        """Index every (code, name) of a mapping; returns the number added or renamed"""
+        with self._lock:
+            return sum(self.add(code, name) for code, name in names.items() if name is not None)
+
+    # Queries
+
+    def _postings(self, gram):
+        array = self._arrays.get(gram)
+        if array is None:
+            array = self._arrays[gram] = np.asarray(self.postings.get(gram, ()), dtype=np.int64)
+        return array
+
+    def search(self, query, limit=10):
+        """[(code, name, score)] best matches first; score is between 0 and 1"""
+        tokens = name_tokens(query)
+        grams = trigrams(tokens)
+        if not grams:
+            return []
+        with self._lock:
+            if not self.codes:
+                return []
+            exact = self._doc.get(str(query).strip())
+            if exact is not None:
+                return [(self.codes[exact], self.names[exact], 1.0)]
+            if self._sizes is None:
+                self._sizes = np.asarray(self.sizes, dtype=np.float64)
+                self._live = np.asarray(self.live, dtype=bool)
+            hits = np.bincount(np.concatenate([self._postings(gram) for gram in grams]),
+                               minlength=len(self.codes)).astype(np.float64)
+            similarity = hits / (len(grams) + self._sizes - hits)
+            similarity[~self._live] = 0.0
+            candidates = np.flatnonzero(similarity)
+            if not len(candidates):
+                return []
+            keep = min(len(candidates), max(limit, 1) * RERANK_FACTOR)
+            candidates = candidates[np.argpartition(-similarity[candidates], keep - 1)[:keep]]
+
+            results = []
+            for doc in candidates:
+                words = self.tokens[doc]
+                prefixed = sum(any(word.startswith(token) for word in words) for token in tokens)
+                score = (1 - PREFIX_WEIGHT) * similarity[doc] + PREFIX_WEIGHT * prefixed / len(tokens)
+                results.append((round(float(score), 4), self.codes[doc], self.names[doc]))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [(code, name, score) for score, code, name in results[:limit]]
+
+    # Persistence
+
+    def save(self, path):
+        data = {'version': SEARCH_VERSION, 'codes': self.codes, 'names': self.names, 'live': self.live}
+        path = Path(path)
+        tmp = path.with_name(f"{path.name}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Index stored at path (empty when missing, unreadable or from another version)"""
+        index = cls()
+        path = Path(path)
+        if not path.exists():
+            return index
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == SEARCH_VERSION:
+                for code, name, live in zip(data['codes'], data['names'], data['live']):
+                    if live:
+                        index.add(code, name)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable search index {path}: {e}")
+        return index
+
+
+_indexes = {}
+# History data version each index was last synced with
+_versions = {}
+_indexes_lock = threading.Lock()
+
+
+def scheme_search_index(history_dir='history'):
+    """Process-wide search index over every scheme in the history, kept up to date
+
+    Scheme names are re-read only when the history's data version changes.
+    """
+    from .ter_history import HistoryStore, history_index
+
+    key = os.path.abspath(history_dir)
+    path = Path(history_dir) / SEARCH_FILE
+    version = HistoryStore(history_dir).data_version()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SchemeSearchIndex.load(path)
+        if _versions.get(key) == version:
+            return index
+    history = history_index(history_dir)
+    # The history index checks for new snapshots at most once per interval; the version moved
+    history.refresh(force=True)
+    added = index.update(history.names)
+    if added:
+        logger.info(f"Search index: {added} scheme(s) added or renamed, {len(index)} indexed")
+        index.save(path)
+    with _indexes_lock:
+        _versions[key] = version
+    return index
+
+
+def search_schemes(query, limit=10, history_dir='history'):
+    """Ranked (code, name, score) matches for a partial or misspelled scheme name"""
+    return scheme_search_index(history_dir).search(query, limit)
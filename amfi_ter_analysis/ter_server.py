@@ -0,0 +1,380 @@
+"""
+Read-only HTTP query service for AMFI TER data
+Answers JSON queries from the history store on an asyncio server: the latest change
+set, a scheme's TER history, category summaries and top movers. Responses are kept
+in an LRU cache keyed by query and the store's data version and carry an ETag, so
+repeat requests are served from memory or answered with 304 Not Modified. Paths
+that are not API routes serve files from the output directory, as before.
+
+    GET /api/changes/latest
+    GET /api/schemes/<code>/history?start=YYYY-MM-DD&end=YYYY-MM-DD
+    GET /api/history?code=<code>&code=<code>...&start=&end=
+    GET /api/categories?date=YYYY-MM-DD
+    GET /api/movers?days=30&limit=20&plan=Regular
+    GET /api/search?q=<name>&limit=10
+    GET /api/health
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import pandas as pd
+
+from . import __version__
+from .ter_analysis import diff_ter_frames
+from .ter_history import HistoryStore, history_index, get_ter_history
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('Regular', 'Direct')
+MAX_HEADER_BYTES = 16 * 1024
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class QueryError(Exception):
+    """A request that cannot be answered; carries the HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _records(frame):
+    """JSON-ready rows with dates as YYYY-MM-DD and NaN as null"""
+    frame = frame.copy()
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            frame[col] = frame[col].dt.strftime('%Y-%m-%d')
+    return json.loads(frame.to_json(orient='records'))
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with a fixed number of entries"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class QueryService:
+    """Queries over the history store, recomputed only when its data version changes
+
+    Change sets, categories and movers read the one or two snapshots they need,
+    keeping the most recently used few in memory; scheme histories come from the
+    persistent per-scheme HistoryIndex.
+    """
+
+    def __init__(self, history_dir='history', version_ttl=1.0, snapshot_cache=4):
+        self.store = HistoryStore(history_dir)
+        self.version_ttl = version_ttl
+        self._version = None
+        self._version_checked = 0.0
+        self._listing = None
+        self._listing_version = None
+        self._frames = LRUCache(snapshot_cache)
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Data version of the store, re-read at most every version_ttl seconds"""
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked >= self.version_ttl:
+            self._version = self.store.data_version()
+            self._version_checked = now
+        return self._version
+
+    def snapshots(self):
+        """[(date, path)] of the store, re-listed when the data version changes"""
+        version = self.version()
+        with self._lock:
+            if self._listing_version != version:
+                self._listing, self._listing_version = self.store.snapshots(), version
+            listing = self._listing
+        if not listing:
+            raise QueryError(404, 'No snapshots in the history store')
+        return listing
+
+    def snapshot(self, path):
+        """One normalized snapshot, loaded at most once per data version"""
+        key = (path.name, self.version())
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self.store.load(path)
+            self._frames.put(key, frame)
+        return frame
+
+    def latest_changes(self):
+        snapshots = self.snapshots()
+        if len(snapshots) < 2:
+            raise QueryError(404, 'Need at least two snapshots for a change set')
+        (previous_date, previous_path), (date, path) = snapshots[-2:]
+        previous, current = self.snapshot(previous_path), self.snapshot(path)
+        return {
+            'previous_date': previous_date.strftime('%Y-%m-%d'),
+            'date': date.strftime('%Y-%m-%d'),
+            'changes': {plan.lower(): _records(diff_ter_frames(previous, current, plan))
+                        for plan in PLANS},
+        }
+
+    def scheme_history(self, code, start=None, end=None):
+        history = get_ter_history(code, start, end, history_dir=self.store.history_dir)
+        if history.empty:
+            raise QueryError(404, f'No history for scheme {code}')
+        rows = history.reset_index(level=0, drop=True).rename_axis('date').reset_index()
+        return {
+            'code': code,
+            'name': history_index(self.store.history_dir).names.get(code),
+            'history': _records(rows.rename(columns={
+                'Regular Plan - Base TER (%)': 'regular',
+                'Direct Plan - Base TER (%)': 'direct',
+            })),
+        }
+
+    def batch_history(self, codes, start=None, end=None):
+        if not codes:
+            raise QueryError(400, 'Pass one or more code parameters')
+        history = get_ter_history(codes, start, end, history_dir=self.store.history_dir)
+        rows = history.reset_index().rename(columns={
+            'NSDL Scheme Code': 'code',
+            'Date': 'date',
+            'Regular Plan - Base TER (%)': 'regular',
+            'Direct Plan - Base TER (%)': 'direct',
+        })
+        return {'schemes': {code: _records(group.drop(columns=['code']))
+                            for code, group in rows.groupby('code', sort=True)}}
+
+    def categories(self, date=None):
+        from .ter_streaming import category_summary
+
+        snapshots = dict(self.snapshots())
+        target = pd.Timestamp(date) if date else max(snapshots)
+        if target not in snapshots:
+            raise QueryError(404, f'No snapshot on {target:%Y-%m-%d}')
+        rows = category_summary(self.snapshot(snapshots[target]), target)
+        rows = rows.drop(columns=['Snapshot Date'])
+        return {'date': target.strftime('%Y-%m-%d'), 'categories': _records(rows.round(6))}
+
+    def movers(self, days=30, limit=20, plan='Regular'):
+        """Largest Base TER moves between the latest snapshot and the one `days` earlier"""
+        if plan not in PLANS:
+            raise QueryError(400, f"plan must be one of {', '.join(PLANS)}")
+        snapshots = self.snapshots()
+        latest, latest_path = snapshots[-1]
+        earlier = [item for item in snapshots if item[0] <= latest - pd.Timedelta(days=days)]
+        since, since_path = earlier[-1] if earlier else snapshots[0]
+        col = f'{plan} Plan - Base TER (%)'
+        old = self.snapshot(since_path).set_index('NSDL Scheme Code')[col]
+        new = self.snapshot(latest_path).set_index('NSDL Scheme Code')
+        moved = pd.DataFrame({'Scheme Name': new['Scheme Name'], 'old': old,
+                              'new': new[col]}).dropna()
+        moved['change'] = (moved['new'] - moved['old']).round(4)
+        moved = moved[moved['change'] != 0]
+        order = moved['change'].abs().sort_values(ascending=False, kind='mergesort').index
+        moved = moved.reindex(order).head(limit)
+        moved = moved.rename_axis('code').reset_index().rename(columns={'Scheme Name': 'name'})
+        return {
+            'plan': plan,
+            'since': since.strftime('%Y-%m-%d'),
+            'date': latest.strftime('%Y-%m-%d'),
+            'movers': _records(moved),
+        }
+
+    def search(self, query, limit=10):
+        from .ter_search import search_schemes
+
+        if not query or not query.strip():
+            raise QueryError(400, 'Pass a q parameter')
+        matches = search_schemes(query, limit, self.store.history_dir)
+        return {'query': query, 'matches': [{'code': code, 'name': name, 'score': score}
+                                            for code, name, score in matches]}
+
+
+def _etag_matches(if_none_match, etag):
+    """True when an If-None-Match header lists the ETag (or is '*')"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def _int_param(query, name, default):
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        raise QueryError(400, f'{name} must be an integer')
+
+
+class TerServer:
+    """asyncio HTTP/1.1 server (keep-alive, GET/HEAD) in front of a QueryService"""
+
+    def __init__(self, service, output_dir='output', cache_size=256):
+        self.service = service
+        self.output_dir = Path(output_dir).resolve()
+        self.cache = LRUCache(cache_size)
+
+    def route(self, path, query):
+        """Compute the JSON payload for an API path"""
+        parts = [unquote(part) for part in path.strip('/').split('/')][1:]
+        get = lambda name: query.get(name, [None])[0]
+        if parts == ['health']:
+            return {'status': 'ok', 'version': __version__, 'data_version': self.service.version()}
+        if parts == ['changes', 'latest']:
+            return self.service.latest_changes()
+        if len(parts) >= 3 and parts[0] == 'schemes' and parts[-1] == 'history':
+            # Scheme codes contain '/', so everything between the two fixed parts is the code
+            return self.service.scheme_history('/'.join(parts[1:-1]), get('start'), get('end'))
+        if parts == ['history']:
+            return self.service.batch_history(query.get('code', []), get('start'), get('end'))
+        if parts == ['categories']:
+            return self.service.categories(get('date'))
+        if parts == ['movers']:
+            return self.service.movers(_int_param(query, 'days', 30),
+                                       _int_param(query, 'limit', 20), get('plan') or 'Regular')
+        if parts == ['search']:
+            return self.service.search(get('q'), _int_param(query, 'limit', 10))
+        raise QueryError(404, f'Unknown endpoint {path}')
+
+    async def api_response(self, path, query):
+        """(status, body, content type, etag), cached by query and data version"""
+        loop = asyncio.get_running_loop()
+        # The data version stats every snapshot file, so keep it off the event loop
+        version = await loop.run_in_executor(None, self.service.version)
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in query.items())), version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            payload = await loop.run_in_executor(None, self.route, path, query)
+            status = 200
+        except QueryError as e:
+            payload, status = {'error': str(e)}, e.status
+        except ValueError as e:
+            # Unparseable dates and similar bad parameters
+            payload, status = {'error': str(e)}, 400
+        body = json.dumps(payload, default=str).encode()
+        if status != 200:
+            return status, body, 'application/json', None
+        response = (status, body, 'application/json', f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        self.cache.put(key, response)
+        return response
+
+    def file_response(self, path):
+        """Static file from the output directory (no directory listings)"""
+        target = (self.output_dir / unquote(path).lstrip('/')).resolve()
+        if self.output_dir not in target.parents or not target.is_file():
+            raise QueryError(404, f'Not found: {path}')
+        stat = target.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type = mimetypes.guess_type(target.name)[0] or 'application/octet-stream'
+        return 200, target.read_bytes(), content_type, etag
+
+    async def respond(self, method, target, headers):
+        url = urlsplit(target)
+        if method not in ('GET', 'HEAD'):
+            raise QueryError(405, f'{method} not allowed')
+        if url.path.startswith('/api/'):
+            return await self.api_response(url.path, parse_qs(url.query))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.file_response, url.path)
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.write(writer, 400, b'', 'text/plain', None, 'HTTP/1.1', False, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = (connection != 'close' if version == 'HTTP/1.1'
+                              else connection == 'keep-alive')
+
+                try:
+                    status, body, content_type, etag = await self.respond(method, target, headers)
+                except QueryError as e:
+                    body = json.dumps({'error': str(e)}).encode()
+                    status, body, content_type, etag = e.status, body, 'application/json', None
+                except Exception:
+                    logger.exception(f"Error serving {target}")
+                    status, body, content_type, etag = (500, b'{"error": "internal error"}',
+                                                        'application/json', None)
+                if status == 200 and etag and _etag_matches(headers.get('if-none-match'), etag):
+                    status, body = 304, b''
+                await self.write(writer, status, body, content_type, etag, version, keep_alive,
+                                 method != 'HEAD')
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def write(self, writer, status, body, content_type, etag, version, keep_alive, send_body):
+        headers = [
+            f"{version if version.startswith('HTTP/') else 'HTTP/1.1'} {status} "
+            f"{REASONS.get(status, '')}",
+            f"Date: {formatdate(usegmt=True)}",
+            f"Server: amfi-ter-analysis/{__version__}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            'Cache-Control: no-cache',
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if etag:
+            headers.append(f"ETag: {etag}")
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        if send_body and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8000, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+def serve(history_dir='history', output_dir='output', host='127.0.0.1', port=8000, cache_size=256):
+    """Run the query service until interrupted"""
+    server = TerServer(QueryService(history_dir), output_dir, cache_size)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+"""
+Sharded Base TER diff for large, multi-year workloads
+Both snapshots are sorted by scheme code (normalized snapshots already are), so a
+shard is one contiguous code range of each side, found by binary search: either
+ranges aligned to AMC boundaries or equal-sized ranges. Worker processes run
+diff_ter_frames on their slices, and since every shard's output is sorted by code
+and the ranges are ordered, concatenating them restores the scheme code order that
+diff_ter_frames (and save_results) produce. The parent never touches every code
+beyond a sortedness check.
+
+Slices are pickled to the workers: the code and name columns are Python strings,
+which multiprocessing.shared_memory cannot hold without re-encoding them. There is
+no hash partitioning either, as hash shards are not code ranges and would need the
+per-code assignment and k-way merge this layout avoids.
+"""
+
+import os
+import bisect
+import logging
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .ter_analysis import diff_ter_frames
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('Regular', 'Direct')
+SHARD_BY = ('amc', 'range')
+CODE_COLUMN = 'NSDL Scheme Code'
+
+# Below this many rows the process pool costs more than it saves
+MIN_SHARDED_ROWS = 50_000
+
+
+def amc_prefix(codes):
+    """AMC part of NSDL scheme codes (text before the first '/')"""
+    return pd.Series(codes, dtype=object).str.split('/', n=1).str[0].fillna('')
+
+
+def codes_sorted(codes):
+    """Whether a code column is in ascending order (vectorized, no Python loop)"""
+    if len(codes) < 2:
+        return True
+    if getattr(codes.dtype, 'storage', None) == 'pyarrow':
+        import pyarrow.compute as pc
+
+        values = codes.array.__arrow_array__()
+        return bool(pc.all(pc.greater_equal(values[1:], values[:-1])).as_py())
+    values = codes.to_numpy(dtype=object)
+    return bool((values[1:] >= values[:-1]).all())
+
+
+def shard_bounds(previous_codes, current_codes, shards, by='amc'):
+    """Row ranges ((prev_start, prev_stop), (cur_start, cur_stop)) per non-empty shard
+
+    Both code columns must be sorted. Split keys are taken at equal steps through
+    the current codes; 'amc' moves each key back to its AMC prefix so no AMC spans
+    two shards, 'range' uses the code itself. Rows equal to a key all fall to its
+    right, so repeated codes are never split either. Deterministic across runs.
+    """
+    if by not in SHARD_BY:
+        raise ValueError(f"Unknown shard key {by!r}; expected one of {', '.join(SHARD_BY)}")
+    if not len(previous_codes) or not len(current_codes):
+        return []
+    keys = []
+    for k in range(1, shards):
+        key = str(current_codes.iat[len(current_codes) * k // shards])
+        keys.append(key.split('/', 1)[0] if by == 'amc' else key)
+    # AMC prefixes need not ascend with their codes ('AB-X/..' < 'AB/..' but 'AB-X' > 'AB');
+    # a running maximum of the cuts drops an out-of-order key on both sides alike
+    cuts = []
+    for values in (previous_codes.array, current_codes.array):
+        positions = [bisect.bisect_left(values, key) for key in keys]
+        cuts.append(list(accumulate([0] + positions + [len(values)], max)))
+    prev_cuts, cur_cuts = cuts
+    # A shard with no rows on either side cannot hold a match
+    return [((prev_cuts[s], prev_cuts[s + 1]), (cur_cuts[s], cur_cuts[s + 1]))
+            for s in range(shards)
+            if prev_cuts[s] < prev_cuts[s + 1] and cur_cuts[s] < cur_cuts[s + 1]]
+
+
+def _diff_shard(previous_df, current_df, plans, change_date):
+    """Worker: diff_ter_frames of one shard's slices for every plan"""
+    return tuple(diff_ter_frames(previous_df, current_df, plan, change_date) for plan in plans)
+
+
+def _sorted_by_code(frame, side):
+    if codes_sorted(frame[CODE_COLUMN]):
+        return frame
+    logger.info(f"{side} snapshot is not sorted by scheme code; sorting before sharding")
+    return frame.sort_values(CODE_COLUMN, kind='mergesort')
+
+
+def sharded_diff(previous_df, current_df, plans=PLANS, change_date=None, shards=None,
+                 by='amc', executor=None):
+    """diff_ter_frames for several plans, run over shards in a process pool
+
+    Returns one frame per plan, identical to diff_ter_frames(previous_df, current_df,
+    plan, change_date), repeated codes included. Pass an executor to reuse a pool
+    across many diffs.
+    """
+    shards = shards or os.cpu_count() or 1
+    if shards == 1 or len(previous_df) + len(current_df) < MIN_SHARDED_ROWS:
+        return tuple(diff_ter_frames(previous_df, current_df, plan, change_date)
+                     for plan in plans)
+
+    previous_df = _sorted_by_code(previous_df, 'Previous')
+    current_df = _sorted_by_code(current_df, 'Current')
+    ter_cols = [f'{plan} Plan - Base TER (%)' for plan in plans]
+    # Ship only the columns diff_ter_frames reads
+    previous_df = previous_df[[CODE_COLUMN] + ter_cols]
+    current_df = current_df[[CODE_COLUMN, 'Scheme Name', 'TER Date'] + ter_cols]
+    bounds = shard_bounds(previous_df[CODE_COLUMN], current_df[CODE_COLUMN], shards, by)
+    if not bounds:
+        return tuple(diff_ter_frames(previous_df, current_df, plan, change_date)
+                     for plan in plans)
+
+    own_executor = executor is None
+    workers = min(len(bounds), os.cpu_count() or 1)
+    executor = executor or ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_diff_shard, previous_df.iloc[a:b], current_df.iloc[c:d],
+                                   plans, change_date)
+                   for (a, b), (c, d) in bounds]
+        shard_results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    frames = tuple(pd.concat([result[k] for result in shard_results], ignore_index=True)
+                   for k in range(len(plans)))
+    counts = ', '.join(f"{plan} Plan {len(frame)} changes" for plan, frame in zip(plans, frames))
+    logger.info(f"Sharded diff over {len(bounds)} shards by {by}: {counts}")
+    return frames
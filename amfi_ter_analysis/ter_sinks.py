@@ -0,0 +1,221 @@
+"""
+Output sinks for TER artifacts
+Writes each artifact in one or more formats (CSV, zstd-compressed CSV, Parquet,
+Feather) with schema metadata embedded (Arrow formats) or in a .schema.json
+sidecar (CSV formats), fanning the writes out over a thread pool
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b'amfi_ter_analysis'
+
+# Formats written per artifact unless overridden (see parse_formats)
+DEFAULT_FORMATS = {
+    'changes': ['csv'],
+    'comparison': ['csv'],
+    'baseline': ['csv'],
+}
+
+EXTENSIONS = {
+    'csv': '.csv',
+    'csv.zst': '.csv.zst',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+
+def build_metadata(df, artifact, now=None):
+    """Describe an artifact's schema and provenance, stamped with `now` (default: the clock)"""
+    from . import __version__
+
+    return {
+        'artifact': artifact,
+        'generated_at': (now or datetime.now()).isoformat(timespec='seconds'),
+        'package_version': __version__,
+        'rows': int(len(df)),
+        'columns': [{'name': str(col), 'dtype': str(dtype)} for col, dtype in df.dtypes.items()],
+    }
+
+
+def _write_sidecar(path, metadata):
+    """Text formats carry their schema in a <file>.schema.json sidecar"""
+    sidecar = Path(f"{path}.schema.json")
+    tmp = _atomic_target(sidecar)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp, sidecar)
+
+
+def _atomic_target(path):
+    """Temporary path next to the final file so readers never see partial output"""
+    return path.with_name(f".{path.name}.tmp")
+
+
+def write_csv(df, path, metadata):
+    """Plain CSV, byte-compatible with what the scripts write today"""
+    tmp = _atomic_target(path)
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    _write_sidecar(path, metadata)
+    return path
+
+
+def write_csv_zstd(df, path, metadata, level=10):
+    """zstd-compressed CSV (requires the zstandard package and pandas 1.4+)"""
+    _require('zstandard', 'zstd')
+    tmp = _atomic_target(path)
+    df.to_csv(tmp, index=False, compression={'method': 'zstd', 'level': level})
+    os.replace(tmp, path)
+    _write_sidecar(path, metadata)
+    return path
+
+
+def _arrow_table(df, metadata):
+    """Convert to an Arrow table with metadata stored in the schema"""
+    pa = _require('pyarrow', 'columnar')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[METADATA_KEY] = json.dumps(metadata).encode('utf-8')
+    return table.replace_schema_metadata(schema_metadata)
+
+
+def write_parquet(df, path, metadata):
+    """Parquet with zstd column compression (requires pyarrow)"""
+    _require('pyarrow', 'columnar')
+    import pyarrow.parquet as pq
+
+    tmp = _atomic_target(path)
+    pq.write_table(_arrow_table(df, metadata), tmp, compression='zstd')
+    os.replace(tmp, path)
+    return path
+
+
+def write_feather(df, path, metadata):
+    """Feather (Arrow IPC) with zstd compression (requires pyarrow)"""
+    _require('pyarrow', 'columnar')
+    import pyarrow.feather as feather
+
+    tmp = _atomic_target(path)
+    feather.write_feather(_arrow_table(df, metadata), tmp, compression='zstd')
+    os.replace(tmp, path)
+    return path
+
+
+SINKS = {
+    'csv': write_csv,
+    'csv.zst': write_csv_zstd,
+    'parquet': write_parquet,
+    'feather': write_feather,
+}
+
+
+def _require(module, extra):
+    """Import an optional dependency or explain which extra provides it"""
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ImportError(f"{module} is required for this output format; "
+                          f"install with: pip install amfi-ter-analysis[{extra}]")
+
+
+def split_extension(name):
+    """(stem, format) of a file name written by a sink, or (name, None)"""
+    for fmt, extension in sorted(EXTENSIONS.items(), key=lambda item: -len(item[1])):
+        if name.endswith(extension):
+            return name[:-len(extension)], fmt
+    return name, None
+
+
+def register_sink(name, writer, extension):
+    """Register an additional output format"""
+    SINKS[name] = writer
+    EXTENSIONS[name] = extension
+
+
+def parse_formats(spec, defaults=None):
+    """Parse 'comparison=csv,parquet;baseline=csv.zst' into a per-artifact format map"""
+    formats = {name: list(fmts) for name, fmts in (defaults or DEFAULT_FORMATS).items()}
+    for part in filter(None, (p.strip() for p in (spec or '').split(';'))):
+        if '=' in part:
+            artifact, fmts = part.split('=', 1)
+            targets = [artifact.strip()]
+        else:
+            fmts, targets = part, list(formats)
+        chosen = [fmt.strip() for fmt in fmts.split(',') if fmt.strip()]
+        unknown = [fmt for fmt in chosen if fmt not in SINKS]
+        if unknown:
+            raise ValueError(f"Unknown output format(s): {', '.join(unknown)}")
+        for target in targets:
+            formats[target] = chosen
+    return formats
+
+
+def write_artifacts(artifacts, formats=None, max_workers=4, now=None):
+    """Write artifacts concurrently in their configured formats
+
+    artifacts maps a name to (kind, dataframe, base_path) where kind selects the
+    format list (changes, comparison, baseline) and base_path has no extension.
+    `now` replaces the wall clock in the metadata. Returns the list of paths written.
+    """
+    formats = formats or DEFAULT_FORMATS
+    jobs = []
+    for name, (kind, df, base_path) in artifacts.items():
+        metadata = build_metadata(df, name, now)
+        for fmt in formats.get(kind, ['csv']):
+            path = Path(f"{base_path}{EXTENSIONS[fmt]}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            jobs.append((SINKS[fmt], df, path, metadata))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(writer, df, path, metadata)
+                   for writer, df, path, metadata in jobs]
+        written = [future.result() for future in futures]
+
+    for path in written:
+        logger.info(f"Saved {path}")
+    return written
+
+
+def read_artifact(path):
+    """Read an artifact written by any sink back into a DataFrame"""
+    import pandas as pd
+
+    path = str(path)
+    if path.endswith('.parquet'):
+        _require('pyarrow', 'columnar')
+        return pd.read_parquet(path)
+    if path.endswith('.feather'):
+        _require('pyarrow', 'columnar')
+        return pd.read_feather(path)
+    if path.endswith('.zst'):
+        _require('zstandard', 'zstd')
+    return pd.read_csv(path)
+
+
+def read_metadata(path):
+    """Return the embedded or sidecar schema metadata of an artifact"""
+    path = str(path)
+    if path.endswith('.parquet') or path.endswith('.feather'):
+        pa = _require('pyarrow', 'columnar')
+        import pyarrow.parquet as pq
+
+        # Only the schema is read; Feather files are memory-mapped, not loaded
+        if path.endswith('.parquet'):
+            schema = pq.read_schema(path)
+        else:
+            with pa.memory_map(path) as source:
+                schema = pa.ipc.open_file(source).schema
+        raw = (schema.metadata or {}).get(METADATA_KEY)
+        return json.loads(raw) if raw else None
+    sidecar = f"{path}.schema.json"
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
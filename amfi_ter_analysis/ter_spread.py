@@ -0,0 +1,371 @@
+"""
+Regular - Direct Base TER spread table
+Materializes, for every scheme, its current Regular and Direct Base TER and the
+spread between them (Regular - Direct, the distributor-commission share of the
+expense ratio), plus a log of every spread move. Each day's change set touches
+only the schemes that moved, and window queries such as "largest widening in
+30 days" read just the log entries inside the window.
+"""
+
+import os
+import pickle
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .ter_batches import REPLACE, SKIP, claim_batch, frame_digest
+
+logger = logging.getLogger(__name__)
+
+SPREAD_FILE = 'TER_Spread.pkl'
+SPREAD_VERSION = 1
+PLANS = ('Regular', 'Direct')
+SNAPSHOT_COLUMNS = ['NSDL Scheme Code', 'Regular Plan - Base TER (%)', 'Direct Plan - Base TER (%)']
+
+SPREAD_COLUMNS = ['NSDL Scheme Code', 'Scheme Name', 'Regular TER', 'Direct TER', 'Spread',
+                  'Last Change']
+MOVE_COLUMNS = ['NSDL Scheme Code', 'Scheme Name', 'Spread Before', 'Spread After',
+                'Spread Change', 'Moves']
+
+
+def _day(date):
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+
+def _grown(array, size, fill):
+    """array with room for at least size entries (capacity doubles)"""
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array), 64), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SpreadTable:
+    """Per-scheme current spread with an append-only log of spread moves
+
+    Rows are scheme codes in order of first appearance. The log holds one entry
+    (row, date, spread before, spread after) per scheme whose spread moved on a
+    date; a scheme's first observation is not a move. Updates carry a batch id
+    (the report date, see ter_batches). Only the newest batch can be revised: its
+    moves are undone and logged again, so the log holds the day's final moves.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.codes = []
+        self.names = []
+        self.batches = {}
+        # What the newest batch overwrote, to replace it when that day is revised
+        self._undo = None
+        self._regular = np.empty(0)
+        self._direct = np.empty(0)
+        self._changed = np.empty(0, dtype='datetime64[D]')
+        self._log_row = np.empty(0, dtype=np.int64)
+        self._log_date = np.empty(0, dtype='datetime64[D]')
+        self._log_before = np.empty(0)
+        self._log_after = np.empty(0)
+        self._moves = 0
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Updates
+
+    def _row_ids(self, codes, names):
+        """Row of each code, adding schemes seen for the first time"""
+        rows = np.empty(len(codes), dtype=np.int64)
+        for i, (code, name) in enumerate(zip(codes, names)):
+            row = self.rows.get(code)
+            if row is None:
+                row = self.rows[code] = len(self.codes)
+                self.codes.append(code)
+                self.names.append(name)
+            elif name is not None and name == name:
+                self.names[row] = name
+            rows[i] = row
+        size = len(self.codes)
+        self._regular = _grown(self._regular, size, np.nan)
+        self._direct = _grown(self._direct, size, np.nan)
+        self._changed = _grown(self._changed, size, np.datetime64('NaT'))
+        return rows
+
+    def _set(self, rows, regular, direct, date):
+        """Apply new Regular / Direct values (NaN keeps the current one) to rows
+
+        Returns the number of spread moves logged.
+        """
+        rows, first = np.unique(rows, return_index=True)
+        regular, direct = regular[first], direct[first]
+        if self._undo is not None:
+            self._undo['steps'].append(
+                (rows, self._regular[rows], self._direct[rows], self._changed[rows]))
+        before = self._regular[rows] - self._direct[rows]
+        self._regular[rows] = np.where(np.isnan(regular), self._regular[rows], regular)
+        self._direct[rows] = np.where(np.isnan(direct), self._direct[rows], direct)
+        after = self._regular[rows] - self._direct[rows]
+
+        moved = ~np.isnan(before) & ~np.isnan(after) & (np.round(after - before, 6) != 0)
+        count = int(moved.sum())
+        if count:
+            day = _day(date)
+            size = self._moves + count
+            self._log_row = _grown(self._log_row, size, -1)
+            self._log_date = _grown(self._log_date, size, np.datetime64('NaT'))
+            self._log_before = _grown(self._log_before, size, np.nan)
+            self._log_after = _grown(self._log_after, size, np.nan)
+            self._log_row[self._moves:size] = rows[moved]
+            self._log_date[self._moves:size] = day
+            self._log_before[self._moves:size] = before[moved]
+            self._log_after[self._moves:size] = after[moved]
+            self._changed[rows[moved]] = day
+            self._moves = size
+        return count
+
+    def _claim(self, batch, digest):
+        """False when the batch is skipped; otherwise start recording what it overwrites
+
+        An older batch cannot be replaced, since later days were applied on top of it.
+        """
+        if batch is None:
+            self._undo = None
+            return True
+        batch = str(batch)
+        newest = self._undo is not None and self._undo['batch'] == batch
+        claim = claim_batch(self.batches, batch, digest, newest, 'Spread table')
+        if claim == SKIP:
+            return False
+        if claim == REPLACE:
+            self._revert()
+        self._undo = {'batch': batch, 'codes': len(self.codes), 'moves': self._moves, 'steps': []}
+        return True
+
+    def _revert(self):
+        """Undo the newest batch: its values, new schemes and logged moves"""
+        undo, self._undo = self._undo, None
+        for rows, regular, direct, changed in reversed(undo['steps']):
+            self._regular[rows], self._direct[rows], self._changed[rows] = regular, direct, changed
+        for code in self.codes[undo['codes']:]:
+            del self.rows[code]
+        del self.codes[undo['codes']:], self.names[undo['codes']:]
+        self._moves = undo['moves']
+
+    def apply_snapshot(self, snapshot, date, batch=None):
+        """Set every scheme of a normalized snapshot (the initial load, or a rebuild)"""
+        if not self._claim(batch, frame_digest(snapshot[SNAPSHOT_COLUMNS])):
+            return 0
+        rows = self._row_ids(snapshot['NSDL Scheme Code'].to_numpy(dtype=object),
+                             snapshot['Scheme Name'].to_numpy(dtype=object))
+        return self._set(rows, snapshot['Regular Plan - Base TER (%)'].to_numpy(dtype=float),
+                         snapshot['Direct Plan - Base TER (%)'].to_numpy(dtype=float), date)
+
+    def update(self, regular_changes, direct_changes, date, batch=None, snapshot=None):
+        """Fold one day's Regular and Direct change sets into the rows they touch
+
+        Change sets are in the layout of the daily diff (New <plan> Plan - Base TER (%)).
+        With a snapshot, schemes not yet in the table are added from it; existing
+        rows are not rescanned. Returns the number of spread moves logged.
+        """
+        parts = [None if changes is None or len(changes) == 0
+                 else changes[['NSDL Scheme Code', f'New {plan} Plan - Base TER (%)']]
+                 for plan, changes in zip(PLANS, (regular_changes, direct_changes))]
+        if not self._claim(batch, frame_digest(*parts)):
+            return 0
+        codes, names, values = [], [], {plan: [] for plan in PLANS}
+        for plan, changes in zip(PLANS, (regular_changes, direct_changes)):
+            if changes is None or len(changes) == 0:
+                continue
+            codes.append(changes['NSDL Scheme Code'].astype(str).str.strip().to_numpy(dtype=object))
+            names.append(changes['Scheme Name'].to_numpy(dtype=object))
+            new = changes[f'New {plan} Plan - Base TER (%)'].to_numpy(dtype=float)
+            for other in PLANS:
+                values[other].append(new if other == plan else np.full(len(new), np.nan))
+        moves = 0
+        if codes:
+            rows = self._row_ids(np.concatenate(codes), np.concatenate(names))
+            regular, direct = np.concatenate(values['Regular']), np.concatenate(values['Direct'])
+            # A scheme changed in both plans appears twice; merge its two rows first
+            unique, inverse = np.unique(rows, return_inverse=True)
+            merged = {}
+            for plan, plan_values in (('Regular', regular), ('Direct', direct)):
+                column = np.full(len(unique), np.nan)
+                known = ~np.isnan(plan_values)
+                column[inverse[known]] = plan_values[known]
+                merged[plan] = column
+            moves = self._set(unique, merged['Regular'], merged['Direct'], date)
+        if snapshot is not None:
+            moves += self._add_new(snapshot, date)
+        return moves
+
+    def _add_new(self, snapshot, date):
+        codes = snapshot['NSDL Scheme Code'].to_numpy(dtype=object)
+        new = np.fromiter((code not in self.rows for code in codes), dtype=bool, count=len(codes))
+        if not new.any():
+            return 0
+        added = snapshot[new]
+        logger.info(f"Spread table: {int(new.sum())} new scheme(s)")
+        rows = self._row_ids(added['NSDL Scheme Code'].to_numpy(dtype=object),
+                             added['Scheme Name'].to_numpy(dtype=object))
+        return self._set(rows, added['Regular Plan - Base TER (%)'].to_numpy(dtype=float),
+                         added['Direct Plan - Base TER (%)'].to_numpy(dtype=float), date)
+
+    # Queries
+
+    def current(self):
+        """Every scheme's current Regular / Direct TER and spread, by scheme code"""
+        size = len(self.codes)
+        regular, direct = self._regular[:size], self._direct[:size]
+        result = pd.DataFrame({
+            'NSDL Scheme Code': self.codes,
+            'Scheme Name': self.names,
+            'Regular TER': regular,
+            'Direct TER': direct,
+            'Spread': np.round(regular - direct, 4),
+            'Last Change': pd.to_datetime(self._changed[:size]),
+        }, columns=SPREAD_COLUMNS)
+        return result.sort_values('NSDL Scheme Code', kind='mergesort').reset_index(drop=True)
+
+    def history(self, code):
+        """Spread moves of one scheme, oldest first (empty when it never moved)"""
+        row = self.rows.get(str(code).strip())
+        if row is None:
+            log = np.empty(0, dtype=int)
+        else:
+            log = np.flatnonzero(self._log_row[:self._moves] == row)
+        log = log[np.argsort(self._log_date[log], kind='stable')]
+        return pd.DataFrame({
+            'Date': pd.to_datetime(self._log_date[log]),
+            'Spread Before': np.round(self._log_before[log], 4),
+            'Spread After': np.round(self._log_after[log], 4),
+            'Spread Change': np.round(self._log_after[log] - self._log_before[log], 4),
+        })
+
+    def latest_date(self):
+        """Date of the newest logged move (None before the first one)"""
+        return pd.Timestamp(self._log_date[:self._moves].max()) if self._moves else None
+
+    def moves(self, days=30, as_of=None, limit=20, narrowing=False):
+        """Schemes whose spread widened (or narrowed) most in the `days` up to as_of
+
+        A scheme's spread change is its spread after its last move in the window
+        minus its spread before its first one. as_of defaults to the newest move.
+        """
+        as_of = pd.Timestamp(as_of) if as_of is not None else self.latest_date()
+        if as_of is None:
+            return pd.DataFrame(columns=MOVE_COLUMNS)
+        end, start = _day(as_of), _day(as_of) - np.timedelta64(days, 'D')
+        dates = self._log_date[:self._moves]
+        window = np.flatnonzero((dates > start) & (dates <= end))
+        if not len(window):
+            return pd.DataFrame(columns=MOVE_COLUMNS)
+        # Group the window's moves by scheme, in date order (log order breaks ties)
+        window = window[np.lexsort((window, dates[window], self._log_row[window]))]
+        rows = self._log_row[window]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        ends = np.r_[starts[1:], len(rows)] - 1
+        before, after = self._log_before[window[starts]], self._log_after[window[ends]]
+        result = pd.DataFrame({
+            'NSDL Scheme Code': np.asarray(self.codes, dtype=object)[rows[starts]],
+            'Scheme Name': np.asarray(self.names, dtype=object)[rows[starts]],
+            'Spread Before': np.round(before, 4),
+            'Spread After': np.round(after, 4),
+            'Spread Change': np.round(after - before, 4),
+            'Moves': ends - starts + 1,
+        })
+        change = result['Spread Change']
+        result = result[change < 0] if narrowing else result[change > 0]
+        result = result.sort_values(['Spread Change', 'NSDL Scheme Code'],
+                                    ascending=[narrowing, True], kind='mergesort')
+        return (result.head(limit) if limit else result).reset_index(drop=True)
+
+    # Persistence
+
+    def save(self, path):
+        size, moves = len(self.codes), self._moves
+        data = {
+            'version': SPREAD_VERSION,
+            'codes': self.codes,
+            'names': self.names,
+            'batches': self.batches,
+            'undo': self._undo,
+            'regular': self._regular[:size],
+            'direct': self._direct[:size],
+            'changed': self._changed[:size],
+            'log': (self._log_row[:moves], self._log_date[:moves],
+                    self._log_before[:moves], self._log_after[:moves]),
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Table stored at path (empty when missing, unreadable or from another version)"""
+        table = cls()
+        path = Path(path)
+        if not path.exists():
+            return table
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != SPREAD_VERSION:
+                return table
+            table.codes, table.names = list(data['codes']), list(data['names'])
+            table.rows = {code: row for row, code in enumerate(table.codes)}
+            table.batches = dict(data['batches'])
+            table._undo = data['undo']
+            table._regular, table._direct = data['regular'], data['direct']
+            table._changed = data['changed']
+            table._log_row, table._log_date, table._log_before, table._log_after = data['log']
+            table._moves = len(table._log_row)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable spread table {path}: {e}")
+            return cls()
+        return table
+
+    @classmethod
+    def from_history(cls, history_dir='history', start=None, end=None):
+        """Table built by applying every stored snapshot in date order"""
+        from .ter_history import HistoryStore
+
+        table = cls()
+        for date, snapshot in HistoryStore(history_dir).iter_snapshots(start, end):
+            table.apply_snapshot(snapshot, date, batch=date.strftime('%Y-%m-%d'))
+        return table
+
+
+def update_spread_file(regular_changes, direct_changes, snapshot, batch, path, history_dir=None):
+    """Load the table at path, fold in one day's changes and save it back
+
+    A missing table is first built from the snapshots in history_dir dated before
+    the batch, or loaded from the full snapshot when there are none.
+    """
+    table = SpreadTable.load(path)
+    if not len(table) and history_dir is not None:
+        end = pd.Timestamp(batch) - pd.Timedelta(days=1)
+        table = SpreadTable.from_history(history_dir, end=end)
+    batches = dict(table.batches)
+    if len(table):
+        table.update(regular_changes, direct_changes, batch, batch=batch, snapshot=snapshot)
+    else:
+        table.apply_snapshot(snapshot, batch, batch=batch)
+    if table.batches != batches:
+        table.save(path)
+    return path
+
+
+def spread_table(output_dir='output', history_dir='history'):
+    """Spread table kept by the daily runs, rebuilt from the history when missing"""
+    path = Path(output_dir) / SPREAD_FILE
+    table = SpreadTable.load(path)
+    if not len(table):
+        table = SpreadTable.from_history(history_dir)
+        if len(table):
+            table.save(path)
+    return table
@@ -0,0 +1,287 @@
+"""
+Crash-safe state store for AMFI TER runs
+ter_state.json is written atomically (temp file + fsync + rename) under an exclusive
+file lock, migrated between schema versions on load, and can optionally live in
+SQLite instead. Concurrent runs (e.g. a backfill and the daily job) use update() for
+read-modify-write cycles so neither loses the other's changes.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'ter_state.json'
+SCHEMA_VERSION = 1
+LOCK_TIMEOUT = 30
+
+
+def default_state():
+    """Empty state in the current schema
+
+    Holds the keys of both historical layouts: month_year / file_history (GitHub
+    Actions runner) and last_month / last_year / previous_day_file (daily automation).
+    """
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'last_processed_date': None,
+        'month_year': None,
+        'last_month': None,
+        'last_year': None,
+        'previous_day_file': None,
+        'file_history': {},
+        'daily_snapshots': {},
+    }
+
+
+def _migrate_v0(state):
+    """Unversioned files: unify the last_month/last_year and month_year/file_history schemas"""
+    if not state.get('month_year') and state.get('last_year') and state.get('last_month'):
+        state['month_year'] = f"{state['last_year']}-{int(state['last_month']):02d}"
+    if state.get('month_year') and not (state.get('last_year') and state.get('last_month')):
+        year, month = state['month_year'].split('-')
+        state['last_year'], state['last_month'] = int(year), int(month)
+    state.setdefault('previous_day_file', None)
+    state.setdefault('file_history', {})
+    state.setdefault('daily_snapshots', {})
+    return state
+
+
+# MIGRATIONS[n] upgrades a version-n state to version n + 1
+MIGRATIONS = {
+    0: _migrate_v0,
+}
+
+
+def migrate_state(state):
+    """Upgrade a loaded state dict to SCHEMA_VERSION"""
+    state = dict(state)
+    version = state.get('schema_version', 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"State schema version {version} is newer than supported ({SCHEMA_VERSION})")
+    while version < SCHEMA_VERSION:
+        state = MIGRATIONS[version](state)
+        version += 1
+        logger.info(f"Migrated state to schema version {version}")
+    state['schema_version'] = SCHEMA_VERSION
+    for key, value in default_state().items():
+        state.setdefault(key, value)
+    return state
+
+
+class FileLock:
+    """Exclusive inter-process lock on a lock file, re-entrant within a process
+
+    Uses fcntl.flock on POSIX and msvcrt.locking on Windows.
+    """
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT, poll_interval=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def _try_lock(self):
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self):
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._try_lock()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    self._file.close()
+                    self._file = None
+                    self._thread_lock.release()
+                    raise TimeoutError(f"Timed out waiting for lock {self.path}")
+                time.sleep(self.poll_interval)
+        self._depth = 1
+
+    def release(self):
+        self._depth -= 1
+        if not self._depth:
+            self._unlock()
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def atomic_write_json(path, data):
+    """Write JSON via a temp file in the same directory, fsync, then rename over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    if os.name != 'nt':
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class JsonStateStore:
+    """State in a JSON file guarded by <file>.lock"""
+
+    def __init__(self, path=STATE_FILE, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.lock = FileLock(f"{path}.lock", timeout=timeout)
+
+    def load(self):
+        """Read and migrate the state (defaults when missing or unreadable)
+
+        A state written by a newer release raises ValueError from migrate_state
+        instead of being treated as corrupt, so it is never overwritten.
+        """
+        if not os.path.exists(self.path):
+            return default_state()
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            # Only reachable for files written before atomic saves; keep them for inspection
+            backup = f"{self.path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            shutil.copyfile(self.path, backup)
+            logger.error(f"Unreadable state file {self.path} ({e}); saved a copy to {backup}")
+            return default_state()
+        return migrate_state(state)
+
+    def save(self, state):
+        """Replace the stored state atomically"""
+        with self.lock:
+            atomic_write_json(self.path, migrate_state(state))
+
+    @contextmanager
+    def update(self):
+        """Locked read-modify-write: changes to the yielded dict are saved on exit"""
+        with self.lock:
+            state = self.load()
+            yield state
+            self.save(state)
+
+
+class SqliteStateStore:
+    """State as key/JSON-value rows in SQLite (WAL mode, IMMEDIATE write transactions)
+
+    An empty database imports an existing ter_state.json on first load.
+    """
+
+    def __init__(self, path='ter_state.db', timeout=LOCK_TIMEOUT, import_from=STATE_FILE):
+        self.path = path
+        self.timeout = timeout
+        self.import_from = import_from
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        return conn
+
+    @staticmethod
+    def _read(conn):
+        return {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM state')}
+
+    @staticmethod
+    def _write(conn, state):
+        conn.execute('DELETE FROM state')
+        conn.executemany('INSERT INTO state (key, value) VALUES (?, ?)',
+                         [(key, json.dumps(value)) for key, value in state.items()])
+
+    def _initial(self):
+        if self.import_from and os.path.exists(self.import_from):
+            logger.info(f"Importing state from {self.import_from}")
+            return JsonStateStore(self.import_from).load()
+        return default_state()
+
+    def load(self):
+        conn = self._connect()
+        try:
+            state = self._read(conn)
+        finally:
+            conn.close()
+        return migrate_state(state) if state else self._initial()
+
+    def save(self, state):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self._write(conn, migrate_state(state))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def update(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = self._read(conn)
+            state = migrate_state(stored) if stored else self._initial()
+            try:
+                yield state
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._write(conn, migrate_state(state))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+
+def open_state_store(path=None):
+    """State store for a path (TER_STATE_FILE or ter_state.json by default)
+
+    Paths ending in .db / .sqlite / .sqlite3 use SQLite, anything else JSON.
+    """
+    path = path or os.environ.get('TER_STATE_FILE') or STATE_FILE
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteStateStore(path)
+    return JsonStateStore(path)
@@ -0,0 +1,405 @@
+"""
+Bounded-memory history jobs for AMFI TER panels
+Consecutive-snapshot (N-way) Base TER diffs, per-scheme trend statistics and
+per-category aggregates over the whole history store. The streaming path holds
+at most two snapshots plus per-scheme accumulators in memory and spills buffered
+results to disk when a memory ceiling is reached; the in-memory path computes the
+same tables from a fully loaded panel.
+"""
+
+import os
+import re
+import shutil
+import pickle
+import logging
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .ter_analysis import diff_ter_frames, categorize_fund
+from .ter_history import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('Regular', 'Direct')
+DEFAULT_MEMORY_LIMIT = 256 * 1024 ** 2
+
+# changes: {plan: frame or SpillBuffer}; trends and categories: DataFrames;
+# spill_dir: temporary directory of the streaming path's spilled parts
+HistoryResults = namedtuple('HistoryResults', ['changes', 'trends', 'categories', 'spill_dir'],
+                            defaults=(None,))
+
+_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2,
+          'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+def parse_size(value):
+    """Bytes from an int or a string like '512MB' / '2G'"""
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*', str(value).upper())
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class MemoryBudget:
+    """Memory ceiling shared by the spill buffers of one job
+
+    `reserved` counts bytes held outside the buffers (the snapshots being diffed).
+    When the total goes over the limit, the largest buffers spill to disk.
+    """
+
+    def __init__(self, limit=DEFAULT_MEMORY_LIMIT):
+        self.limit = parse_size(limit)
+        self.reserved = 0
+        self.buffers = []
+        self._warned = False
+
+    def used(self):
+        return self.reserved + sum(buffer.nbytes for buffer in self.buffers)
+
+    def enforce(self):
+        if self.reserved > self.limit and not self._warned:
+            logger.warning(f"Snapshots alone use {self.reserved:,d} bytes, above the "
+                           f"{self.limit:,d} byte memory limit")
+            self._warned = True
+        while self.used() > self.limit:
+            buffer = max(self.buffers, key=lambda b: b.nbytes)
+            if not buffer.nbytes:
+                break
+            buffer.spill()
+
+
+class SpillBuffer:
+    """Append-only sequence of frames, spilled to pickle files under a memory budget"""
+
+    def __init__(self, budget, spill_dir, name):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.name = name
+        self.frames = []
+        self.parts = []
+        self.nbytes = 0
+        self.rows = 0
+        self.columns = None
+        budget.buffers.append(self)
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        if frame.empty:
+            return
+        self.frames.append(frame)
+        self.nbytes += frame_bytes(frame)
+        self.rows += len(frame)
+        self.budget.enforce()
+
+    def spill(self):
+        """Write buffered frames to one part file and release them"""
+        if not self.frames:
+            return
+        path = os.path.join(self.spill_dir, f"{self.name}_{len(self.parts):05d}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(pd.concat(self.frames, ignore_index=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+        logger.debug(f"Spilled {self.nbytes:,d} bytes of {self.name} to {path}")
+        self.parts.append(path)
+        self.frames = []
+        self.nbytes = 0
+
+    def __iter__(self):
+        """Frames in append order, loading spilled parts one at a time"""
+        for path in self.parts:
+            with open(path, 'rb') as f:
+                yield pickle.load(f)
+        yield from self.frames
+
+    def to_frame(self):
+        frames = list(self)
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def to_csv(self, path, index=False):
+        """Write all rows to one CSV without loading every part at once"""
+        header = True
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            for frame in self:
+                frame.to_csv(f, index=index, header=header)
+                header = False
+            if header:
+                pd.DataFrame(columns=self.columns).to_csv(f, index=index)
+        return path
+
+
+def _categories(names, cache):
+    """categorize_fund for a column of names, remembering names already seen"""
+    missing = [name for name in pd.unique(names) if name not in cache]
+    cache.update((name, categorize_fund(name)) for name in missing)
+    return names.map(cache)
+
+
+def category_summary(frame, date, cache=None):
+    """Per fund category: scheme count and mean Regular / Direct TER and spread on one date
+
+    cache (a dict) remembers the category of names already seen across calls.
+    """
+    cache = {} if cache is None else cache
+    regular = frame['Regular Plan - Base TER (%)']
+    direct = frame['Direct Plan - Base TER (%)']
+    data = pd.DataFrame({
+        'Fund_Category': _categories(frame['Scheme Name'], cache).to_numpy(),
+        'Regular': regular.to_numpy(dtype=float),
+        'Direct': direct.to_numpy(dtype=float),
+        'Spread': (regular - direct).to_numpy(dtype=float),
+    })
+    grouped = data.groupby('Fund_Category', sort=True)
+    rows = pd.DataFrame({
+        'Schemes': grouped.size(),
+        'Mean Regular TER': grouped['Regular'].mean(),
+        'Mean Direct TER': grouped['Direct'].mean(),
+        'Mean Spread': grouped['Spread'].mean(),
+    }).reset_index()
+    rows.insert(0, 'Snapshot Date', date)
+    return rows
+
+
+def _round_categories(categories):
+    for col in ('Mean Regular TER', 'Mean Direct TER', 'Mean Spread'):
+        categories[col] = categories[col].round(6)
+    return categories.reset_index(drop=True)
+
+
+def _trend_columns(plan):
+    return [f'{plan} {name}' for name in
+            ('Observations', 'First TER', 'Last TER', 'Min TER', 'Max TER', 'Mean TER', 'Changes', 'Net Change')]
+
+
+def _finish_trends(trends, plans):
+    for plan in plans:
+        trends[f'{plan} Net Change'] = (trends[f'{plan} Last TER'] - trends[f'{plan} First TER']).round(4)
+        trends[f'{plan} Mean TER'] = trends[f'{plan} Mean TER'].round(6)
+        for name in ('Observations', 'Changes'):
+            trends[f'{plan} {name}'] = trends[f'{plan} {name}'].astype('int64')
+    columns = ['NSDL Scheme Code', 'Scheme Name', 'First Seen', 'Last Seen', 'Snapshots']
+    for plan in plans:
+        columns += _trend_columns(plan)
+    return trends[columns].reset_index(drop=True)
+
+
+# In-memory path
+
+def panel_changes(panel, plan):
+    """Base TER changes between consecutive snapshots of a panel, in date then code order"""
+    ter_col = f'{plan} Plan - Base TER (%)'
+    dates = np.sort(panel['Snapshot Date'].unique())
+    ordered = panel.assign(_pos=np.searchsorted(dates, panel['Snapshot Date'].to_numpy()))
+    ordered = ordered.sort_values(['NSDL Scheme Code', '_pos'], kind='mergesort').reset_index(drop=True)
+
+    codes = ordered['NSDL Scheme Code'].to_numpy()
+    pos = ordered['_pos'].to_numpy()
+    values = ordered[ter_col].to_numpy(dtype=float)
+    follows = np.zeros(len(ordered), dtype=bool)
+    follows[1:] = (codes[1:] == codes[:-1]) & (pos[1:] == pos[:-1] + 1)
+    old = np.full(len(ordered), np.nan)
+    old[1:] = values[:-1]
+    changed = follows & (old != values) & ~np.isnan(old) & ~np.isnan(values)
+
+    rows = ordered[changed]
+    result = pd.DataFrame({
+        'Snapshot Date': rows['Snapshot Date'].to_numpy(),
+        'NSDL Scheme Code': rows['NSDL Scheme Code'].to_numpy(),
+        'Scheme Name': rows['Scheme Name'].to_numpy(),
+        f'Old {ter_col}': np.round(old[changed], 4),
+        f'New {ter_col}': np.round(values[changed], 4),
+        'TER Date (Change)': rows['TER Date'].dt.strftime('%Y-%m-%d').to_numpy(),
+        'TER Reduction (%)': np.round(old[changed] - values[changed], 4),
+    })
+    return result.sort_values(['Snapshot Date', 'NSDL Scheme Code'], kind='mergesort').reset_index(drop=True)
+
+
+def panel_history(panel, plans=PLANS):
+    """Changes, trends and category aggregates from a fully loaded panel"""
+    changes = {plan: panel_changes(panel, plan) for plan in plans}
+
+    ordered = panel.sort_values(['NSDL Scheme Code', 'Snapshot Date'], kind='mergesort')
+    grouped = ordered.groupby('NSDL Scheme Code', sort=True)
+    trends = pd.DataFrame({
+        'Scheme Name': grouped['Scheme Name'].last(),
+        'First Seen': grouped['Snapshot Date'].min(),
+        'Last Seen': grouped['Snapshot Date'].max(),
+        'Snapshots': grouped.size(),
+    })
+    for plan in plans:
+        col = grouped[f'{plan} Plan - Base TER (%)']
+        trends[f'{plan} Observations'] = col.count()
+        trends[f'{plan} First TER'] = col.first()
+        trends[f'{plan} Last TER'] = col.last()
+        trends[f'{plan} Min TER'] = col.min()
+        trends[f'{plan} Max TER'] = col.max()
+        trends[f'{plan} Mean TER'] = col.mean()
+        counts = changes[plan]['NSDL Scheme Code'].value_counts()
+        trends[f'{plan} Changes'] = counts.reindex(trends.index, fill_value=0)
+    trends = _finish_trends(trends.rename_axis('NSDL Scheme Code').reset_index(), plans)
+
+    cache = {}
+    categories = pd.concat([category_summary(frame, date, cache)
+                            for date, frame in panel.groupby('Snapshot Date', sort=True)], ignore_index=True)
+    return HistoryResults(changes, trends, _round_categories(categories))
+
+
+# Streaming path
+
+class _TrendAccumulator:
+    """Per-scheme running statistics, grown as new scheme codes appear"""
+
+    def __init__(self, plans):
+        self.plans = plans
+        self.index = pd.Index([], dtype=object)
+        self.names = np.array([], dtype=object)
+        self.first_seen = np.array([], dtype='datetime64[ns]')
+        self.last_seen = np.array([], dtype='datetime64[ns]')
+        self.snapshots = np.zeros(0, dtype=np.int64)
+        self.stats = {plan: {key: np.zeros(0) for key in
+                             ('count', 'sum', 'first', 'last', 'min', 'max', 'changes')}
+                      for plan in plans}
+
+    def _grow(self, codes):
+        new_index = self.index.union(pd.Index(codes)) if len(self.index) else pd.Index(np.sort(codes))
+        if len(new_index) == len(self.index):
+            return
+        take = self.index.get_indexer(new_index)
+        present = take >= 0
+
+        def grown(values, fill):
+            out = np.full(len(new_index), fill, dtype=values.dtype)
+            out[present] = values[take[present]]
+            return out
+
+        self.names = grown(self.names, None)
+        self.first_seen = grown(self.first_seen, np.datetime64('NaT'))
+        self.last_seen = grown(self.last_seen, np.datetime64('NaT'))
+        self.snapshots = grown(self.snapshots, 0)
+        for stats in self.stats.values():
+            for key, values in stats.items():
+                stats[key] = grown(values, 0.0 if key in ('count', 'sum', 'changes') else np.nan)
+        self.index = new_index
+
+    def add(self, frame, date, changes):
+        codes = frame['NSDL Scheme Code'].to_numpy(dtype=object)
+        self._grow(codes)
+        pos = self.index.get_indexer(codes)
+        stamp = np.datetime64(pd.Timestamp(date).to_datetime64())
+        names = frame['Scheme Name'].to_numpy(dtype=object)
+        named = pd.notna(names)
+        self.names[pos[named]] = names[named]
+        self.first_seen[pos] = np.where(np.isnat(self.first_seen[pos]), stamp, self.first_seen[pos])
+        self.last_seen[pos] = stamp
+        self.snapshots[pos] += 1
+        for plan in self.plans:
+            stats = self.stats[plan]
+            values = frame[f'{plan} Plan - Base TER (%)'].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            p, v = pos[valid], values[valid]
+            stats['count'][p] += 1
+            stats['sum'][p] += v
+            stats['first'][p] = np.where(np.isnan(stats['first'][p]), v, stats['first'][p])
+            stats['last'][p] = v
+            stats['min'][p] = np.fmin(stats['min'][p], v)
+            stats['max'][p] = np.fmax(stats['max'][p], v)
+            changed = changes[plan]['NSDL Scheme Code'].to_numpy(dtype=object)
+            if len(changed):
+                stats['changes'][self.index.get_indexer(changed)] += 1
+
+    def frame(self):
+        trends = pd.DataFrame({
+            'NSDL Scheme Code': self.index.to_numpy(dtype=object),
+            'Scheme Name': self.names,
+            'First Seen': self.first_seen,
+            'Last Seen': self.last_seen,
+            'Snapshots': self.snapshots,
+        })
+        for plan in self.plans:
+            stats = self.stats[plan]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(stats['count'] > 0, stats['sum'] / stats['count'], np.nan)
+            trends[f'{plan} Observations'] = stats['count']
+            trends[f'{plan} First TER'] = stats['first']
+            trends[f'{plan} Last TER'] = stats['last']
+            trends[f'{plan} Min TER'] = stats['min']
+            trends[f'{plan} Max TER'] = stats['max']
+            trends[f'{plan} Mean TER'] = mean
+            trends[f'{plan} Changes'] = stats['changes']
+        return _finish_trends(trends, self.plans)
+
+
+def stream_history(history_dir='history', start=None, end=None, plans=PLANS,
+                   memory_limit=DEFAULT_MEMORY_LIMIT, spill_dir=None):
+    """Changes, trends and category aggregates over the history store in one pass
+
+    Snapshots are loaded one at a time; only the previous one is kept for the diff.
+    Change rows are buffered in SpillBuffers that spill to a temporary directory
+    under spill_dir once buffered rows and snapshots exceed memory_limit. The
+    returned changes are SpillBuffers (iterate, to_frame() or to_csv()); call
+    cleanup_spill(results) when done with them.
+    """
+    store = history_dir if isinstance(history_dir, HistoryStore) else HistoryStore(history_dir)
+    budget = MemoryBudget(memory_limit)
+    if spill_dir:
+        os.makedirs(spill_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix='ter_spill_', dir=spill_dir)
+    changes = {plan: SpillBuffer(budget, workdir, f"{plan.lower()}_changes") for plan in plans}
+    categories = []
+    trends = _TrendAccumulator(plans)
+    cache = {}
+
+    previous = None
+    count = 0
+    for date, current in store.iter_snapshots(start, end):
+        budget.reserved = frame_bytes(current) + (frame_bytes(previous) if previous is not None else 0)
+        step = {}
+        for plan in plans:
+            if previous is None:
+                step[plan] = diff_ter_frames(current.iloc[0:0], current.iloc[0:0], plan)
+            else:
+                step[plan] = diff_ter_frames(previous, current, plan)
+            step[plan].insert(0, 'Snapshot Date', date)
+            changes[plan].append(step[plan])
+        trends.add(current, date, step)
+        categories.append(category_summary(current, date, cache))
+        previous = current
+        count += 1
+        logger.debug(f"Streamed snapshot {date:%Y-%m-%d}: "
+                     + ', '.join(f"{plan} {len(step[plan])} changes" for plan in plans))
+    budget.reserved = 0
+
+    logger.info(f"Streamed {count} snapshots: "
+                + ', '.join(f"{plan} Plan {len(changes[plan])} changes" for plan in plans)
+                + f" ({sum(len(b.parts) for b in changes.values())} spilled parts)")
+    categories = pd.concat(categories, ignore_index=True) if categories else pd.DataFrame(
+        columns=['Snapshot Date', 'Fund_Category', 'Schemes', 'Mean Regular TER', 'Mean Direct TER', 'Mean Spread'])
+    return HistoryResults(changes, trends.frame(), _round_categories(categories), workdir)
+
+
+def cleanup_spill(results):
+    """Remove the spill directory of stream_history results"""
+    if results.spill_dir:
+        shutil.rmtree(results.spill_dir, ignore_errors=True)
+
+
+def load_history(history_dir='history', start=None, end=None, plans=PLANS):
+    """In-memory equivalent of stream_history: load the whole panel, then compute"""
+    store = history_dir if isinstance(history_dir, HistoryStore) else HistoryStore(history_dir)
+    panel = store.load_panel(start, end)
+    if panel is None:
+        raise ValueError(f"No snapshots in {store.history_dir}")
+    return panel_history(panel, plans)
@@ -0,0 +1,164 @@
+"""
+Subscription registry for per-team TER alerts
+Subscriber filters are compiled into inverted indexes so a day's change set is
+routed to every matching subscriber in a single pass
+"""
+
+import os
+import json
+import math
+import bisect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .ter_analysis import parse_scheme_code, categorize_fund
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_FILE = 'subscriptions.json'
+
+FILTER_KEYS = ('amcs', 'categories', 'watchlist')
+
+
+def _normalize_subscriber(entry):
+    """Validate a subscriber entry and normalize its filter values"""
+    if 'name' not in entry:
+        raise ValueError(f"Subscriber entry without a name: {entry}")
+    subscriber = dict(entry)
+    subscriber['amcs'] = sorted({str(a).strip().upper() for a in entry.get('amcs') or []})
+    subscriber['categories'] = sorted({str(c).strip().lower() for c in entry.get('categories') or []})
+    subscriber['watchlist'] = sorted({str(c).strip() for c in entry.get('watchlist') or []})
+    subscriber['min_change'] = float(entry.get('min_change') or 0.0)
+    subscriber['webhooks'] = list(entry.get('webhooks') or [])
+    subscriber['format'] = entry.get('format', 'text')
+    return subscriber
+
+
+def _check_unique_names(subscribers):
+    """Reject registries where two subscribers share a name (routing is keyed by name)"""
+    seen = set()
+    for subscriber in subscribers:
+        if subscriber['name'] in seen:
+            raise ValueError(f"Duplicate subscriber name: {subscriber['name']!r}")
+        seen.add(subscriber['name'])
+    return subscribers
+
+
+def load_subscriptions(path=SUBSCRIPTIONS_FILE):
+    """Load subscribers from a JSON registry file"""
+    if not os.path.exists(path):
+        logger.warning(f"Subscription registry not found: {path}")
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    entries = data.get('subscribers', []) if isinstance(data, dict) else data
+    return _check_unique_names([_normalize_subscriber(entry) for entry in entries])
+
+
+def save_subscriptions(subscribers, path=SUBSCRIPTIONS_FILE):
+    """Write subscribers back to the JSON registry file"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'subscribers': subscribers}, f, indent=2)
+
+
+class SubscriptionIndex:
+    """Inverted indexes over subscriber filters
+
+    Each subscriber is assigned one bit, ordered by ascending min_change so the
+    threshold filter is a prefix mask. For every filter dimension the index maps a
+    key to the mask of subscribers listing it, plus a wildcard mask of subscribers
+    that do not filter on that dimension. Routing a row is a handful of dict
+    lookups and integer ANDs, independent of the number of subscribers.
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = sorted(_check_unique_names([_normalize_subscriber(s) for s in subscribers]),
+                                  key=lambda s: s['min_change'])
+        self.thresholds = [s['min_change'] for s in self.subscribers]
+        self.indexes = {key: {} for key in FILTER_KEYS}
+        self.wildcards = {key: 0 for key in FILTER_KEYS}
+
+        for bit, subscriber in enumerate(self.subscribers):
+            mask = 1 << bit
+            for key in FILTER_KEYS:
+                values = subscriber[key]
+                if not values:
+                    self.wildcards[key] |= mask
+                for value in values:
+                    self.indexes[key][value] = self.indexes[key].get(value, 0) | mask
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def _threshold_mask(self, magnitude):
+        """Mask of subscribers whose min_change is at or below the magnitude"""
+        count = bisect.bisect_right(self.thresholds, magnitude + 1e-9)
+        return (1 << count) - 1
+
+    def match(self, row):
+        """Return the bit mask of subscribers interested in a change row"""
+        code = str(row.get('NSDL Scheme Code', '')).strip()
+        amc, asset_class, _ = parse_scheme_code(code)
+        categories = {categorize_fund(row.get('Scheme Name', '')).lower()}
+        if asset_class:
+            categories.add(asset_class.lower())
+
+        mask = self._threshold_mask(change_magnitude(row))
+        mask &= self.wildcards['amcs'] | self.indexes['amcs'].get(amc, 0)
+        if not mask:
+            return 0
+        category_mask = self.wildcards['categories']
+        for category in categories:
+            category_mask |= self.indexes['categories'].get(category, 0)
+        mask &= category_mask
+        mask &= self.wildcards['watchlist'] | self.indexes['watchlist'].get(code, 0)
+        return mask
+
+    def route(self, rows):
+        """Route a change set to subscribers in one pass, returning name -> rows"""
+        routed = {subscriber['name']: [] for subscriber in self.subscribers}
+        for row in rows:
+            mask = self.match(row)
+            while mask:
+                low = mask & -mask
+                routed[self.subscribers[low.bit_length() - 1]['name']].append(row)
+                mask ^= low
+        return routed
+
+
+def change_magnitude(row):
+    """Largest absolute Regular or Direct TER change in a change row"""
+    values = [row.get('Regular Reduction'), row.get('Direct Reduction'), row.get('TER Reduction (%)')]
+    values = [abs(float(v)) for v in values
+              if v is not None and not (isinstance(v, float) and math.isnan(v))]
+    return max(values) if values else 0.0
+
+
+def notify_subscribers(index, rows, report_date=None, max_workers=4):
+    """Render and send each subscriber's filtered change set to its webhooks"""
+    from .ter_notifier import render_messages, send_messages, create_session
+
+    routed = index.route(rows)
+    jobs = []
+    for subscriber in index.subscribers:
+        matched = routed[subscriber['name']]
+        if not matched or not subscriber['webhooks']:
+            continue
+        messages = render_messages(matched, fmt=subscriber['format'], report_date=report_date)
+        thread_key = f"amfi-ter-{report_date or 'latest'}-{subscriber['name']}"
+        jobs.extend((subscriber['name'], url, messages, thread_key) for url in subscriber['webhooks'])
+
+    results = {}
+    session = create_session(pool_size=max(max_workers, 1))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(name, url, executor.submit(send_messages, url, messages, thread_key, session))
+                       for name, url, messages, thread_key in jobs]
+            for name, url, future in futures:
+                results.setdefault(name, {})[url] = future.result()
+    finally:
+        session.close()
+
+    for subscriber in index.subscribers:
+        logger.info(f"Subscriber {subscriber['name']}: {len(routed[subscriber['name']])} matching changes")
+    return results
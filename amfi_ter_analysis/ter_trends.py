@@ -0,0 +1,291 @@
+"""
+Trend and volatility statistics for every scheme in the TER history
+Keeps Regular and Direct Base TER as scheme x snapshot-date matrices and computes,
+with array operations over the whole universe, each scheme's cumulative change,
+number of revisions, mean TER, volatility of its revisions and time since its last
+change, for the full history or any window. append() adds a new day in O(schemes)
+and keeps running totals, so the full-history summary never rescans the panel.
+"""
+
+import pickle
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('Regular', 'Direct')
+SUMMARY_COLUMNS = [
+    'NSDL Scheme Code', 'Scheme Name', 'Observations', 'First TER', 'Last TER', 'Cumulative Change',
+    'Revisions', 'Mean TER', 'Volatility', 'Last Change', 'Days Since Last Change',
+]
+
+
+def _revisions(matrix):
+    """Period changes between adjacent snapshots (NaN where either side is missing)"""
+    deltas = matrix[:, 1:] - matrix[:, :-1]
+    deltas[deltas == 0] = np.nan
+    return deltas
+
+
+class TrendPanel:
+    """Scheme-aligned TER panel with incrementally maintained statistics
+
+    Rows are scheme codes in order of first appearance, columns are snapshot dates in
+    increasing order. A revision is a Base TER move between two adjacent snapshots,
+    as in the daily diff; volatility is the standard deviation of revision sizes.
+    """
+
+    def __init__(self, plans=PLANS):
+        self.plans = tuple(plans)
+        self.codes = pd.Index([], dtype=object)
+        self.names = np.array([], dtype=object)
+        self.dates = []
+        self._data = np.full((len(self.plans), 0, 0), np.nan)
+        self._rows = 0
+        self._running = self._empty_running(0)
+
+    # Construction
+
+    @classmethod
+    def from_history(cls, history_dir='history', start=None, end=None, plans=PLANS):
+        """Panel of every snapshot in the history store (via the per-scheme index)"""
+        from .ter_history import history_index
+
+        index = history_index(history_dir)
+        index.refresh(force=True)
+        panel = cls(plans)
+        keep = np.ones(len(index.codes), dtype=bool)
+        if start is not None:
+            keep &= index.dates >= np.datetime64(pd.Timestamp(start), 'ns')
+        if end is not None:
+            keep &= index.dates <= np.datetime64(pd.Timestamp(end), 'ns')
+        codes, dates, values = index.codes[keep], index.dates[keep], index.values[keep]
+
+        code_ids, unique_codes = pd.factorize(codes, sort=True)
+        date_ids, unique_dates = pd.factorize(dates, sort=True)
+        panel.codes = pd.Index(unique_codes, dtype=object)
+        panel.names = np.array([index.names.get(code) for code in unique_codes], dtype=object)
+        panel.dates = [pd.Timestamp(date) for date in unique_dates]
+        panel._rows = len(unique_codes)
+        panel._data = np.full((len(panel.plans), len(unique_codes), len(unique_dates)), np.nan)
+        for p, plan in enumerate(panel.plans):
+            panel._data[p, code_ids, date_ids] = values[:, PLANS.index(plan)]
+        panel._running = panel._running_from_matrix()
+        return panel
+
+    def _empty_running(self, rows):
+        shape = (len(self.plans), rows)
+        return {
+            'observations': np.zeros(shape, dtype=np.int64),
+            'first': np.full(shape, np.nan),
+            'last': np.full(shape, np.nan),
+            'value_sum': np.zeros(shape),
+            'revisions': np.zeros(shape, dtype=np.int64),
+            'revision_sum': np.zeros(shape),
+            'revision_sq_sum': np.zeros(shape),
+            'last_change': np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]'),
+        }
+
+    def _running_from_matrix(self):
+        running = self._empty_running(self._rows)
+        for p in range(len(self.plans)):
+            stats = self._window_stats(p, 0, len(self.dates))
+            for key, value in stats.items():
+                running[key][p] = value
+        return running
+
+    # Incremental updates
+
+    def _grow(self, rows, cols):
+        plans, row_cap, col_cap = self._data.shape
+        if rows <= row_cap and cols <= col_cap:
+            return
+        # Double only the axis that ran out of room
+        shape = (plans, max(rows, 2 * row_cap) if rows > row_cap else row_cap,
+                 max(cols, 2 * col_cap) if cols > col_cap else col_cap)
+        grown = np.full(shape, np.nan)
+        grown[:, :row_cap, :col_cap] = self._data
+        self._data = grown
+
+    def append(self, date, frame):
+        """Add one normalized snapshot as the newest column and update the running stats"""
+        date = pd.Timestamp(date)
+        if self.dates and date <= self.dates[-1]:
+            raise ValueError(f"Snapshot {date:%Y-%m-%d} is not newer than "
+                             f"{self.dates[-1]:%Y-%m-%d}")
+        codes = frame['NSDL Scheme Code'].to_numpy(dtype=object)
+        rows = self.codes.get_indexer(codes)
+        new = rows < 0
+        if new.any():
+            new_codes = pd.unique(codes[new])
+            self.codes = self.codes.append(pd.Index(new_codes, dtype=object))
+            self.names = np.concatenate([self.names, np.full(len(new_codes), None, dtype=object)])
+            grown = self._empty_running(len(self.codes))
+            for key, values in self._running.items():
+                grown[key][:, :self._rows] = values
+            self._running = grown
+            rows = self.codes.get_indexer(codes)
+        self._rows = len(self.codes)
+        col = len(self.dates)
+        self._grow(self._rows, col + 1)
+        self.dates.append(date)
+        self.names[rows] = frame['Scheme Name'].to_numpy(dtype=object)
+
+        stamp = np.datetime64(date, 'ns')
+        running = self._running
+        for p, plan in enumerate(self.plans):
+            values = frame[f'{plan} Plan - Base TER (%)'].to_numpy(dtype=float)
+            self._data[p, rows, col] = values
+            current = self._data[p, :self._rows, col]
+            observed = ~np.isnan(current)
+            running['observations'][p] += observed
+            running['value_sum'][p] += np.where(observed, current, 0.0)
+            first = running['first'][p]
+            running['first'][p] = np.where(np.isnan(first), current, first)
+            running['last'][p] = np.where(observed, current, running['last'][p])
+            if col:
+                delta = current - self._data[p, :self._rows, col - 1]
+                revised = ~np.isnan(delta) & (delta != 0)
+                running['revisions'][p] += revised
+                running['revision_sum'][p] += np.where(revised, delta, 0.0)
+                running['revision_sq_sum'][p] += np.where(revised, delta * delta, 0.0)
+                running['last_change'][p][revised] = stamp
+
+    # Statistics
+
+    def matrix(self, plan):
+        """Scheme x date TER frame for one plan"""
+        p = self.plans.index(plan)
+        return pd.DataFrame(self._data[p, :self._rows, :len(self.dates)], index=self.codes,
+                            columns=pd.DatetimeIndex(self.dates, name='Date'))
+
+    def _window_stats(self, p, a, b):
+        """Running-stat equivalents over columns a..b-1 for plan index p"""
+        if b <= a:
+            return {key: values[p] for key, values in self._empty_running(self._rows).items()}
+        matrix = self._data[p, :self._rows, a:b]
+        rows = np.arange(self._rows)
+        observed = ~np.isnan(matrix)
+        any_observed = observed.any(axis=1)
+        first = np.where(any_observed, matrix[rows, np.argmax(observed, axis=1)], np.nan)
+        last_col = matrix.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+        last = np.where(any_observed, matrix[rows, last_col], np.nan)
+
+        deltas = _revisions(matrix)
+        revised = ~np.isnan(deltas)
+        last_change = np.full(self._rows, np.datetime64('NaT'), dtype='datetime64[ns]')
+        has_change = revised.any(axis=1)
+        if has_change.any():
+            last_rev = deltas.shape[1] - 1 - np.argmax(revised[:, ::-1], axis=1)
+            stamps = pd.DatetimeIndex(self.dates[a + 1:b]).to_numpy(dtype='datetime64[ns]')
+            last_change[has_change] = stamps[last_rev[has_change]]
+        return {
+            'observations': observed.sum(axis=1),
+            'first': first,
+            'last': last,
+            'value_sum': np.where(observed, matrix, 0.0).sum(axis=1),
+            'revisions': revised.sum(axis=1),
+            'revision_sum': np.where(revised, deltas, 0.0).sum(axis=1),
+            'revision_sq_sum': np.where(revised, deltas * deltas, 0.0).sum(axis=1),
+            'last_change': last_change,
+        }
+
+    def _bounds(self, start=None, end=None, window=None):
+        stamps = pd.DatetimeIndex(self.dates)
+        a = stamps.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        if end is not None:
+            b = stamps.searchsorted(pd.Timestamp(end), side='right')
+        else:
+            b = len(self.dates)
+        if window is not None:
+            a = max(a, b - window)
+        return a, b
+
+    def summary(self, plan='Regular', start=None, end=None, window=None):
+        """Per-scheme trend statistics over a date range or the last `window` snapshots
+
+        With no range the running totals answer in O(schemes).
+        """
+        if not self.dates:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        p = self.plans.index(plan)
+        a, b = self._bounds(start, end, window)
+        if (a, b) == (0, len(self.dates)):
+            stats = {key: values[p] for key, values in self._running.items()}
+        else:
+            stats = self._window_stats(p, a, b)
+        as_of = np.datetime64(self.dates[b - 1], 'ns')
+
+        observations = stats['observations']
+        revisions = stats['revisions']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(observations > 0, stats['value_sum'] / observations, np.nan)
+            revision_mean = stats['revision_sum'] / revisions
+            variance = stats['revision_sq_sum'] / revisions - revision_mean ** 2
+            volatility = np.where(revisions > 0, np.sqrt(np.clip(variance, 0, None)), np.nan)
+        days = (as_of - stats['last_change']).astype('timedelta64[D]').astype(float)
+        days[np.isnat(stats['last_change'])] = np.nan
+
+        result = pd.DataFrame({
+            'NSDL Scheme Code': self.codes.to_numpy(dtype=object),
+            'Scheme Name': self.names,
+            'Observations': observations,
+            'First TER': stats['first'],
+            'Last TER': stats['last'],
+            'Cumulative Change': np.round(stats['last'] - stats['first'], 4),
+            'Revisions': revisions,
+            'Mean TER': np.round(mean, 6),
+            'Volatility': np.round(volatility, 6),
+            'Last Change': stats['last_change'],
+            'Days Since Last Change': days,
+        })
+        result = result[result['Observations'] > 0]
+        return result.sort_values('NSDL Scheme Code', kind='mergesort').reset_index(drop=True)
+
+    def rolling(self, plan='Regular', window=20):
+        """Rolling mean TER and revision volatility over the last `window` snapshots, per date
+
+        Returns (mean, volatility) scheme x date frames computed with cumulative sums.
+        """
+        p = self.plans.index(plan)
+        matrix = self._data[p, :self._rows, :len(self.dates)]
+
+        def windowed(values, width=window):
+            # Sum over the trailing `width` columns via differences of cumulative sums
+            if width <= 0:
+                return np.zeros_like(values)
+            cumulative = np.cumsum(values, axis=1)
+            lagged = np.zeros_like(cumulative)
+            if width < cumulative.shape[1]:
+                lagged[:, width:] = cumulative[:, :-width]
+            return cumulative - lagged
+
+        observed = ~np.isnan(matrix)
+        count = windowed(observed.astype(float))
+        total = windowed(np.where(observed, matrix, 0.0))
+
+        deltas = np.concatenate([np.full((self._rows, 1), np.nan), _revisions(matrix)], axis=1)
+        revised = ~np.isnan(deltas)
+        # A window of `window` snapshots spans window - 1 revisions
+        n = windowed(revised.astype(float), window - 1)
+        s = windowed(np.where(revised, deltas, 0.0), window - 1)
+        sq = windowed(np.where(revised, deltas * deltas, 0.0), window - 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            volatility = np.where(n > 0, np.sqrt(np.clip(sq / n - (s / n) ** 2, 0, None)), np.nan)
+        columns = pd.DatetimeIndex(self.dates, name='Date')
+        return (pd.DataFrame(np.round(mean, 6), index=self.codes, columns=columns),
+                pd.DataFrame(np.round(volatility, 6), index=self.codes, columns=columns))
+
+    # Persistence
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
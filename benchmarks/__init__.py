@@ -0,0 +1 @@
+"""Benchmark suite for AMFI TER analysis (see benchmarks/run.py)"""
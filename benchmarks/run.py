@@ -0,0 +1,275 @@
+"""
+Benchmark runner
+Runs the suite over synthetic universes of several sizes and change rates, stores the
+results per git commit under benchmarks/results/, and compares two stored runs.
+
+    python -m benchmarks.run run [--quick] [--sizes 1500,15000] [--rates 0.01,0.05]
+    python -m benchmarks.run compare [BASE] [HEAD] [--threshold 0.1]
+    python -m benchmarks.run list
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from .suite import REPO_ROOT, Universe, select, quiet, working_directory
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# Today's AMFI universe is ~1.5k schemes; scale up to 1M rows
+DEFAULT_SIZES = [1_500, 15_000, 150_000, 1_000_000]
+DEFAULT_RATES = [0.01, 0.05, 0.25]
+QUICK_SIZES = [1_500, 15_000]
+QUICK_RATES = [0.05]
+
+
+def git_commit():
+    """Current commit hash (short) and whether the worktree has uncommitted changes"""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+
+    commit = git('rev-parse', '--short=12', 'HEAD') or 'unknown'
+    dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+    return commit, dirty
+
+
+def machine_info():
+    """Environment details stored with each result set"""
+    import numpy
+    import pandas
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+    }
+
+
+def time_call(func, repeat, workdir):
+    """Time func `repeat` times in workdir, returning the per-call durations"""
+    durations = []
+    with working_directory(workdir), quiet():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def traced_peak(func, workdir):
+    """Peak traced Python allocation of one extra call"""
+    tracemalloc.start()
+    try:
+        with working_directory(workdir), quiet():
+            func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def result_key(result):
+    return (result['benchmark'], result['rows'], result['change_rate'])
+
+
+def run_suite(sizes, rates, benchmarks, repeat=3, memory=False, log=print):
+    """Run benchmarks over every size and change rate and return the result rows"""
+    results = []
+    for rows in sizes:
+        rate_free_done = set()
+        for rate in rates:
+            with tempfile.TemporaryDirectory(prefix='ter_bench_') as workdir:
+                universe = Universe(rows, rate, workdir)
+                for bench in benchmarks:
+                    if not bench.uses_rate and bench.name in rate_free_done:
+                        continue
+                    if bench.max_rows is not None and rows > bench.max_rows:
+                        continue
+                    if bench.max_changes is not None and universe.expected_changes > bench.max_changes:
+                        continue
+                    if not bench.uses_rate:
+                        rate_free_done.add(bench.name)
+                    result = {
+                        'benchmark': bench.name,
+                        'rows': rows,
+                        'change_rate': rate if bench.uses_rate else None,
+                        'repeat': repeat,
+                    }
+                    rate_label = f"{rate:.2%}" if bench.uses_rate else 'n/a'
+                    label = f"{bench.name:<24s} rows={rows:<9,d} rate={rate_label:<7s}"
+                    try:
+                        func = bench.setup(universe)
+                        durations = time_call(func, repeat, workdir)
+                        peak = traced_peak(func, workdir) if memory else None
+                    except Exception as e:
+                        # Keep going so one broken code path does not hide the others
+                        result['error'] = f"{type(e).__name__}: {e}"
+                        results.append(result)
+                        log(f"{label} FAILED {result['error']}")
+                        continue
+                    result.update({
+                        'median_seconds': statistics.median(durations),
+                        'min_seconds': min(durations),
+                        'peak_memory_bytes': peak,
+                    })
+                    results.append(result)
+                    log(f"{label} median={result['median_seconds']:.4f}s min={result['min_seconds']:.4f}s")
+    return results
+
+
+def results_path(commit):
+    return RESULTS_DIR / f"{commit}.json"
+
+
+def save_results(results, commit, dirty):
+    """Merge results into the commit's result file (newer rows replace older ones)"""
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = results_path(commit)
+    stored = load_results(commit) if path.exists() else {'results': []}
+    merged = {result_key(r): r for r in stored['results']}
+    merged.update((result_key(r), r) for r in results)
+    data = {
+        'commit': commit,
+        'dirty': dirty or stored.get('dirty', False),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'results': sorted(merged.values(), key=lambda r: (r['benchmark'], r['rows'], r['change_rate'] or 0)),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def load_results(commit):
+    with open(results_path(commit), 'r') as f:
+        return json.load(f)
+
+
+def stored_runs():
+    """Stored result sets, oldest first"""
+    runs = []
+    for path in RESULTS_DIR.glob('*.json'):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        runs.append((data.get('timestamp', ''), data['commit']))
+    return [commit for _, commit in sorted(runs)]
+
+
+def compare_results(base, head, threshold=0.1, min_seconds=0.001):
+    """Pair up results of two runs; returns rows of (key, base_s, head_s, ratio, verdict)
+
+    Timings below min_seconds on both sides are reported but never flagged, since
+    they are dominated by timer noise.
+    """
+    base_rows = {result_key(r): r for r in base['results']}
+    rows = []
+    for result in head['results']:
+        key = result_key(result)
+        if key not in base_rows or 'error' in base_rows[key]:
+            continue
+        if 'error' in result:
+            rows.append((key, base_rows[key]['median_seconds'], None, None, 'BROKEN'))
+            continue
+        base_s = base_rows[key]['median_seconds']
+        head_s = result['median_seconds']
+        ratio = head_s / base_s if base_s else float('inf')
+        if max(base_s, head_s) < min_seconds:
+            verdict = ''
+        elif ratio > 1 + threshold:
+            verdict = 'REGRESSION'
+        elif ratio < 1 / (1 + threshold):
+            verdict = 'improved'
+        else:
+            verdict = ''
+        rows.append((key, base_s, head_s, ratio, verdict))
+    return rows
+
+
+def cmd_run(args):
+    sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    rates = QUICK_RATES if args.quick else DEFAULT_RATES
+    if args.sizes:
+        sizes = [int(v) for v in args.sizes.split(',')]
+    if args.rates:
+        rates = [float(v) for v in args.rates.split(',')]
+
+    commit, dirty = git_commit()
+    print(f"Benchmarking {commit}{' (uncommitted changes)' if dirty else ''}: "
+          f"sizes={sizes} rates={rates}")
+    results = run_suite(sizes, rates, select(args.bench), repeat=args.repeat, memory=args.memory)
+    if not args.no_save:
+        print(f"Saved {save_results(results, commit, dirty)}")
+    return 0
+
+
+def cmd_compare(args):
+    runs = stored_runs()
+    head = args.head or git_commit()[0]
+    if not results_path(head).exists():
+        print(f"No stored results for {head}; run: python -m benchmarks.run run", file=sys.stderr)
+        return 2
+    base = args.base or next((commit for commit in reversed(runs) if commit != head), None)
+    if base is None or not results_path(base).exists():
+        print("No baseline results to compare against", file=sys.stderr)
+        return 2
+
+    rows = compare_results(load_results(base), load_results(head), args.threshold, args.min_seconds)
+    print(f"{'Benchmark':<24s} {'Rows':>9s} {'Rate':>6s} {base:>12s} {head:>12s} {'Ratio':>7s}")
+    for (name, rows_n, rate), base_s, head_s, ratio, verdict in rows:
+        rate_label = f"{rate:.0%}" if rate is not None else '-'
+        head_label = f"{head_s:>11.4f}s {ratio:>6.2f}x" if head_s is not None else f"{'error':>12s} {'':>7s}"
+        print(f"{name:<24s} {rows_n:>9,d} {rate_label:>6s} {base_s:>11.4f}s {head_label} {verdict}")
+
+    regressions = [row for row in rows if row[4] in ('REGRESSION', 'BROKEN')]
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%} out of {len(rows)} comparisons")
+    return 1 if regressions else 0
+
+
+def cmd_list(args):
+    for commit in stored_runs():
+        data = load_results(commit)
+        print(f"{commit}  {data['timestamp']}  {len(data['results'])} results"
+              f"{'  (dirty)' if data.get('dirty') else ''}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='AMFI TER benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Run the suite and store results for the current commit')
+    run.add_argument('--quick', action='store_true', help=f'Sizes {QUICK_SIZES}, rates {QUICK_RATES}')
+    run.add_argument('--sizes', help='Comma separated row counts')
+    run.add_argument('--rates', help='Comma separated change rates (fraction of schemes changed)')
+    run.add_argument('--bench', action='append', help='Only this benchmark (repeatable)')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--memory', action='store_true', help='Also record peak traced memory')
+    run.add_argument('--no-save', action='store_true')
+    run.set_defaults(func=cmd_run)
+
+    compare = commands.add_parser('compare', help='Compare two stored runs and flag regressions')
+    compare.add_argument('base', nargs='?', help='Baseline commit (default: previous stored run)')
+    compare.add_argument('head', nargs='?', help='Commit to check (default: current commit)')
+    compare.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown (default: 0.1)')
+    compare.add_argument('--min-seconds', type=float, default=0.001,
+                         help='Ignore benchmarks faster than this on both sides (default: 0.001)')
+    compare.set_defaults(func=cmd_compare)
+
+    listing = commands.add_parser('list', help='List stored runs')
+    listing.set_defaults(func=cmd_list)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+"""
+Benchmark definitions
+Each benchmark prepares its inputs from a Universe (previous and current synthetic
+snapshots plus derived files) and returns the zero-argument callable that is timed
+"""
+
+import os
+import io
+import sys
+import runpy
+import logging
+import importlib.util
+from collections import namedtuple
+from contextlib import contextmanager, redirect_stdout
+from functools import cached_property
+from pathlib import Path
+
+from .synthetic import make_universe, perturb
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from amfi_ter_analysis import ter_analysis, ter_core  # noqa: E402
+
+# uses_rate=False marks benchmarks whose inputs do not depend on the change rate;
+# they run once per size. max_rows / max_changes skip sizes the code under test
+# cannot handle in reasonable time (the root scripts are quadratic in changes).
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'uses_rate', 'max_rows', 'max_changes'],
+                       defaults=(True, None, None))
+
+
+@contextmanager
+def working_directory(path):
+    """Run a block inside a directory, restoring the previous one afterwards"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def quiet():
+    """Silence the print and logging output of the code under test"""
+    logging.disable(logging.CRITICAL)
+    try:
+        with redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def load_script(name, workdir):
+    """Import a repository root script as a module, running its import-time setup in workdir"""
+    os.makedirs(Path(workdir) / 'logs', exist_ok=True)
+    spec = importlib.util.spec_from_file_location(f'bench_{name}', REPO_ROOT / f'{name}.py')
+    module = importlib.util.module_from_spec(spec)
+    with working_directory(workdir), quiet():
+        spec.loader.exec_module(module)
+    return module
+
+
+class Universe:
+    """Synthetic previous/current snapshots of one size and change rate, with derived inputs"""
+
+    def __init__(self, rows, change_rate, workdir, seed=0):
+        self.rows = rows
+        self.change_rate = change_rate
+        self.workdir = Path(workdir)
+        self.seed = seed
+        (self.workdir / 'output').mkdir(parents=True, exist_ok=True)
+
+    @cached_property
+    def previous(self):
+        return make_universe(self.rows, seed=self.seed)
+
+    @cached_property
+    def current(self):
+        return perturb(self.previous, self.change_rate, seed=self.seed + 1)
+
+    @cached_property
+    def previous_normalized(self):
+        return ter_analysis.normalize_ter_frame(self.previous)
+
+    @cached_property
+    def current_normalized(self):
+        return ter_analysis.normalize_ter_frame(self.current)
+
+    @cached_property
+    def changes(self):
+        """Regular and Direct change frames in the output/<plan>_Plan_TER_Changes layout"""
+        return tuple(ter_analysis.diff_ter_frames(self.previous_normalized, self.current_normalized, plan)
+                     for plan in ('Regular', 'Direct'))
+
+    @cached_property
+    def comparison(self):
+        return ter_analysis.compare_plan_changes(*self.changes)
+
+    @property
+    def expected_changes(self):
+        return int(round(self.rows * self.change_rate))
+
+    @cached_property
+    def workbook_path(self):
+        path = self.workdir / 'TER_previous.xlsx'
+        self.previous.to_excel(path, index=False)
+        return path
+
+    @cached_property
+    def snapshot_paths(self):
+        """Normalized previous/current snapshots as baseline-layout CSVs"""
+        paths = (self.workdir / 'previous_snapshot.csv', self.workdir / 'current_snapshot.csv')
+        self.previous_normalized.to_csv(paths[0], index=False)
+        self.current_normalized.to_csv(paths[1], index=False)
+        return paths
+
+    def write_change_files(self, suffix=''):
+        """Write the change CSVs the root scripts read from output/"""
+        regular, direct = self.changes
+        regular.to_csv(self.workdir / 'output' / f'Regular_Plan_TER_Changes{suffix}.csv', index=False)
+        direct.to_csv(self.workdir / 'output' / f'Direct_Plan_TER_Changes{suffix}.csv', index=False)
+
+
+def setup_read_ter_file(universe):
+    path = universe.workbook_path
+    return lambda: ter_analysis.read_ter_file(path)
+
+
+def setup_find_ter_columns(universe):
+    frame = universe.previous
+    return lambda: ter_analysis.find_ter_columns(frame)
+
+
+def setup_normalize(universe):
+    frame = universe.current
+    return lambda: ter_analysis.normalize_ter_frame(frame)
+
+
+def setup_diff_ter_frames(universe):
+    previous, current = universe.previous_normalized, universe.current_normalized
+    return lambda: [ter_analysis.diff_ter_frames(previous, current, plan) for plan in ('Regular', 'Direct')]
+
+
+def setup_read_snapshot(universe):
+    path = universe.snapshot_paths[1]
+    return lambda: ter_core.read_snapshot(path)
+
+
+def setup_diff_snapshots(universe):
+    previous, current = (ter_core.read_snapshot(path) for path in universe.snapshot_paths)
+    return lambda: ter_core.compare_snapshots(previous, current)
+
+
+def setup_analyze_ter_changes(universe):
+    # analyze_ter_changes merges the two months on differently named columns (its
+    # merge would suffix identical names), as in two months' workbook exports
+    previous, current = universe.previous.add_prefix('Previous '), universe.current
+    return lambda: ter_analysis.analyze_ter_changes(previous, current)
+
+
+def setup_compare_ter_daily(universe):
+    module = load_script('ter_daily_automation', universe.workdir)
+    previous, current = universe.previous, universe.current
+    return lambda: module.compare_ter_daily(current, previous)
+
+
+def setup_compare_plan_changes(universe):
+    regular, direct = universe.changes
+    return lambda: ter_analysis.compare_plan_changes(regular, direct)
+
+
+def setup_classify_changes(universe):
+    comparison = universe.comparison
+    return lambda: ter_analysis.classify_changes(comparison)
+
+
+def setup_categorize_fund(universe):
+    names = universe.current['Scheme Name']
+    return lambda: names.map(ter_analysis.categorize_fund)
+
+
+def setup_generate_notification(universe):
+    universe.write_change_files(suffix='_bench')
+    universe.previous_normalized.to_csv(universe.workdir / 'baseline_ter_data.csv', index=False)
+    module = load_script('ter_github_actions', universe.workdir)
+    return module.generate_notification
+
+
+def setup_create_comparison(universe):
+    universe.write_change_files()
+    script = str(REPO_ROOT / 'create_comparison.py')
+    return lambda: runpy.run_path(script, run_name='__main__')
+
+
+BENCHMARKS = [
+    Benchmark('read_ter_file', setup_read_ter_file, uses_rate=False, max_rows=100_000),
+    Benchmark('find_ter_columns', setup_find_ter_columns, uses_rate=False),
+    Benchmark('normalize_ter_frame', setup_normalize),
+    Benchmark('diff_ter_frames', setup_diff_ter_frames),
+    Benchmark('read_snapshot', setup_read_snapshot, uses_rate=False),
+    Benchmark('diff_snapshots', setup_diff_snapshots),
+    Benchmark('analyze_ter_changes', setup_analyze_ter_changes, max_changes=250_000),
+    Benchmark('compare_ter_daily', setup_compare_ter_daily, max_changes=250_000),
+    Benchmark('compare_plan_changes', setup_compare_plan_changes),
+    Benchmark('classify_changes', setup_classify_changes),
+    Benchmark('categorize_fund', setup_categorize_fund, uses_rate=False),
+    Benchmark('generate_notification', setup_generate_notification, max_changes=20_000),
+    Benchmark('create_comparison', setup_create_comparison, max_changes=20_000),
+]
+
+
+def select(names=None):
+    """Benchmarks filtered by name (all when names is empty)"""
+    if not names:
+        return list(BENCHMARKS)
+    known = {bench.name: bench for bench in BENCHMARKS}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}")
+    return [known[name] for name in names]
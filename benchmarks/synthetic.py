@@ -0,0 +1,100 @@
+"""
+Synthetic TER universes for benchmarks
+Builds workbook-shaped frames (same 15 columns as the AMFI export) of any size and
+derives a "next day" snapshot with a chosen fraction of Base TER changes
+"""
+
+import numpy as np
+import pandas as pd
+
+AMCS = ['360O', 'ABSL', 'AXIS', 'BAR', 'DSP', 'EDEL', 'FRTN', 'HDFC', 'ICICI', 'INVS',
+        'KOTAK', 'MIRA', 'MOTI', 'NIPP', 'PPFAS', 'QUANT', 'SBI', 'SUND', 'TATA', 'UTI']
+
+# (asset class letter, sub-category code, name stem, Scheme Category) - names carry the
+# keywords categorize_fund looks for so every category is represented
+FUND_TYPES = [
+    ('E', 'LCF', 'Large Cap Equity Fund', 'Equity Scheme - Large Cap Fund'),
+    ('E', 'MCF', 'Midcap Growth Fund', 'Equity Scheme - Mid Cap Fund'),
+    ('E', 'SCF', 'Smallcap Fund', 'Equity Scheme - Small Cap Fund'),
+    ('D', 'LQF', 'Liquid Fund', 'Debt Scheme - Liquid Fund'),
+    ('D', 'SDF', 'Short Duration Fund', 'Debt Scheme - Short Duration Fund'),
+    ('D', 'GLF', 'Gilt Fund', 'Debt Scheme - Gilt Fund'),
+    ('H', 'BHF', 'Balanced Hybrid Fund', 'Hybrid Scheme - Balanced Hybrid Fund'),
+    ('H', 'ARB', 'Arbitrage Fund', 'Hybrid Scheme - Arbitrage Fund'),
+    ('O', 'IXF', 'Nifty 50 Index Fund', 'Other Scheme - Index Funds'),
+    ('O', 'ETF', 'Sensex ETF', 'Other Scheme - Other  ETFs'),
+    ('O', 'FOF', 'Global FoF', 'Other Scheme - FoF Overseas'),
+    ('S', 'RET', 'Retirement Fund', 'Solution Oriented Scheme - Retirement Fund'),
+]
+
+PLAN_COLUMNS = [
+    'Base TER (%)',
+    'Additional expense as per Regulation 52(6A)(b) (%)',
+    'Additional expense as per Regulation 52(6A)(c) (%)',
+    'GST (%)',
+    'Total TER (%)',
+]
+
+WORKBOOK_COLUMNS = (['NSDL Scheme Code', 'Scheme Name', 'Scheme Type', 'Scheme Category', 'TER Date']
+                    + [f'Regular Plan - {col}' for col in PLAN_COLUMNS]
+                    + [f'Direct Plan - {col}' for col in PLAN_COLUMNS])
+
+
+def _plan_columns(base, rng):
+    """Additional expense, GST and total columns derived from a Base TER array"""
+    additional = np.where(rng.random(len(base)) < 0.5, 0.05, 0.0)
+    gst = np.round(base * 0.18 * 0.1, 2)
+    return [base, np.zeros(len(base), dtype=np.int64), additional, gst, np.round(base + additional + gst, 2)]
+
+
+def make_universe(n_rows, seed=0, ter_date='2026-02-01'):
+    """Build a workbook-shaped frame with n_rows schemes (one row per scheme)"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n_rows)
+    amc = np.array(AMCS)[ids % len(AMCS)]
+    fund = rng.integers(0, len(FUND_TYPES), n_rows)
+    letters = np.array([t[0] for t in FUND_TYPES])[fund]
+    subcats = np.array([t[1] for t in FUND_TYPES])[fund]
+    stems = np.array([t[2] for t in FUND_TYPES])[fund]
+    categories = np.array([t[3] for t in FUND_TYPES])[fund]
+
+    codes = [f'{a}/O/{l}/{s}/{i % 20 + 10:02d}/{i % 12 + 1:02d}/{i:07d}'
+             for a, l, s, i in zip(amc.tolist(), letters.tolist(), subcats.tolist(), ids.tolist())]
+    names = [f'{a} {s} {i}' for a, s, i in zip(amc.tolist(), stems.tolist(), ids.tolist())]
+
+    regular = np.round(rng.uniform(0.5, 2.25, n_rows), 2)
+    direct = np.round(np.maximum(regular - rng.uniform(0.3, 1.2, n_rows), 0.05), 2)
+
+    data = {
+        'NSDL Scheme Code': codes,
+        'Scheme Name': names,
+        'Scheme Type': 'Open Ended',
+        'Scheme Category': categories,
+        'TER Date': pd.Timestamp(ter_date),
+    }
+    for plan, base in (('Regular', regular), ('Direct', direct)):
+        for col, values in zip(PLAN_COLUMNS, _plan_columns(base, rng)):
+            data[f'{plan} Plan - {col}'] = values
+    return pd.DataFrame(data, columns=WORKBOOK_COLUMNS)
+
+
+def perturb(df, change_rate, seed=1, ter_date='2026-02-02'):
+    """Next snapshot: change_rate of schemes get a new Regular and/or Direct Base TER"""
+    rng = np.random.default_rng(seed)
+    changed = df.copy()
+    n_rows = len(df)
+    n_changed = int(round(n_rows * change_rate))
+    picked = rng.choice(n_rows, size=n_changed, replace=False)
+    # Most revisions move both plans; some touch only one
+    plans = rng.integers(0, 3, n_changed)
+    deltas = np.round(rng.uniform(-0.25, 0.1, n_changed), 2)
+    deltas[deltas == 0] = -0.01
+
+    for plan, selected in (('Regular', plans != 2), ('Direct', plans != 1)):
+        col = f'{plan} Plan - Base TER (%)'
+        rows = picked[selected]
+        values = changed[col].to_numpy(copy=True)
+        values[rows] = np.round(np.maximum(values[rows] + deltas[selected], 0.01), 2)
+        changed[col] = values
+    changed.loc[changed.index[picked], 'TER Date'] = pd.Timestamp(ter_date)
+    return changed
@@ -1,5 +1,12 @@
+import os
+
 import pandas as pd
 
+from amfi_ter_analysis.ter_pairing import pairing_index
+
+# history/ beside this script holds the scheme id assignments
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+
 print("Creating comparison file for Direct vs Regular Plan TER changes...")
 
 # Read both files
@@ -11,37 +18,27 @@ print("Reading Direct Plan file...")
 dir_df = pd.read_csv('output/Direct_Plan_TER_Changes.csv')
 print(f"Direct Plan: {len(dir_df)} schemes")
 
-# Find common schemes (appear in both files)
-reg_codes = set(reg_df['NSDL Scheme Code'])
-dir_codes = set(dir_df['NSDL Scheme Code'])
-common_codes = reg_codes.intersection(dir_codes)
+# Pair common schemes (appear in both files) on scheme id: NSDL code, or name for records without one
+pairing = pairing_index(HISTORY_DIR)
+paired = pairing.pair(reg_df, dir_df, how='inner', suffixes=('_Regular', '_Direct'))
+pairing.save()
 
-print(f"\nCommon schemes in both files: {len(common_codes)}")
+print(f"\nCommon schemes in both files: {len(paired)}")
 
 # Create comparison dataframe
-comparison_data = []
-
-for code in common_codes:
-    reg_row = reg_df[reg_df['NSDL Scheme Code'] == code].iloc[0]
-    dir_row = dir_df[dir_df['NSDL Scheme Code'] == code].iloc[0]
-    
-    # Calculate difference in TER Reduction (Direct vs Regular)
-    reduction_diff = dir_row['TER Reduction (%)'] - reg_row['TER Reduction (%)']
-    
-    comparison_data.append({
-        'NSDL Scheme Code': code,
-        'Scheme Name': reg_row['Scheme Name'],
-        'TER Date (Change)': '2026-02-01',
-        'Old Regular Plan - Base TER (%)': reg_row['Old Regular Plan - Base TER (%)'],
-        'New Regular Plan - Base TER (%)': reg_row['New Regular Plan - Base TER (%)'],
-        'Regular Plan - TER Reduction (%)': reg_row['TER Reduction (%)'],
-        'Old Direct Plan - Base TER (%)': dir_row['Old Direct Plan - Base TER (%)'],
-        'New Direct Plan - Base TER (%)': dir_row['New Direct Plan - Base TER (%)'],
-        'Direct Plan - TER Reduction (%)': dir_row['TER Reduction (%)'],
-        'Difference (Direct - Regular) TER Reduction (%)': reduction_diff
-    })
-
-comparison_df = pd.DataFrame(comparison_data)
+comparison_df = pd.DataFrame({
+    'NSDL Scheme Code': paired['NSDL Scheme Code'],
+    'Scheme Name': paired['Scheme Name'],
+    'TER Date (Change)': '2026-02-01',
+    'Old Regular Plan - Base TER (%)': paired['Old Regular Plan - Base TER (%)'],
+    'New Regular Plan - Base TER (%)': paired['New Regular Plan - Base TER (%)'],
+    'Regular Plan - TER Reduction (%)': paired['TER Reduction (%)_Regular'],
+    'Old Direct Plan - Base TER (%)': paired['Old Direct Plan - Base TER (%)'],
+    'New Direct Plan - Base TER (%)': paired['New Direct Plan - Base TER (%)'],
+    'Direct Plan - TER Reduction (%)': paired['TER Reduction (%)_Direct'],
+    # Difference in TER Reduction (Direct vs Regular)
+    'Difference (Direct - Regular) TER Reduction (%)': paired['TER Reduction (%)_Direct'] - paired['TER Reduction (%)_Regular'],
+})
 comparison_df = comparison_df.sort_values('NSDL Scheme Code').reset_index(drop=True)
 
 # Save to CSV
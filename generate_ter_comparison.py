@@ -2,6 +2,11 @@ import pandas as pd
 import os
 import sys
 
+from amfi_ter_analysis.ter_cube import TerCube
+from amfi_ter_analysis.ter_pairing import pairing_index
+
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+
 print("=" * 80)
 print("TER Comparison Report Generator")
 print("=" * 80)
@@ -58,12 +63,14 @@ regular_df = regular_df.rename(columns={
 direct_df = direct_df[['NSDL Scheme Code', 'Scheme Name', 'TER_Date', 'Direct_Old_TER', 'Direct_New_TER']]
 regular_df = regular_df[['NSDL Scheme Code', 'Scheme Name', 'TER_Date', 'Regular_Old_TER', 'Regular_New_TER']]
 
-# Merge on NSDL Scheme Code and Scheme Name
-merged_df = pd.merge(direct_df, regular_df, on=['NSDL Scheme Code', 'Scheme Name'], how='outer')
+# Pair plans on scheme id (NSDL code, or name for records without one)
+pairing = pairing_index(HISTORY_DIR)
+merged_df = pairing.pair(regular_df, direct_df, how='outer', suffixes=('_Regular', '_Direct'))
+pairing.save()
 
 # Handle TER_Date from both dataframes (they should be the same, but just in case)
-merged_df['TER_Date'] = merged_df['TER_Date_x'].fillna(merged_df['TER_Date_y'])
-merged_df = merged_df.drop(['TER_Date_x', 'TER_Date_y'], axis=1)
+merged_df['TER_Date'] = merged_df['TER_Date_Direct'].fillna(merged_df['TER_Date_Regular'])
+merged_df = merged_df.drop(['TER_Date_Regular', 'TER_Date_Direct'], axis=1)
 
 # Calculate changes
 merged_df['Regular_Change'] = merged_df['Regular_New_TER'] - merged_df['Regular_Old_TER']
@@ -74,6 +81,7 @@ merged_df['Difference_in_Changes'] = merged_df['Regular_Change'] - merged_df['Di
 
 # Create final output with required columns
 output_df = merged_df[[
+    'NSDL Scheme Code',
     'Scheme Name',
     'TER_Date',
     'Regular_Old_TER',
@@ -128,13 +136,18 @@ threshold = 0.02
 significant_df = filtered_df[filtered_df['Difference (Reg Change - Dir Change)'].abs() >= threshold].copy()
 print(f"✅ Schemes above threshold (>0.02): {len(significant_df)} out of {len(filtered_df)}\n")
 
-# Group by category
+# Aggregate significant changes by AMC x category x month once; summaries below are lookups
+cube = TerCube()
+cube.update(significant_df)
+categories = sorted(significant_df['Fund_Category'].unique())
+
 print("📊 Category Distribution:")
-for category in sorted(significant_df['Fund_Category'].unique()):
-    cat_count = len(significant_df[significant_df['Fund_Category'] == category])
-    print(f"  {category}: {cat_count} schemes")
+for category in categories:
+    print(f"  {category}: {cube.get(category=category)['difference']['count']} schemes")
 
 # Save all filtered data (no threshold)
+filtered_df = filtered_df.drop('NSDL Scheme Code', axis=1)
+significant_df = significant_df.drop('NSDL Scheme Code', axis=1)
 filtered_df.to_csv('./output/TER_Comparison_Comprehensive.csv', index=False)
 print(f"\n✅ Saved: TER_Comparison_Comprehensive.csv ({len(filtered_df)} schemes)")
 
@@ -172,10 +185,9 @@ print(f"  Schemes with actual changes: {len(filtered_df)}")
 print(f"  Schemes above threshold (>0.02): {len(significant_df)}")
 
 print(f"\n📂 By Fund Category (Significant Changes):")
-for category in sorted(significant_df['Fund_Category'].unique()):
-    cat_df = significant_df[significant_df['Fund_Category'] == category]
-    avg_diff = cat_df['Difference (Reg Change - Dir Change)'].mean()
-    print(f"  {category}: {len(cat_df)} schemes (avg diff: {avg_diff:.4f})")
+for category in categories:
+    stats = cube.get(category=category)['difference']
+    print(f"  {category}: {stats['count']} schemes (avg diff: {stats['mean']:.4f})")
 
 print(f"\n📈 Change Distribution (All Changed Schemes):")
 print(f"  Regular change > Direct change: {len(filtered_df[filtered_df['Difference (Reg Change - Dir Change)'] > 0])}")
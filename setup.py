@@ -38,11 +38,17 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=[
-        "pandas>=1.3.0",
+        "pandas>=1.4.0",
         "openpyxl>=3.7.0",
         "requests>=2.26.0",
     ],
     extras_require={
+        "columnar": [
+            "pyarrow>=6.0",
+        ],
+        "zstd": [
+            "zstandard>=0.15",
+        ],
         "dev": [
             "pytest>=7.0",
             "pytest-cov>=3.0",
@@ -53,7 +59,7 @@ setup(
     },
     entry_points={
         "console_scripts": [
-            "amfi-ter-analysis=amfi_ter_analysis.ter_github_actions:analyze_and_report",
+            "amfi-ter-analysis=amfi_ter_analysis.ter_cli:main",
         ],
     },
     include_package_data=True,
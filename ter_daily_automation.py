@@ -2,39 +2,32 @@ import requests
 import pandas as pd
 import os
 from datetime import datetime, timedelta
-import json
 from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
+from amfi_ter_analysis.ter_state_store import open_state_store
+from amfi_ter_analysis.ter_daily_automation import compare_ter_daily as _compare_ter_daily
+
 # Create directories
 os.makedirs('downloads', exist_ok=True)
 os.makedirs('output', exist_ok=True)
 os.makedirs('history', exist_ok=True)
 
 # State file to track last processed date and files
-STATE_FILE = 'ter_state.json'
+STATE_FILE = os.environ.get('TER_STATE_FILE', 'ter_state.json')
 
 def load_state():
     """Load the state of last processed date and files"""
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {
-        'last_processed_date': None,
-        'last_month': None,
-        'last_year': None,
-        'previous_day_file': None
-    }
+    return open_state_store(STATE_FILE).load()
 
 def save_state(state):
     """Save the state of processed date and files"""
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f, indent=2)
+    open_state_store(STATE_FILE).save(state)
 
-def get_current_month_year():
-    """Get current month and year"""
-    today = datetime.now()
+def get_current_month_year(now=None):
+    """Get current month and year (of `now` when given)"""
+    today = now or datetime.now()
     return today.month, today.year
 
 def download_ter_file(month, year):
@@ -108,86 +101,11 @@ def get_current_ter_data(current_month=None, current_year=None):
     
     return read_ter_file(file_path)
 
-def compare_ter_daily(current_df, previous_df):
-    """Compare TER changes between current and previous day"""
-    
-    current_code, current_name, current_regular, current_direct = find_ter_columns(current_df)
-    previous_code, previous_name, previous_regular, previous_direct = find_ter_columns(previous_df)
-    
-    # Create working copies
-    current_df = current_df.copy()
-    previous_df = previous_df.copy()
-    
-    if current_code:
-        current_df[current_code] = current_df[current_code].astype(str).str.strip()
-    if previous_code:
-        previous_df[previous_code] = previous_df[previous_code].astype(str).str.strip()
-    
-    regular_changes = []
-    direct_changes = []
-    
-    # Merge on scheme code for Regular Plan
-    if current_code and current_regular and previous_regular and current_name:
-        print(f"\nComparing Regular Plan TER changes day-to-day...")
-        
-        merge_cols = [current_code, current_name, current_regular]
-        merged = previous_df[[previous_code, previous_name, previous_regular]].merge(
-            current_df[merge_cols],
-            left_on=previous_code,
-            right_on=current_code,
-            how='inner',
-            suffixes=('_prev', '_current')
-        )
-        
-        merged[previous_regular] = pd.to_numeric(merged[previous_regular], errors='coerce')
-        merged[current_regular] = pd.to_numeric(merged[current_regular], errors='coerce')
-        
-        mask = (merged[previous_regular] != merged[current_regular]) & (merged[previous_regular].notna()) & (merged[current_regular].notna())
-        changed = merged[mask]
-        
-        print(f"Found {len(changed)} changes")
-        
-        for _, row in changed.iterrows():
-            regular_changes.append({
-                'NSDL Scheme Code': row[current_code],
-                'Scheme Name': row[current_name],
-                'Previous Regular Plan - Base TER (%)': round(float(row[previous_regular]), 4),
-                'Current Regular Plan - Base TER (%)': round(float(row[current_regular]), 4),
-                'TER Date (Change)': datetime.now().strftime('%Y-%m-%d'),
-                'TER Reduction (%)': round(float(row[previous_regular] - row[current_regular]), 4)
-            })
-    
-    # Merge on scheme code for Direct Plan
-    if current_code and current_direct and previous_direct and current_name:
-        print(f"Comparing Direct Plan TER changes day-to-day...")
-        
-        merge_cols = [current_code, current_name, current_direct]
-        merged = previous_df[[previous_code, previous_name, previous_direct]].merge(
-            current_df[merge_cols],
-            left_on=previous_code,
-            right_on=current_code,
-            how='inner',
-            suffixes=('_prev', '_current')
-        )
-        
-        merged[previous_direct] = pd.to_numeric(merged[previous_direct], errors='coerce')
-        merged[current_direct] = pd.to_numeric(merged[current_direct], errors='coerce')
-        
-        mask = (merged[previous_direct] != merged[current_direct]) & (merged[previous_direct].notna()) & (merged[current_direct].notna())
-        changed = merged[mask]
-        
-        print(f"Found {len(changed)} changes")
-        
-        for _, row in changed.iterrows():
-            direct_changes.append({
-                'NSDL Scheme Code': row[current_code],
-                'Scheme Name': row[current_name],
-                'Previous Direct Plan - Base TER (%)': round(float(row[previous_direct]), 4),
-                'Current Direct Plan - Base TER (%)': round(float(row[current_direct]), 4),
-                'TER Date (Change)': datetime.now().strftime('%Y-%m-%d'),
-                'TER Reduction (%)': round(float(row[previous_direct] - row[current_direct]), 4)
-            })
-    
+def compare_ter_daily(current_df, previous_df, now=None):
+    """Compare TER changes between current and previous day (changes are dated `now`)"""
+    print(f"\nComparing Regular and Direct Plan TER changes day-to-day...")
+    regular_changes, direct_changes = _compare_ter_daily(current_df, previous_df, now)
+    print(f"Found {len(regular_changes)} Regular Plan changes, {len(direct_changes)} Direct Plan changes")
     return regular_changes, direct_changes
 
 def save_daily_results(regular_changes, direct_changes, date_str):
@@ -207,16 +125,17 @@ def save_daily_results(regular_changes, direct_changes, date_str):
         direct_df.to_csv(output_file, index=False)
         print(f"Saved Direct Plan changes: {output_file}")
 
-def main():
+def main(now=None):
+    """Run the daily analysis; pass `now` to run as of another date (replays, tests)"""
+    today = now or datetime.now()
     print("=" * 100)
     print("AMFI TER (Total Expense Ratio) - Daily Automated Analysis")
-    print(f"Run Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Run Time: {today.strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 100)
     
     # Load state
     state = load_state()
-    current_month, current_year = get_current_month_year()
-    today = datetime.now()
+    current_month, current_year = get_current_month_year(today)
     today_str = today.strftime('%Y-%m-%d')
     
     print(f"\nCurrent Date: {today_str}")
@@ -286,7 +205,7 @@ def main():
         
         # Compare
         print(f"\n3. Comparing changes...")
-        regular_changes, direct_changes = compare_ter_daily(current_df, previous_df)
+        regular_changes, direct_changes = compare_ter_daily(current_df, previous_df, today)
         
         if regular_changes or direct_changes:
             print(f"\n4. Saving results...")
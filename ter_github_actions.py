@@ -11,15 +11,15 @@ from datetime import datetime
 from pathlib import Path
 import logging
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/ter_analysis.log'),
-        logging.StreamHandler()
-    ]
-)
+from amfi_ter_analysis.ter_state_store import open_state_store
+from amfi_ter_analysis.ter_logging import configure_logging
+from amfi_ter_analysis.ter_pairing import pairing_index
+
+# Pairing ids live in history/ beside this script, not in the working directory
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+
+# Setup logging (queued, JSON lines in the log file; level from TER_LOG_LEVEL)
+configure_logging(log_file='logs/ter_analysis.log')
 logger = logging.getLogger(__name__)
 
 # Create directories
@@ -29,39 +29,21 @@ Path('logs').mkdir(exist_ok=True)
 Path('history').mkdir(exist_ok=True)
 
 # File paths
-STATE_FILE = 'ter_state.json'
+STATE_FILE = os.environ.get('TER_STATE_FILE', 'ter_state.json')
 API_URL = 'https://www.amfiindia.com/api/populate-te-rdata-revised'
 
-def load_state():
+def load_state(now=None):
     """Load state from JSON file and validate/migrate schema"""
-    default_state = get_default_state()
-    
-    if os.path.exists(STATE_FILE):
-        try:
-            with open(STATE_FILE, 'r') as f:
-                loaded_state = json.load(f)
-            
-            # Validate and migrate state structure
-            # Ensure all required keys exist
-            for key in default_state.keys():
-                if key not in loaded_state:
-                    logger.info(f"Missing key '{key}' in state, using default value")
-                    loaded_state[key] = default_state[key]
-            
-            # Handle old format migration (last_month/last_year -> month_year)
-            if 'month_year' not in loaded_state and 'last_year' in loaded_state and 'last_month' in loaded_state:
-                loaded_state['month_year'] = f"{loaded_state['last_year']}-{loaded_state['last_month']:02d}"
-                logger.info(f"Migrated old state format to new format: month_year={loaded_state['month_year']}")
-            
-            return loaded_state
-        except Exception as e:
-            logger.error(f"Error loading state: {e}")
-            return default_state
-    return default_state
+    store = open_state_store(STATE_FILE)
+    if not os.path.exists(store.path):
+        return get_default_state(now)
+    # Corrupt files fall back to defaults inside load(); a state from a newer
+    # release raises so it is not overwritten
+    return store.load()
 
-def get_default_state():
+def get_default_state(now=None):
     """Get default state structure"""
-    today = datetime.now().date()
+    today = (now or datetime.now()).date()
     return {
         'last_processed_date': str(today),
         'month_year': f"{today.year}-{today.month:02d}",
@@ -70,10 +52,9 @@ def get_default_state():
     }
 
 def save_state(state):
-    """Save state to JSON file"""
+    """Save state atomically under the state file lock"""
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=2)
+        open_state_store(STATE_FILE).save(state)
         logger.info("State saved successfully")
     except Exception as e:
         logger.error(f"Error saving state: {e}")
@@ -154,14 +135,14 @@ def compare_schemes(old_df, new_df, plan_type):
         logger.error(f"Error comparing schemes for {plan_type}: {e}")
         return pd.DataFrame()
 
-def analyze_daily():
-    """Main analysis function for daily execution"""
+def analyze_daily(now=None):
+    """Main analysis function for daily execution (as of `now` when given)"""
     logger.info("=" * 60)
     logger.info("Starting AMFI TER Analysis")
     logger.info("=" * 60)
     
-    state = load_state()
-    today = datetime.now().date()
+    state = load_state(now)
+    today = (now or datetime.now()).date()
     today_str = str(today)
     current_month_year = f"{today.year}-{today.month:02d}"
     
@@ -260,13 +241,16 @@ def analyze_daily():
         try:
             logger.info("Generating Regular vs Direct comparison...")
             
-            # Merge on scheme name to find common schemes
-            comparison = pd.merge(
-                regular_changes[['Scheme Name', 'TER Reduction (%)']],
-                direct_changes[['Scheme Name', 'TER Reduction (%)']],
-                on='Scheme Name',
+            # Pair plans on scheme id (NSDL code, or name for records without one)
+            pairing = pairing_index(HISTORY_DIR)
+            columns = ['NSDL Scheme Code', 'Scheme Name', 'TER Reduction (%)']
+            comparison = pairing.pair(
+                regular_changes[columns],
+                direct_changes[columns],
+                how='inner',
                 suffixes=('_Regular', '_Direct')
-            )
+            )[['Scheme Name', 'TER Reduction (%)_Regular', 'TER Reduction (%)_Direct']]
+            pairing.save()
             
             if len(comparison) > 0:
                 comparison['Difference (%)'] = comparison['TER Reduction (%)_Direct'] - comparison['TER Reduction (%)_Regular']
@@ -288,11 +272,23 @@ def analyze_daily():
     logger.info("Analysis completed successfully")
     logger.info("=" * 60)
 
-def generate_notification():
+def plan_view(data, plan):
+    """Code, name and old / new / reduction columns of one plan's change file"""
+    old_col = next(col for col in (f'Old {plan} Plan - Base TER (%)', 'Old TER (%)') if col in data.columns)
+    new_col = next(col for col in (f'New {plan} Plan - Base TER (%)', 'New TER (%)') if col in data.columns)
+    return pd.DataFrame({
+        'NSDL Scheme Code': data['NSDL Scheme Code'],
+        'Scheme Name': data['Scheme Name'],
+        f'{plan} Old': data[old_col].astype(float),
+        f'{plan} New': data[new_col].astype(float),
+        f'{plan} Reduction': data['TER Reduction (%)'].astype(float),
+    })
+
+def generate_notification(now=None):
     """Generate notification message and summary data in a single pass"""
     output_dir = Path('output')
     summary = {
-        'date': str(datetime.now().date()),
+        'date': str((now or datetime.now()).date()),
         'regular_count': 0,
         'direct_count': 0,
         'comparison_count': 0
@@ -301,7 +297,8 @@ def generate_notification():
     # Read data files
     regular_data = None
     direct_data = None
-    previous_schemes = set()
+    pairing = pairing_index(HISTORY_DIR)
+    previous_ids = set()
     
     regular_file = list(output_dir.glob('Regular_Plan_TER_Changes_*.csv')) if output_dir.exists() else []
     if regular_file:
@@ -323,8 +320,8 @@ def generate_notification():
     try:
         if Path('baseline_ter_data.csv').exists():
             previous_baseline = pd.read_csv('baseline_ter_data.csv')
-            previous_schemes = set(previous_baseline['Scheme Name'].unique())
-            logger.info(f"Loaded previous baseline with {len(previous_schemes)} schemes")
+            previous_ids = set(pairing.frame_ids(previous_baseline).tolist())
+            logger.info(f"Loaded previous baseline with {len(previous_ids)} schemes")
     except Exception as e:
         logger.warning(f"Could not load previous baseline: {e}")
     
@@ -335,55 +332,29 @@ def generate_notification():
         message += "AMFI MUTUAL FUND - TER REDUCTIONS (REGULAR vs DIRECT PLAN) - SORTED BY HIGHEST DIFFERENCE\n"
         message += "=" * 150 + "\n\n"
         
-        # Build combined table efficiently
-        regular_schemes = set(regular_data['Scheme Name'].unique()) if regular_data is not None else set()
-        direct_schemes = set(direct_data['Scheme Name'].unique()) if direct_data is not None else set()
-        all_schemes = sorted(regular_schemes.union(direct_schemes))
+        # Pair the plans on scheme id: one row per scheme with both plans' columns
+        views = {}
+        for plan, data in (('Regular', regular_data), ('Direct', direct_data)):
+            if data is None:
+                data = pd.DataFrame(columns=['NSDL Scheme Code', 'Scheme Name', f'Old {plan} Plan - Base TER (%)',
+                                             f'New {plan} Plan - Base TER (%)', 'TER Reduction (%)'])
+            views[plan] = plan_view(data, plan)
+        combined_df = pairing.pair(views['Regular'], views['Direct'])
+        pairing.save()
         
-        combined_rows = []
-        new_count = 0
-        
-        for scheme in all_schemes:
-            row = {'Scheme Name': scheme}
-            reg_reduction = 0.0
-            dir_reduction = 0.0
-            
-            # Get Regular plan data
-            if regular_data is not None:
-                reg_data = regular_data[regular_data['Scheme Name'] == scheme]
-                if not reg_data.empty:
-                    reg_reduction = float(reg_data['TER Reduction (%)'].iloc[0])
-                    row['Reg Old TER %'] = f"{float(reg_data['Old Regular Plan - Base TER (%)'].iloc[0]):.2f}"
-                    row['Reg New TER %'] = f"{float(reg_data['New Regular Plan - Base TER (%)'].iloc[0]):.2f}"
-                    row['Reg Reduction %'] = f"{reg_reduction:.2f}"
-                else:
-                    row['Reg Old TER %'] = row['Reg New TER %'] = row['Reg Reduction %'] = 'N/A'
-            else:
-                row['Reg Old TER %'] = row['Reg New TER %'] = row['Reg Reduction %'] = 'N/A'
-            
-            # Get Direct plan data
-            if direct_data is not None:
-                dir_data = direct_data[direct_data['Scheme Name'] == scheme]
-                if not dir_data.empty:
-                    dir_reduction = float(dir_data['TER Reduction (%)'].iloc[0])
-                    row['Dir Old TER %'] = f"{float(dir_data['Old Direct Plan - Base TER (%)'].iloc[0]):.2f}"
-                    row['Dir New TER %'] = f"{float(dir_data['New Direct Plan - Base TER (%)'].iloc[0]):.2f}"
-                    row['Dir Reduction %'] = f"{dir_reduction:.2f}"
-                else:
-                    row['Dir Old TER %'] = row['Dir New TER %'] = row['Dir Reduction %'] = 'N/A'
-            else:
-                row['Dir Old TER %'] = row['Dir New TER %'] = row['Dir Reduction %'] = 'N/A'
-            
-            row['Difference %'] = reg_reduction - dir_reduction if (reg_reduction and dir_reduction) else 0
-            if scheme not in previous_schemes:
-                new_count += 1
-            
-            combined_rows.append(row)
+        for plan, short in (('Regular', 'Reg'), ('Direct', 'Dir')):
+            present = combined_df[f'{plan} Reduction'].notna()
+            for suffix, label in (('Old', 'Old TER %'), ('New', 'New TER %'), ('Reduction', 'Reduction %')):
+                combined_df[f'{short} {label}'] = combined_df[f'{plan} {suffix}'].map('{:.2f}'.format).where(present, 'N/A')
+        reg_reduction = combined_df['Regular Reduction'].fillna(0.0)
+        dir_reduction = combined_df['Direct Reduction'].fillna(0.0)
+        both = (reg_reduction != 0) & (dir_reduction != 0)
+        combined_df['Difference %'] = (reg_reduction - dir_reduction).where(both, 0.0)
+        new_count = int((~combined_df['Scheme ID'].isin(previous_ids)).sum())
         
-        # Convert to DataFrame and sort
-        combined_df = pd.DataFrame(combined_rows)
-        combined_df['Diff_Value'] = combined_df['Difference %'].astype(float)
-        combined_df = combined_df.sort_values('Diff_Value', ascending=False, key=abs)
+        # Sort by name, then by absolute difference
+        combined_df = combined_df.sort_values('Scheme Name', kind='mergesort')
+        combined_df = combined_df.sort_values('Difference %', ascending=False, key=abs, kind='mergesort')
         
         # Create table output
         display_cols = ['Scheme Name', 'Reg Old TER %', 'Reg New TER %', 'Reg Reduction %', 
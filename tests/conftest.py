@@ -0,0 +1,12 @@
+import pytest
+
+from amfi_ter_analysis.ter_analysis import normalize_ter_frame
+from benchmarks.synthetic import make_universe, perturb
+
+
+@pytest.fixture
+def snapshots():
+    """Normalized previous / current snapshots of 400 schemes, 10% of them revised"""
+    previous = make_universe(400, seed=0)
+    current = perturb(previous, 0.1, seed=1)
+    return normalize_ter_frame(previous), normalize_ter_frame(current)
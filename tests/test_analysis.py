@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import diff_ter_frames, is_normalized, normalize_ter_frame
+
+PLANS = ('Regular', 'Direct')
+
+
+def test_normalized_frames_are_recognised(snapshots):
+    previous, _ = snapshots
+    assert is_normalized(previous)
+    codes = previous['NSDL Scheme Code']
+    assert not is_normalized(previous.iloc[::-1])
+    assert not is_normalized(pd.concat([previous, previous.iloc[:1]]))
+    assert not is_normalized(previous.assign(**{'NSDL Scheme Code': codes + ' '}))
+    assert not is_normalized(previous[previous.columns[::-1]])
+    assert not is_normalized(previous.astype({'Regular Plan - Base TER (%)': object}))
+
+
+def test_normalizing_twice_gives_the_same_frame(snapshots):
+    previous, _ = snapshots
+    shuffled = previous.sample(frac=1, random_state=0)
+    assert not is_normalized(shuffled)
+    pd.testing.assert_frame_equal(normalize_ter_frame(shuffled), previous)
+    again = normalize_ter_frame(previous.set_index(previous.index + 100))
+    pd.testing.assert_frame_equal(again, previous)
+
+
+def one_sided(frame, start, stop):
+    """Drop a block of schemes and blank some TERs so both paths see gaps"""
+    frame = frame.drop(frame.index[start:stop]).reset_index(drop=True)
+    frame.loc[frame.index[::37], 'Regular Plan - Base TER (%)'] = np.nan
+    return frame
+
+
+@pytest.mark.parametrize('change_date', [None, '2026-02-12'])
+def test_aligned_diff_matches_the_merge(snapshots, change_date):
+    previous, current = snapshots
+    previous, current = one_sided(previous, 0, 10), one_sided(current, 20, 30)
+    # A repeated code sends diff_ter_frames down the merge path; it matches nothing
+    retired = previous.iloc[[0, 0]].assign(**{'NSDL Scheme Code': 'ZZZ/RETIRED/0001'})
+    merge_previous = pd.concat([previous, retired], ignore_index=True)
+    for plan in PLANS:
+        aligned = diff_ter_frames(previous, current, plan, change_date)
+        merged = diff_ter_frames(merge_previous, current, plan, change_date)
+        assert len(aligned) > 0
+        pd.testing.assert_frame_equal(aligned, merged)
+        shuffled = diff_ter_frames(previous, current.sample(frac=1, random_state=1), plan,
+                                   change_date)
+        pd.testing.assert_frame_equal(shuffled, merged)
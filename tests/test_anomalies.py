@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from amfi_ter_analysis.ter_anomalies import MIN_PEERS, detect_anomalies, robust_z, score_anomalies
+
+
+def comparison(rows):
+    """compare_plan_changes-style rows from (code, name, regular old/new, direct old/new)"""
+    return pd.DataFrame([{
+        'NSDL Scheme Code': code, 'Scheme Name': name, 'Date of TER Change': '2026-02-02',
+        'Regular Base TER Old': reg_old, 'Regular Base TER New': reg_new,
+        'Direct Base TER Old': dir_old, 'Direct Base TER New': dir_new,
+    } for code, name, reg_old, reg_new, dir_old, dir_new in rows])
+
+
+def routine_moves(amc, count, category='Flexi Cap Equity Fund'):
+    """Schemes trimming both plans by one or two ticks, as most days look"""
+    return [(f'{amc}/O/E/FCF/01/01/{i:07d}', f'{amc} {category} {i}',
+             1.80, 1.80 - 0.01 * (1 + i % 2), 0.90, 0.90 - 0.01 * (1 + i % 2))
+            for i in range(count)]
+
+
+def test_isolated_large_move_ranks_first():
+    rows = routine_moves('GROWW', 12) + routine_moves('HDFC', 30)
+    rows.append(('GROWW/O/O/ETF/01/01/0000099', 'Groww Nifty ETF', 0.00, 1.00, 0.00, 1.00))
+    top = detect_anomalies(comparison(rows))
+    assert top['Scheme Name'].iat[0] == 'Groww Nifty ETF'
+    assert 'vs AMC' in top['Reasons'].iat[0]
+    assert (top['Scheme Name'] == 'Groww Nifty ETF').sum() == 1
+
+
+def test_rule_breaks_give_their_reasons():
+    rows = routine_moves('HDFC', 20)
+    rows.append(('HDFC/O/O/ETF/01/01/0000098', 'HDFC Nifty 50 Index ETF', 0.20, 1.20, 0.10, 1.10))
+    rows.append(('HDFC/O/E/FCF/01/01/0000099', 'HDFC Flexi Cap Equity Fund 99',
+                 1.50, 1.49, 0.90, 1.60))
+    scored = score_anomalies(comparison(rows)).set_index('Scheme Name')
+
+    etf = scored.loc['HDFC Nifty 50 Index ETF']
+    assert etf['Cap Breach'] and not etf['Spread Inversion']
+    assert 'above 1.00% cap' in etf['Reasons']
+
+    inverted = scored.loc['HDFC Flexi Cap Equity Fund 99']
+    assert inverted['Spread Inversion'] and not inverted['Cap Breach']
+    assert 'Direct above Regular' in inverted['Reasons']
+    assert inverted['Score'] >= 10
+
+    routine = scored.drop(['HDFC Nifty 50 Index ETF', 'HDFC Flexi Cap Equity Fund 99'])
+    assert (routine['Reasons'] == '').all()
+
+
+def test_small_groups_use_the_overall_median():
+    values = [0.0] * 10 + [1.0] * (MIN_PEERS - 1)
+    groups = ['big'] * 10 + ['small'] * (MIN_PEERS - 1)
+    z = robust_z(values, groups)
+    # Overall median 0 and MAD 0, so the scale is MIN_SCALE (0.01)
+    np.testing.assert_allclose(z[10:], 100.0)
+    np.testing.assert_allclose(z[:10], 0.0)
+    # With enough peers the group is scored against its own median
+    z = robust_z(values, groups, min_peers=MIN_PEERS - 1)
+    np.testing.assert_allclose(z, 0.0)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import diff_ter_frames
+from amfi_ter_analysis.ter_core import (
+    PLANS, Snapshot, compare_snapshots, read_snapshot, record_columns)
+from amfi_ter_analysis.ter_daily_automation import compare_ter_daily
+
+
+@pytest.fixture
+def universe(snapshots):
+    """Snapshots with schemes on one side only and a few missing Base TERs"""
+    previous, current = snapshots
+    current = current.iloc[:-5].copy()
+    current.loc[current.index[:3], 'Regular Plan - Base TER (%)'] = np.nan
+    return previous.iloc[5:].reset_index(drop=True), current.reset_index(drop=True)
+
+
+def expected_records(previous, current, plan, change_date=None):
+    """diff_ter_frames output in the record layout of ter_core"""
+    frame = diff_ter_frames(previous, current, plan, change_date)
+    frame.columns = record_columns(plan)
+    return frame.to_dict('records')
+
+
+def assert_same_records(got, want):
+    assert len(want) > 0
+    codes = [record['NSDL Scheme Code'] for record in want]
+    assert [record['NSDL Scheme Code'] for record in got] == codes
+    for record, expected in zip(got, want):
+        assert record == pytest.approx(expected), record['NSDL Scheme Code']
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+@pytest.mark.parametrize('change_date', [None, '2026-02-12'])
+def test_matches_diff_ter_frames(universe, use_numpy, change_date):
+    previous, current = universe
+    changes = compare_snapshots(Snapshot.from_frame(previous), Snapshot.from_frame(current),
+                                change_date, use_numpy=use_numpy)
+    for plan, records in zip(PLANS, changes):
+        assert_same_records(records, expected_records(previous, current, plan, change_date))
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.csv.gz'])
+def test_read_snapshot_matches_the_frame(universe, tmp_path, suffix):
+    previous, current = universe
+    paths = []
+    for name, frame in (('previous', previous), ('current', current)):
+        path = tmp_path / f'{name}{suffix}'
+        frame.to_csv(path, index=False)
+        paths.append(path)
+    changes = compare_snapshots(*(read_snapshot(path) for path in paths))
+    for plan, records in zip(PLANS, changes):
+        assert_same_records(records, expected_records(previous, current, plan))
+
+
+def test_compare_ter_daily_keeps_the_latest_row(universe):
+    previous, current = universe
+    # A stale duplicate of each of the first ten schemes, listed after the current row
+    stale = current.iloc[:10].assign(**{
+        'TER Date': pd.Timestamp('2020-01-01'),
+        'Regular Plan - Base TER (%)': 9.99, 'Direct Plan - Base TER (%)': 9.99})
+    now = pd.Timestamp('2026-02-12')
+    changes = compare_ter_daily(pd.concat([current, stale], ignore_index=True), previous, now=now)
+    for plan, records in zip(PLANS, changes):
+        assert_same_records(records, expected_records(previous, current, plan, '2026-02-12'))
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_cube import TerCube, update_cube_file
+
+
+def comparison(rows):
+    """compare_plan_changes-style rows from (code, name, date, regular old/new, direct old/new)"""
+    records = []
+    for code, name, date, reg_old, reg_new, dir_old, dir_new in rows:
+        records.append({
+            'NSDL Scheme Code': code, 'Scheme Name': name, 'Date of TER Change': date,
+            'Regular Base TER Old': reg_old, 'Regular Base TER New': reg_new,
+            'Direct Base TER Old': dir_old, 'Direct Base TER New': dir_new,
+            'Difference (Reg Change - Dir Change)': (reg_new - reg_old) - (dir_new - dir_old),
+        })
+    return pd.DataFrame(records)
+
+
+EARLIER = comparison([
+    ('ABC/O/E/EQF/01/01/0001', 'ABC Equity Fund', '2026-02-01', 1.5, 1.4, 0.8, 0.7),
+])
+MORNING = comparison([
+    ('ABC/O/E/EQF/01/01/0002', 'ABC Flexi Cap Equity Fund', '2026-02-02', 1.6, 1.5, 0.9, 0.9),
+    ('XYZ/O/D/LIQ/01/01/0003', 'XYZ Liquid Fund', '2026-02-02', 0.3, 0.25, 0.2, 0.15),
+])
+# The day's workbook revised: one change corrected, one added
+REVISED = comparison([
+    ('ABC/O/E/EQF/01/01/0002', 'ABC Flexi Cap Equity Fund', '2026-02-02', 1.6, 1.45, 0.9, 0.9),
+    ('XYZ/O/D/LIQ/01/01/0003', 'XYZ Liquid Fund', '2026-02-02', 0.3, 0.25, 0.2, 0.15),
+    ('XYZ/O/E/EQF/01/01/0004', 'XYZ Equity Fund', '2026-02-02', 2.0, 1.9, 1.0, 0.95),
+])
+
+
+def cube_of(*batches):
+    cube = TerCube()
+    for rows, batch in batches:
+        cube.update(rows, batch)
+    return cube
+
+
+def test_rerun_with_same_rows_is_skipped():
+    cube = cube_of((EARLIER, '2026-02-01'), (MORNING, '2026-02-02'))
+    before = cube.to_dict()
+    assert not cube.update(MORNING.iloc[::-1], '2026-02-02')
+    assert cube.to_dict() == before
+    assert cube.get()['regular']['count'] == 3
+
+
+def test_revised_batch_replaces_its_day():
+    cube = cube_of((EARLIER, '2026-02-01'), (MORNING, '2026-02-02'))
+    assert cube.update(REVISED, '2026-02-02')
+    expected = cube_of((EARLIER, '2026-02-01'), (REVISED, '2026-02-02'))
+    assert cube.cells.keys() == expected.cells.keys()
+    for key, cell in expected.cells.items():
+        assert cube.cells[key] == pytest.approx(cell), key
+    assert cube.get(period='2026-02')['regular']['count'] == 4
+    assert cube.get(period='2026-02')['regular']['min'] == pytest.approx(-0.15)
+
+
+def test_revision_survives_the_cube_file(tmp_path):
+    path = tmp_path / 'TER_Cube.json'
+    update_cube_file(EARLIER, '2026-02-01', path)
+    update_cube_file(MORNING, '2026-02-02', path)
+    update_cube_file(REVISED, '2026-02-02', path)
+    update_cube_file(REVISED, '2026-02-02', path)
+    cube = TerCube.load(path)
+    expected = cube_of((EARLIER, '2026-02-01'), (REVISED, '2026-02-02'))
+    assert cube.batches == expected.batches
+    assert cube.cells.keys() == expected.cells.keys()
+    for key, cell in expected.cells.items():
+        assert cube.cells[key] == pytest.approx(cell), key
+
+
+def test_other_versions_are_rejected():
+    data = cube_of((EARLIER, '2026-02-01')).to_dict()
+    data['version'] += 1
+    with pytest.raises(ValueError):
+        TerCube.from_dict(data)
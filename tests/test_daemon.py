@@ -0,0 +1,75 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis import ter_daemon
+from amfi_ter_analysis.ter_daemon import TerDaemon
+
+NOW = datetime(2026, 2, 2, 10, 30)
+WORKBOOK = b'PK' + b'\x00' * 200
+
+
+class FakeSession:
+    """requests.Session stand-in answering GETs from a list of (status, content, etag)"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, verify=None):
+        self.requests.append(dict(headers or {}))
+        status, content, etag = self.responses.pop(0)
+        return SimpleNamespace(status_code=status, content=content or b'',
+                               headers={'ETag': etag} if etag else {})
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    """Daemon whose report stages are recorded instead of run"""
+    def make(responses):
+        instance = TerDaemon(checkpoint=tmp_path / 'state.pkl', history_dir=tmp_path / 'history',
+                             write=False, metrics_dir=None, session=FakeSession(responses),
+                             clock=lambda: NOW)
+        instance.processed = []
+        monkeypatch.setattr(instance, 'process',
+                            lambda content, now: instance.processed.append(content) or 'changed')
+        return instance
+    return make
+
+
+def test_not_modified_skips_the_report(daemon):
+    instance = daemon([(200, WORKBOOK, '"v1"'), (304, None, None)])
+    assert instance.check_once() == ter_daemon.CHANGED
+    assert instance.check_once() == ter_daemon.NOT_MODIFIED
+    assert instance.session.requests[1]['If-None-Match'] == '"v1"'
+    assert instance.processed == [WORKBOOK]
+
+
+def test_same_content_under_a_new_etag_is_unchanged(daemon):
+    instance = daemon([(200, WORKBOOK, '"v1"'), (200, WORKBOOK, '"v2"')])
+    instance.check_once()
+    assert instance.check_once() == ter_daemon.UNCHANGED
+    assert instance.etag == '"v2"'
+    assert instance.processed == [WORKBOOK]
+
+
+def test_checkpoint_restores_the_warm_state(daemon, snapshots):
+    previous, _ = snapshots
+    instance = daemon([(200, WORKBOOK, '"v1"')])
+    instance.set_baseline(previous)
+    instance.check_once()
+
+    restarted = daemon([(304, None, None)])
+    assert restarted.restore()
+    for key in ter_daemon.CHECKPOINT_KEYS:
+        assert getattr(restarted, key) == getattr(instance, key), key
+    pd.testing.assert_frame_equal(restarted.baseline, previous)
+    assert restarted.index.get_loc(previous['NSDL Scheme Code'].iat[5]) == 5
+    # The restored ETag and month make the next poll conditional
+    assert restarted.check_once() == ter_daemon.NOT_MODIFIED
+    assert restarted.session.requests[0]['If-None-Match'] == '"v1"'
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import normalize_ter_frame
+from amfi_ter_analysis.ter_history import HistoryIndex, get_ter_history
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from benchmarks.synthetic import perturb
+
+DAYS = ['2026-03-02', '2026-03-03', '2026-03-04']
+TER_COLUMNS = ['Regular Plan - Base TER (%)', 'Direct Plan - Base TER (%)']
+
+
+@pytest.fixture
+def history(tmp_path, snapshots):
+    """Three daily snapshots; the last one drops the first ten schemes"""
+    frame, _ = snapshots
+    frames = {}
+    for seed, day in enumerate(DAYS):
+        frame = normalize_ter_frame(perturb(frame, 0.2, seed=seed, ter_date=day))
+        frames[day] = frame.iloc[10:] if day == DAYS[-1] else frame
+        save_snapshot(frames[day], tmp_path, day)
+    return tmp_path, frames
+
+
+def expected_rows(frames, code, days=DAYS):
+    rows = [frames[day].set_index('NSDL Scheme Code').loc[code, TER_COLUMNS].to_numpy(dtype=float)
+            for day in days if code in set(frames[day]['NSDL Scheme Code'])]
+    return np.array(rows)
+
+
+def test_query_many_codes(history):
+    history_dir, frames = history
+    codes = frames[DAYS[0]]['NSDL Scheme Code']
+    first, kept = codes.iat[0], codes.iat[50]
+    result = get_ter_history([kept, first, 'NO/SUCH/CODE', kept], history_dir=history_dir)
+    assert result.columns.tolist() == TER_COLUMNS
+    assert result.index.names == ['NSDL Scheme Code', 'Date']
+    # Sorted by code, then date; unknown codes and repeats are dropped
+    assert result.index.get_level_values(0).tolist() == [first] * 2 + [kept] * 3
+    dates = [pd.Timestamp(day) for day in DAYS[:2] + DAYS]
+    assert result.index.get_level_values(1).tolist() == dates
+    np.testing.assert_array_equal(result.loc[first].to_numpy(), expected_rows(frames, first))
+    np.testing.assert_array_equal(result.loc[kept].to_numpy(), expected_rows(frames, kept))
+
+
+def test_start_end_and_plans(history):
+    history_dir, frames = history
+    code = frames[DAYS[0]]['NSDL Scheme Code'].iat[50]
+    index = HistoryIndex(history_dir)
+    index.refresh()
+    result = index.query(code, start=DAYS[1], end=DAYS[1], plans=['Direct'])
+    assert result.columns.tolist() == ['Direct Plan - Base TER (%)']
+    assert result.index.get_level_values(1).tolist() == [pd.Timestamp(DAYS[1])]
+    assert result.iat[0, 0] == expected_rows(frames, code, [DAYS[1]])[0, 1]
+
+
+def test_refresh_appends_new_and_rebuilds_rewritten_snapshots(history, monkeypatch):
+    history_dir, frames = history
+    index = HistoryIndex(history_dir)
+    assert index.refresh(force=True)
+    code = frames[DAYS[0]]['NSDL Scheme Code'].iat[50]
+    before = index.query(code)
+
+    loaded = []
+    load = index.store.load
+    monkeypatch.setattr(index.store, 'load', lambda path: loaded.append(path.name) or load(path))
+
+    added = normalize_ter_frame(perturb(frames[DAYS[-1]], 0.2, seed=9, ter_date='2026-03-05'))
+    save_snapshot(added, history_dir, '2026-03-05')
+    assert index.refresh(force=True)
+    assert loaded == ['TER_Data_03-2026_20260305.pkl']
+    assert len(index.query(code)) == len(before) + 1
+
+    rewritten = frames[DAYS[0]].assign(**{TER_COLUMNS[0]: 9.99})
+    save_snapshot(rewritten, history_dir, DAYS[0])
+    loaded.clear()
+    assert index.refresh(force=True)
+    assert len(loaded) == len(DAYS) + 1
+    assert index.query(code).loc[(code, pd.Timestamp(DAYS[0])), TER_COLUMNS[0]] == 9.99
+    assert not index.refresh(force=True)
+
+    # A new process picks up the saved index without loading any snapshot
+    reopened = HistoryIndex(history_dir)
+    monkeypatch.setattr(reopened.store, 'load', lambda path: pytest.fail(path.name))
+    assert not reopened.refresh(force=True)
+    pd.testing.assert_frame_equal(reopened.query(code), index.query(code))
@@ -0,0 +1,73 @@
+import sys
+import time
+import threading
+
+import pytest
+
+from amfi_ter_analysis import ter_metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    ter_metrics.reset()
+    yield
+    ter_metrics.reset()
+
+
+def test_prometheus_type_lines_name_their_samples():
+    ter_metrics.incr('rows_changed', 3)
+    lines = ter_metrics.to_prometheus().splitlines()
+    assert '# TYPE ter_rows_changed_total counter' in lines
+    assert 'ter_rows_changed_total 3' in lines
+    typed = {line.split()[2] for line in lines if line.startswith('# TYPE')}
+    samples = {line.split('{')[0].split()[0] for line in lines if not line.startswith('#')}
+    assert samples <= typed
+
+
+def test_openmetrics_counter_family_drops_total_suffix():
+    ter_metrics.incr('rows_changed', 3)
+    lines = ter_metrics.to_openmetrics().splitlines()
+    assert '# TYPE ter_rows_changed counter' in lines
+    assert 'ter_rows_changed_total 3' in lines
+    assert lines[-1] == '# EOF'
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='RSS sampling reads /proc')
+def test_peak_rss_is_per_stage():
+    with ter_metrics.stage('big'):
+        block = bytearray(200 * 1024 * 1024)
+        block[::4096] = b'x' * len(block[::4096])
+        time.sleep(0.05)
+        del block
+    with ter_metrics.stage('small'):
+        time.sleep(0.05)
+    totals = ter_metrics.stage_totals()
+    assert totals['big']['peak_rss_bytes'] - totals['small']['peak_rss_bytes'] > 100 * 1024 * 1024
+
+
+def test_cpu_time_excludes_other_threads():
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            pass
+
+    worker = threading.Thread(target=spin)
+    worker.start()
+    try:
+        with ter_metrics.stage('idle'):
+            time.sleep(0.2)
+    finally:
+        stop.set()
+        worker.join()
+    assert ter_metrics.stage_totals()['idle']['cpu_seconds'] < 0.05
+
+
+def test_memory_tracing_without_reset_peak(monkeypatch):
+    # Python 3.8's tracemalloc has no reset_peak
+    monkeypatch.delattr(ter_metrics.tracemalloc, 'reset_peak')
+    monkeypatch.setattr(ter_metrics, '_memory_tracing', True)
+    monkeypatch.setattr(ter_metrics.tracemalloc, 'get_traced_memory', lambda: (1000, 5000))
+    with ter_metrics.stage('traced'):
+        pass
+    assert ter_metrics.stage_totals()['traced']['peak_memory_bytes'] == 4000
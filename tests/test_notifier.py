@@ -0,0 +1,58 @@
+import pytest
+
+from amfi_ter_analysis.ter_notifier import (
+    MAX_MESSAGE_CHARS, RETRY_STATUSES, LocalWebhook, create_session, render_messages,
+    send_messages,
+)
+
+
+def change_rows(count):
+    return [{'Scheme Name': f'Example Fund {number:03d} - Regular Plan',
+             'Regular Old': 1.50, 'Regular New': 1.45, 'Regular Reduction': 0.05,
+             'Direct Old': 0.80, 'Direct New': 0.78, 'Direct Reduction': 0.02,
+             'Difference': 0.03}
+            for number in range(count)]
+
+
+@pytest.fixture
+def webhook():
+    with LocalWebhook() as server:
+        yield server
+
+
+def test_paginated_text_is_delivered_in_one_thread(webhook):
+    messages = render_messages(change_rows(200), report_date='2026-03-02')
+    assert len(messages) > 3
+    sent = send_messages(webhook.url, messages, thread_key='amfi-ter-2026-03-02')
+    assert sent == len(messages)
+    assert [payload['text'] for payload in webhook.payloads] == [m['text'] for m in messages]
+    assert all(len(payload['text']) <= MAX_MESSAGE_CHARS for payload in webhook.payloads)
+    assert {payload['thread']['threadKey'] for payload in webhook.payloads} == {
+        'amfi-ter-2026-03-02'}
+    assert all('messageReplyOption=' in path for path in webhook.requests)
+
+
+def test_cards_are_posted_as_cards_v2(webhook):
+    messages = render_messages(change_rows(60), fmt='card', report_date='2026-03-02')
+    assert send_messages(webhook.url, messages) == len(messages) == 3
+    header, *cards = webhook.payloads
+    assert header['text'].startswith('🔔 AMFI TER Daily Analysis Report - 2026-03-02')
+    widgets = [card['cardsV2'][0]['card']['sections'][0]['widgets'] for card in cards]
+    assert [len(page) for page in widgets] == [50, 10]
+    assert widgets[1][0]['decoratedText']['topLabel'] == 'Example Fund 050 - Regular Plan'
+
+
+def test_rate_limited_posts_are_retried():
+    messages = [{'text': 'first'}, {'text': 'second'}]
+    session = create_session(backoff_factor=0)
+    with LocalWebhook(fail_first=2, retry_after=0) as webhook:
+        assert send_messages(webhook.url, messages, session=session) == 2
+    assert len(webhook.requests) == 4
+    assert webhook.payloads == messages
+
+
+def test_only_status_codes_are_retried():
+    retry = create_session().get_adapter('https://chat.googleapis.com').max_retries
+    # A post that failed mid-flight may already be in the space; never send it twice
+    assert retry.connect == 0 and retry.read == 0
+    assert retry.is_retry('POST', 429) and set(retry.status_forcelist) == set(RETRY_STATUSES)
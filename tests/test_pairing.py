@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from amfi_ter_analysis.ter_pairing import PAIRING_FILE, PairingIndex, pairing_index
+
+
+def plan_frame(rows):
+    return pd.DataFrame(rows, columns=['NSDL Scheme Code', 'Scheme Name', 'TER Reduction (%)'])
+
+
+REGULAR = plan_frame([
+    ('HDFC/O/E/FCF/01/01/0001', 'HDFC Flexi Cap Fund - Regular Plan', 0.05),
+    ('SBI/O/D/LIQ/01/01/0002', 'SBI Liquid Fund - Regular Plan', 0.02),
+    ('SBI/O/D/LIQ/01/01/0002', 'SBI Liquid Fund - Regular Plan', 0.99),
+])
+DIRECT = plan_frame([
+    (' hdfc/o/e/fcf/01/01/0001 ', 'HDFC Flexi Cap Fund - Direct Plan', 0.03),
+    (np.nan, 'SBI LIQUID FUND - DIRECT PLAN', 0.01),
+    ('AXIS/O/E/ELS/01/01/0003', 'Axis ELSS Tax Saver Fund - Direct Plan', 0.04),
+])
+
+
+def test_codeless_records_pair_by_name():
+    paired = PairingIndex().pair(REGULAR, DIRECT, how='inner')
+    assert paired['NSDL Scheme Code'].tolist() == [REGULAR['NSDL Scheme Code'].iat[0],
+                                                   REGULAR['NSDL Scheme Code'].iat[1]]
+    assert paired['TER Reduction (%)_Direct'].tolist() == [0.03, 0.01]
+
+
+def test_first_duplicate_wins_and_outer_keeps_one_sided_schemes():
+    paired = PairingIndex().pair(REGULAR, DIRECT).set_index('Scheme Name')
+    assert len(paired) == 3
+    assert paired.loc['SBI Liquid Fund - Regular Plan', 'TER Reduction (%)_Regular'] == 0.02
+    axis = paired.loc['Axis ELSS Tax Saver Fund - Direct Plan']
+    assert np.isnan(axis['TER Reduction (%)_Regular'])
+    assert axis['NSDL Scheme Code'] == 'AXIS/O/E/ELS/01/01/0003'
+
+
+def test_shared_columns_get_the_suffixes():
+    paired = PairingIndex().pair(REGULAR, DIRECT.assign(Extra=1), suffixes=('_R', '_D'))
+    # Identity columns are merged (Regular side first); other shared columns are suffixed
+    assert paired.columns.tolist() == ['Scheme ID', 'NSDL Scheme Code', 'Scheme Name',
+                                       'TER Reduction (%)_R', 'TER Reduction (%)_D', 'Extra']
+    assert paired['Scheme Name'].iat[1] == 'HDFC Flexi Cap Fund - Regular Plan'
+
+
+def test_ids_are_kept_in_the_history_directory(tmp_path):
+    index = pairing_index(tmp_path)
+    ids = index.frame_ids(DIRECT)
+    assert index.save() == tmp_path / PAIRING_FILE
+    assert pairing_index(tmp_path).frame_ids(DIRECT).tolist() == ids.tolist()
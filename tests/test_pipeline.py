@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from amfi_ter_analysis import ter_notifier
+from amfi_ter_analysis.ter_pipeline import run_daily_pipeline, save_snapshot
+
+
+def run(tmp_path, previous, current, **kwargs):
+    kwargs.setdefault('webhooks', ())
+    return run_daily_pipeline(
+        previous=previous, current=current, report_date='2026-02-02',
+        output_dir=tmp_path / 'output', history_dir=tmp_path / 'history',
+        baseline_path=tmp_path / 'baseline_ter_data', cache_dir=tmp_path / 'cache',
+        metrics_dir=None, summary_file=None, **kwargs)
+
+
+def test_sink_runs_on_unchanged_inputs(tmp_path, snapshots):
+    previous, current = snapshots
+    run(tmp_path, previous, current)
+    changes = tmp_path / 'output' / 'Regular_Plan_TER_Changes_2026-02-02.csv'
+    changes.unlink()
+
+    context = run(tmp_path, previous, current)
+    assert context['stage_status']['compare'] == 'cached'
+    assert context['stage_status']['sink'] == 'ran'
+    assert changes.exists()
+
+
+def test_anomalies_rerun_when_history_changes(tmp_path, snapshots):
+    previous, current = snapshots
+    assert run(tmp_path, previous, current, write=False)['stage_status']['anomalies'] == 'ran'
+    assert run(tmp_path, previous, current, write=False)['stage_status']['anomalies'] == 'cached'
+
+    save_snapshot(previous, tmp_path / 'history', '2026-01-30')
+    assert run(tmp_path, previous, current, write=False)['stage_status']['anomalies'] == 'ran'
+
+
+def test_notifications_are_resent_only_on_request(tmp_path, snapshots, monkeypatch):
+    previous, current = snapshots
+    calls = []
+
+    def fan_out(urls, messages, thread_key=None):
+        calls.append(list(urls))
+        return {url: len(messages) for url in urls}
+
+    monkeypatch.setattr(ter_notifier, 'fan_out', fan_out)
+    monkeypatch.chdir(tmp_path)
+    hooks = ['https://chat.example/a']
+
+    run(tmp_path, previous, current, webhooks=hooks, write=False)
+    run(tmp_path, previous, current, webhooks=hooks, write=False)
+    assert calls == [hooks]
+    assert Path('.ter_notified.json').exists()
+
+    run(tmp_path, previous, current, webhooks=hooks, write=False, resend=True)
+    assert calls == [hooks, hooks]
@@ -0,0 +1,59 @@
+import json
+
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import diff_ter_frames, normalize_ter_frame
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from amfi_ter_analysis.ter_replay import ReplayClock, replay_history
+from benchmarks.synthetic import perturb
+
+DAYS = pd.date_range('2026-02-25', '2026-03-03', freq='D')
+
+
+@pytest.fixture
+def history(tmp_path, snapshots):
+    """Daily snapshots from late February into March"""
+    frame, _ = snapshots
+    frames = {}
+    for seed, day in enumerate(DAYS):
+        frame = normalize_ter_frame(perturb(frame, 0.05, seed=seed, ter_date=f'{day:%Y-%m-%d}'))
+        frames[day] = frame
+        save_snapshot(frame, tmp_path / 'history', f'{day:%Y-%m-%d}')
+    return tmp_path / 'history', frames
+
+
+def written(root):
+    return {str(path.relative_to(root)): path.read_bytes()
+            for path in sorted(root.rglob('*')) if path.is_file()}
+
+
+def test_replay_across_a_month_boundary_is_reproducible(tmp_path, history):
+    history_dir, frames = history
+    clock = ReplayClock()
+    first = replay_history(history_dir, tmp_path / 'first', clock=clock)
+    second = replay_history(history_dir, tmp_path / 'second')
+    assert first.days == len(DAYS) - 1
+    assert [summary['month'] for summary in first.summaries] == ['02-2026'] * 3 + ['03-2026'] * 3
+    assert first.summaries == second.summaries
+    assert clock() == DAYS[-1]
+
+    # The first March day is diffed against the last February snapshot
+    march = first.summaries[3]
+    assert march['date'] == '2026-03-01'
+    expected = diff_ter_frames(frames[DAYS[3]], frames[DAYS[4]], 'Regular')
+    assert march['regular_count'] == len(expected) > 0
+
+    files = written(tmp_path / 'first')
+    assert files == written(tmp_path / 'second')
+    assert 'output/Regular_Plan_TER_Changes_2026-03-01.csv' in files
+    # Artifact metadata carries the replayed date, not the wall clock
+    sidecar = json.loads(files['baseline_ter_data.csv.schema.json'])
+    assert sidecar['generated_at'] == '2026-03-03T00:00:00'
+
+
+def test_replay_from_a_start_date_uses_the_stored_baseline(tmp_path, history):
+    history_dir, _ = history
+    full = replay_history(history_dir, tmp_path / 'full', write=False)
+    tail = replay_history(history_dir, tmp_path / 'tail', start='2026-03-01', write=False)
+    assert tail.summaries == full.summaries[3:]
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from amfi_ter_analysis.ter_scheduler import AdaptiveSchedule
+
+NOW = datetime(2026, 2, 14, 9, 0)
+
+
+def schedule(**kwargs):
+    return AdaptiveSchedule(path=None, **kwargs)
+
+
+def test_publication_weights_decay_by_age():
+    policy = schedule(half_life_days=30)
+    policy.events = [
+        NOW.isoformat(),                                # 09:00 today
+        (NOW - timedelta(days=30)).isoformat(),         # 09:00, one half-life ago
+        (NOW - timedelta(days=60)).isoformat(),         # 09:00, two half-lives ago
+        (NOW - timedelta(days=90, hours=-5)).isoformat(),  # 14:00, about three ago
+    ]
+    weights = policy.weights(NOW)
+    assert weights[18] == pytest.approx(1 + 0.5 + 0.25)
+    assert weights[28] == pytest.approx(0.5 ** ((90 - 5 / 24) / 30))
+    assert policy.hot_bins(NOW) == {18, 28}
+    policy.hot_factor = 10
+    assert policy.hot_bins(NOW) == {18}
+
+
+def test_spent_budget_sleeps_until_midnight():
+    policy = schedule(budget=3, base_interval=600)
+    now = NOW
+    for _ in range(2):
+        assert policy.next_delay(now, 'unchanged') < 3600
+        now += timedelta(minutes=10)
+    midnight = datetime(2026, 2, 15)
+    assert policy.next_delay(now, 'unchanged') == (midnight - now).total_seconds()
+    # A new day starts a new budget
+    assert policy.next_delay(midnight, 'unavailable') == 600
+
+
+def test_wakes_up_after_the_month_boundary():
+    policy = schedule(max_interval=6 * 3600)
+    policy.backoff = 10
+    now = datetime(2026, 2, 28, 23, 30)
+    assert policy.next_delay(now, 'unchanged') == 30 * 60 + 60
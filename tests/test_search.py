@@ -0,0 +1,24 @@
+from amfi_ter_analysis import ter_search
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from amfi_ter_analysis.ter_search import scheme_search_index
+
+
+def test_index_resyncs_only_when_history_changes(tmp_path, snapshots, monkeypatch):
+    previous, current = snapshots
+    save_snapshot(previous, tmp_path, '2026-02-01')
+    index = scheme_search_index(tmp_path)
+    assert len(index) == len(previous)
+
+    synced = []
+    update = ter_search.SchemeSearchIndex.update
+    monkeypatch.setattr(ter_search.SchemeSearchIndex, 'update',
+                        lambda self, names: synced.append(len(names)) or update(self, names))
+    scheme_search_index(tmp_path)
+    assert synced == []
+
+    renamed = current.assign(**{'Scheme Name': current['Scheme Name'].where(
+        current.index != 0, 'Zeta Renamed Flexi Cap Fund')})
+    save_snapshot(renamed, tmp_path, '2026-02-02')
+    assert scheme_search_index(tmp_path) is index
+    assert synced == [len(previous)]
+    assert index.search('zeta renamed', 1)[0][0] == renamed['NSDL Scheme Code'].iat[0]
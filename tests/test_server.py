@@ -0,0 +1,100 @@
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+from amfi_ter_analysis.ter_analysis import normalize_ter_frame
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from amfi_ter_analysis.ter_server import QueryService, TerServer
+from benchmarks.synthetic import perturb
+
+DAYS = ['2026-03-02', '2026-03-03', '2026-03-04']
+
+
+@pytest.fixture
+def server(tmp_path, snapshots):
+    """TerServer on an ephemeral port over three snapshots and an output directory"""
+    frame, _ = snapshots
+    for seed, day in enumerate(DAYS):
+        frame = normalize_ter_frame(perturb(frame, 0.1, seed=seed, ter_date=day))
+        save_snapshot(frame, tmp_path / 'history', day)
+    (tmp_path / 'output').mkdir()
+    (tmp_path / 'output' / 'report.txt').write_text('daily report')
+    (tmp_path / 'secret.txt').write_text('not served')
+
+    instance = TerServer(QueryService(tmp_path / 'history'), tmp_path / 'output')
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    servers = []
+
+    def ready(server):
+        servers.append(server)
+        started.set()
+
+    def run():
+        try:
+            loop.run_until_complete(instance.serve('127.0.0.1', 0, ready))
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert started.wait(10)
+    port = servers[0].sockets[0].getsockname()[1]
+    yield instance, port
+    loop.call_soon_threadsafe(servers[0].close)
+    thread.join(10)
+    loop.close()
+
+
+def get(port, path, **headers):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.getheader('ETag'), response.read()
+    finally:
+        connection.close()
+
+
+def test_latest_changes_read_only_the_last_two_snapshots(server, monkeypatch):
+    instance, port = server
+    store = instance.service.store
+    loaded = []
+    load = store.load
+    monkeypatch.setattr(store, 'load', lambda path: loaded.append(path.name) or load(path))
+    monkeypatch.setattr(store, 'load_panel', lambda *args: pytest.fail('loaded every snapshot'))
+
+    status, etag, body = get(port, '/api/changes/latest')
+    assert status == 200 and etag
+    payload = json.loads(body)
+    assert (payload['previous_date'], payload['date']) == tuple(DAYS[1:])
+    assert payload['changes']['regular']
+    assert loaded == ['TER_Data_03-2026_20260303.pkl', 'TER_Data_03-2026_20260304.pkl']
+
+    status, same, body = get(port, '/api/changes/latest', **{'If-None-Match': etag})
+    assert (status, same, body) == (304, etag, b'')
+
+
+def test_files_are_served_with_etags(server):
+    _, port = server
+    status, etag, body = get(port, '/report.txt')
+    assert (status, body) == (200, b'daily report')
+    assert get(port, '/report.txt', **{'If-None-Match': etag})[0] == 304
+
+
+@pytest.mark.parametrize('path', ['/api/movers?days=thirty', '/api/history',
+                                  '/api/history?code=X&start=not-a-date',
+                                  '/api/movers?plan=Institutional'])
+def test_bad_parameters_are_rejected(server, path):
+    status, etag, body = get(server[1], path)
+    assert status == 400 and etag is None
+    assert 'error' in json.loads(body)
+
+
+@pytest.mark.parametrize('path', ['/../secret.txt', '/%2e%2e/secret.txt', '/..%2fsecret.txt',
+                                  '/', '/api/nowhere'])
+def test_paths_outside_the_output_directory_are_not_found(server, path):
+    assert get(server[1], path)[0] == 404
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis import ter_sharding
+from amfi_ter_analysis.ter_analysis import diff_ter_frames, normalize_ter_frame
+from amfi_ter_analysis.ter_sharding import shard_bounds, sharded_diff
+from benchmarks.synthetic import make_universe, perturb
+
+PLANS = ('Regular', 'Direct')
+
+
+@pytest.fixture(autouse=True)
+def shard_small_inputs(monkeypatch):
+    monkeypatch.setattr(ter_sharding, 'MIN_SHARDED_ROWS', 0)
+
+
+@pytest.fixture(scope='module')
+def universe():
+    previous = make_universe(3000, seed=3)
+    current = perturb(previous, 0.1, seed=4)
+    # Schemes only on one side on both ends of the code range
+    return (normalize_ter_frame(previous.iloc[5:]),
+            normalize_ter_frame(current.iloc[:-5]))
+
+
+def assert_same_as_serial(previous, current, **kwargs):
+    expected = [diff_ter_frames(previous, current, plan, kwargs.get('change_date'))
+                for plan in PLANS]
+    actual = sharded_diff(previous, current, PLANS, **kwargs)
+    for got, want in zip(actual, expected):
+        assert len(want) > 0
+        pd.testing.assert_frame_equal(got, want)
+
+
+@pytest.mark.parametrize('by', ['amc', 'range'])
+@pytest.mark.parametrize('shards', [2, 3, 7])
+def test_matches_diff_ter_frames(universe, by, shards):
+    assert_same_as_serial(*universe, shards=shards, by=by)
+
+
+def test_matches_with_change_date(universe):
+    assert_same_as_serial(*universe, shards=4, change_date='2026-02-12')
+
+
+def test_unsorted_input(universe):
+    previous, current = universe
+    shuffled = current.sample(frac=1, random_state=0)
+    expected = [diff_ter_frames(previous, shuffled, plan) for plan in PLANS]
+    for got, want in zip(sharded_diff(previous, shuffled, PLANS, shards=3), expected):
+        pd.testing.assert_frame_equal(got, want)
+
+
+def test_repeated_codes(universe):
+    previous, current = universe
+    previous = pd.concat([previous, previous.iloc[100:110]])
+    previous = previous.sort_values('NSDL Scheme Code', kind='mergesort')
+    current = pd.concat([current, current.iloc[200:205]])
+    current = current.sort_values('NSDL Scheme Code', kind='mergesort')
+    assert_same_as_serial(previous.reset_index(drop=True), current.reset_index(drop=True), shards=5)
+
+
+def test_amc_shards_do_not_split_an_amc(universe):
+    previous, current = universe
+    bounds = shard_bounds(previous['NSDL Scheme Code'], current['NSDL Scheme Code'], 6)
+    for (a, b), (c, d) in bounds:
+        amcs = current['NSDL Scheme Code'].iloc[c:d].str.split('/').str[0]
+        rest = current['NSDL Scheme Code'].drop(current.index[c:d]).str.split('/').str[0]
+        assert not set(amcs) & set(rest)
+
+
+def test_amc_keys_out_of_order():
+    codes = pd.Series(['AB-X/1', 'AB-X/2', 'AB/1', 'AB/2', 'AB/3', 'AC/1'])
+    bounds = shard_bounds(codes, codes, 3)
+    covered = np.concatenate([np.arange(c, d) for _, (c, d) in bounds])
+    assert covered.tolist() == list(range(len(codes)))
+
+
+def test_hash_shards_are_not_offered(universe):
+    previous, current = universe
+    # Hash shards are not code ranges; see the ter_sharding module docstring
+    with pytest.raises(ValueError, match='amc, range'):
+        sharded_diff(previous, current, PLANS, shards=2, by='hash')
@@ -0,0 +1,82 @@
+import builtins
+
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis import ter_sinks
+from amfi_ter_analysis.ter_notifier import latest_change_file
+
+
+def touch(directory, name):
+    path = directory / name
+    path.write_text('NSDL Scheme Code\n')
+    return path
+
+
+def test_latest_change_file_finds_every_format(tmp_path):
+    touch(tmp_path, 'Regular_Plan_TER_Changes.csv')
+    touch(tmp_path, 'Regular_Plan_TER_Changes_2026-02-01.csv')
+    newest = touch(tmp_path, 'Regular_Plan_TER_Changes_2026-02-02.parquet')
+    touch(tmp_path, 'Regular_Plan_TER_Changes_2026-02-02.csv.zst.schema.json')
+    assert latest_change_file(tmp_path, 'Regular') == newest
+    assert latest_change_file(tmp_path, 'Direct') is None
+
+
+def test_latest_change_file_prefers_earlier_format_on_same_date(tmp_path):
+    touch(tmp_path, 'Direct_Plan_TER_Changes_2026-02-02.feather')
+    csv = touch(tmp_path, 'Direct_Plan_TER_Changes_2026-02-02.csv')
+    assert latest_change_file(tmp_path, 'Direct') == csv
+
+
+def test_undated_file_is_the_fallback(tmp_path):
+    undated = touch(tmp_path, 'Regular_Plan_TER_Changes.csv.zst')
+    assert latest_change_file(tmp_path, 'Regular') == undated
+
+
+def test_missing_pyarrow_names_the_extra(tmp_path, snapshots, monkeypatch):
+    real_import = builtins.__import__
+
+    def no_pyarrow(name, *args, **kwargs):
+        if name.startswith('pyarrow'):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', no_pyarrow)
+    with pytest.raises(ImportError, match=r'amfi-ter-analysis\[columnar\]'):
+        ter_sinks.write_parquet(snapshots[1], tmp_path / 'x.parquet', {})
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.zst', 'parquet', 'feather'])
+def test_round_trip(tmp_path, snapshots, fmt):
+    frame = snapshots[1]
+    base = tmp_path / 'Regular_Plan_TER_Changes'
+    [path] = ter_sinks.write_artifacts({'changes': ('changes', frame, base)},
+                                       {'changes': [fmt]})
+    assert path.name == f'Regular_Plan_TER_Changes{ter_sinks.EXTENSIONS[fmt]}'
+    read = ter_sinks.read_artifact(path)
+    if fmt.startswith('csv'):
+        assert read.columns.tolist() == frame.columns.tolist()
+        assert read['NSDL Scheme Code'].tolist() == frame['NSDL Scheme Code'].tolist()
+        assert read['Regular Plan - Base TER (%)'].tolist() == pytest.approx(
+            frame['Regular Plan - Base TER (%)'].tolist())
+    else:
+        pd.testing.assert_frame_equal(read, frame.reset_index(drop=True))
+
+    metadata = ter_sinks.read_metadata(path)
+    assert metadata['artifact'] == 'changes'
+    assert metadata['rows'] == len(frame)
+    assert [col['name'] for col in metadata['columns']] == frame.columns.tolist()
+    expected = dict(ter_sinks.build_metadata(frame, 'changes'),
+                    generated_at=metadata['generated_at'])
+    assert metadata == expected
+    # Only the artifact and, for CSV formats, its sidecar are left behind
+    files = {path.name} | ({f'{path.name}.schema.json'} if fmt.startswith('csv') else set())
+    assert {p.name for p in tmp_path.iterdir()} == files
+
+
+def test_feather_metadata_is_read_without_loading_the_table(tmp_path, snapshots, monkeypatch):
+    import pyarrow.feather as feather
+
+    path = ter_sinks.write_feather(snapshots[1], tmp_path / 'x.feather', {'artifact': 'x'})
+    monkeypatch.setattr(feather, 'read_table', lambda *args, **kwargs: pytest.fail('loaded'))
+    assert ter_sinks.read_metadata(path) == {'artifact': 'x'}
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import diff_ter_frames, normalize_ter_frame
+from amfi_ter_analysis.ter_spread import SpreadTable, update_spread_file
+from benchmarks.synthetic import perturb
+
+
+@pytest.fixture
+def days(snapshots):
+    """Day 1 snapshot, day 2 as first published, and day 2 after AMFI revised it"""
+    previous, current = snapshots
+    revised = normalize_ter_frame(perturb(current, 0.05, seed=7))
+    return previous, current, revised
+
+
+def changes(previous, current):
+    return tuple(diff_ter_frames(previous, current, plan) for plan in ('Regular', 'Direct'))
+
+
+def table_of(previous, *currents):
+    table = SpreadTable()
+    table.apply_snapshot(previous, '2026-02-01', batch='2026-02-01')
+    for current in currents:
+        table.update(*changes(previous, current), '2026-02-02', batch='2026-02-02',
+                     snapshot=current)
+    return table
+
+
+def assert_same_table(table, expected):
+    pd.testing.assert_frame_equal(table.current(), expected.current())
+    pd.testing.assert_frame_equal(table.moves(30, limit=None), expected.moves(30, limit=None))
+    assert table._moves == expected._moves
+
+
+def test_rerun_with_same_changes_is_skipped(days):
+    previous, current, _ = days
+    table = table_of(previous, current)
+    regular, direct = changes(previous, current)
+    assert table.update(regular.iloc[::-1], direct, '2026-02-02', batch='2026-02-02',
+                        snapshot=current) == 0
+    assert_same_table(table, table_of(previous, current))
+
+
+def test_revised_newest_batch_replaces_its_moves(days):
+    previous, current, revised = days
+    table = table_of(previous, current, revised)
+    assert table.batches.keys() == {'2026-02-01', '2026-02-02'}
+    assert_same_table(table, table_of(previous, revised))
+
+
+def test_older_batch_is_not_replaced(days):
+    previous, current, revised = days
+    table = table_of(previous, current)
+    table.update(*changes(current, revised), '2026-02-03', batch='2026-02-03', snapshot=revised)
+    expected = table.current()
+    assert table.update(*changes(previous, revised), '2026-02-02', batch='2026-02-02') == 0
+    pd.testing.assert_frame_equal(table.current(), expected)
+
+
+def test_revision_survives_the_table_file(days, tmp_path):
+    previous, current, revised = days
+    path = tmp_path / 'TER_Spread.pkl'
+    update_spread_file(None, None, previous, '2026-02-01', path)
+    update_spread_file(*changes(previous, current), current, '2026-02-02', path)
+    update_spread_file(*changes(previous, revised), revised, '2026-02-02', path)
+    assert_same_table(SpreadTable.load(path), table_of(previous, revised))
+
+
+def test_other_versions_load_empty(days, tmp_path):
+    previous, current, _ = days
+    path = table_of(previous, current).save(tmp_path / 'TER_Spread.pkl')
+    data = pd.read_pickle(path)
+    data['version'] += 1
+    pd.to_pickle(data, path)
+    assert not len(SpreadTable.load(path))
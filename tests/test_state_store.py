@@ -0,0 +1,73 @@
+import json
+import multiprocessing
+
+import pytest
+
+from amfi_ter_analysis.ter_state_store import (
+    SCHEMA_VERSION,
+    JsonStateStore,
+    SqliteStateStore,
+    open_state_store,
+)
+
+WORKERS = 4
+INCREMENTS = 25
+
+
+def increment(path):
+    store = open_state_store(path)
+    for _ in range(INCREMENTS):
+        with store.update() as state:
+            state['daily_snapshots']['count'] = state['daily_snapshots'].get('count', 0) + 1
+
+
+@pytest.mark.parametrize('name', ['ter_state.json', 'ter_state.db'])
+def test_concurrent_updates_from_processes_are_not_lost(tmp_path, name):
+    path = str(tmp_path / name)
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=increment, args=(path,)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    assert open_state_store(path).load()['daily_snapshots']['count'] == WORKERS * INCREMENTS
+
+
+def test_corrupt_json_falls_back_to_defaults_and_keeps_a_copy(tmp_path):
+    path = tmp_path / 'ter_state.json'
+    path.write_text('{"month_year": "2026-')
+    state = JsonStateStore(str(path)).load()
+    assert state['schema_version'] == SCHEMA_VERSION
+    assert len(list(tmp_path.glob('ter_state.json.corrupt-*'))) == 1
+
+
+def test_newer_schema_is_not_treated_as_corrupt(tmp_path):
+    path = tmp_path / 'ter_state.json'
+    newer = {'schema_version': SCHEMA_VERSION + 1, 'month_year': '2026-02'}
+    path.write_text(json.dumps(newer))
+    store = JsonStateStore(str(path))
+    with pytest.raises(ValueError, match='newer than supported'):
+        store.load()
+    with pytest.raises(ValueError):
+        with store.update():
+            pass
+    assert json.loads(path.read_text()) == newer
+    assert not list(tmp_path.glob('*.corrupt-*'))
+
+
+def test_sqlite_rejects_newer_schema(tmp_path):
+    store = SqliteStateStore(str(tmp_path / 'ter_state.db'), import_from=None)
+    conn = store._connect()
+    conn.execute("INSERT INTO state (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION + 1),))
+    conn.close()
+    with pytest.raises(ValueError, match='newer than supported'):
+        store.load()
+
+
+def test_legacy_layout_is_migrated(tmp_path):
+    path = tmp_path / 'ter_state.json'
+    path.write_text(json.dumps({'last_month': 2, 'last_year': 2026}))
+    state = JsonStateStore(str(path)).load()
+    assert state['month_year'] == '2026-02'
+    assert state['file_history'] == {}
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import normalize_ter_frame
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from amfi_ter_analysis.ter_streaming import cleanup_spill, load_history, stream_history
+from benchmarks.synthetic import make_universe, perturb
+
+
+@pytest.fixture
+def history_dir(tmp_path):
+    """Five daily snapshots; some schemes leave on the third day and return on the fifth"""
+    frame = make_universe(300, seed=3)
+    for day in range(1, 6):
+        frame = perturb(frame, 0.1, seed=day, ter_date=f'2026-03-0{day}')
+        snapshot = frame.iloc[40:] if day in (3, 4) else frame
+        save_snapshot(normalize_ter_frame(snapshot), tmp_path, f'2026-03-0{day}')
+    return tmp_path
+
+
+@pytest.mark.parametrize('memory_limit', [256 * 1024 ** 2, 1])
+def test_stream_matches_in_memory_history(history_dir, tmp_path, memory_limit):
+    expected = load_history(history_dir)
+    streamed = stream_history(history_dir, memory_limit=memory_limit, spill_dir=tmp_path / 'spill')
+    try:
+        assert any(buffer.parts for buffer in streamed.changes.values()) == (memory_limit == 1)
+        for plan, changes in expected.changes.items():
+            assert len(changes)
+            pd.testing.assert_frame_equal(streamed.changes[plan].to_frame(), changes, check_dtype=False)
+        pd.testing.assert_frame_equal(streamed.trends, expected.trends, check_dtype=False)
+        pd.testing.assert_frame_equal(streamed.categories, expected.categories, check_dtype=False)
+    finally:
+        cleanup_spill(streamed)
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from amfi_ter_analysis.ter_subscriptions import SubscriptionIndex, load_subscriptions
+
+
+def change(code, reduction, name='Alpha Equity Fund'):
+    return {'NSDL Scheme Code': code, 'Scheme Name': name, 'TER Reduction (%)': reduction}
+
+
+def test_route_matches_filters_and_threshold():
+    index = SubscriptionIndex([
+        {'name': 'all'},
+        {'name': 'large', 'min_change': 0.1},
+        {'name': 'watch', 'watchlist': ['ABC/O/E/EQF/01/01/0001']},
+    ])
+    rows = [change('ABC/O/E/EQF/01/01/0001', 0.05), change('XYZ/O/E/EQF/01/01/0002', -0.2)]
+    routed = index.route(rows)
+    assert routed['all'] == rows
+    assert routed['large'] == [rows[1]]
+    assert routed['watch'] == [rows[0]]
+
+
+def test_duplicate_names_are_rejected():
+    with pytest.raises(ValueError, match='Duplicate subscriber name'):
+        SubscriptionIndex([{'name': 'ops'}, {'name': 'ops', 'min_change': 0.1}])
+
+
+def test_load_rejects_duplicate_names(tmp_path):
+    path = tmp_path / 'subscriptions.json'
+    path.write_text(json.dumps({'subscribers': [{'name': 'ops'}, {'name': 'ops'}]}))
+    with pytest.raises(ValueError):
+        load_subscriptions(str(path))
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amfi_ter_analysis.ter_analysis import normalize_ter_frame
+from amfi_ter_analysis.ter_pipeline import save_snapshot
+from amfi_ter_analysis.ter_trends import TrendPanel
+from benchmarks.synthetic import perturb
+
+NAN = np.nan
+DAYS = pd.to_datetime(['2026-01-01', '2026-01-02', '2026-01-05', '2026-01-06'])
+# Regular Base TER by day; C is only published from the second day
+REGULAR = {
+    'A': [1.00, 1.00, 0.90, 0.95],
+    'B': [2.00, 2.10, 2.10, 2.10],
+    'C': [NAN, 0.50, 0.50, 0.50],
+}
+
+
+def daily_snapshots(previous, days):
+    frame = previous
+    for day in pd.date_range('2026-01-01', periods=days, freq='D'):
+        frame = normalize_ter_frame(perturb(frame, 0.05, seed=day.day,
+                                            ter_date=f'{day:%Y-%m-%d}'))
+        yield day, frame
+
+
+@pytest.fixture
+def panel():
+    panel = TrendPanel()
+    for col, day in enumerate(DAYS):
+        rows = [(code, f'Fund {code}', values[col], values[col] - 0.5)
+                for code, values in REGULAR.items() if not np.isnan(values[col])]
+        panel.append(day, pd.DataFrame(rows, columns=[
+            'NSDL Scheme Code', 'Scheme Name',
+            'Regular Plan - Base TER (%)', 'Direct Plan - Base TER (%)']))
+    return panel
+
+
+def test_daily_append_grows_only_the_date_axis(snapshots):
+    previous, _ = snapshots
+    panel = TrendPanel()
+    for day, frame in daily_snapshots(previous, 40):
+        panel.append(day, frame)
+    _, row_cap, col_cap = panel._data.shape
+    assert row_cap == len(previous)
+    assert 40 <= col_cap < 80
+
+
+def test_running_stats_match_a_full_rescan(snapshots):
+    previous, _ = snapshots
+    panel = TrendPanel()
+    for day, frame in daily_snapshots(previous, 12):
+        panel.append(day, frame)
+    rescanned = panel._running_from_matrix()
+    for key, values in panel._running.items():
+        if values.dtype.kind == 'f':
+            np.testing.assert_allclose(values, rescanned[key], rtol=1e-12, err_msg=key)
+        else:
+            np.testing.assert_array_equal(values, rescanned[key], err_msg=key)
+
+
+def assert_summary(summary, expected):
+    """expected: code -> (observations, cumulative change, revisions, mean, volatility,
+    days since last change)"""
+    columns = ['Observations', 'Cumulative Change', 'Revisions', 'Mean TER', 'Volatility',
+               'Days Since Last Change']
+    assert summary['NSDL Scheme Code'].tolist() == list(expected)
+    np.testing.assert_allclose(summary[columns].to_numpy(dtype=float),
+                               np.array(list(expected.values()), dtype=float), atol=1e-9)
+
+
+def test_full_history_summary(panel):
+    # A moves -0.10 then +0.05: volatility is the std of the two revisions, 0.075
+    assert_summary(panel.summary(), {
+        'A': (4, -0.05, 2, 0.9625, 0.075, 0),
+        'B': (4, 0.10, 1, 2.075, 0.0, 4),
+        'C': (3, 0.0, 0, 0.5, NAN, NAN),
+    })
+    assert panel.summary()['Last Change'].tolist()[:2] == [DAYS[3], DAYS[1]]
+
+
+def test_windowed_summary(panel):
+    # The last three snapshots: B's only revision (into the second day) is outside
+    assert_summary(panel.summary(window=3), {
+        'A': (3, -0.05, 2, 0.95, 0.075, 0),
+        'B': (3, 0.0, 0, 2.1, NAN, NAN),
+        'C': (3, 0.0, 0, 0.5, NAN, NAN),
+    })
+    # Days since the last change count to the end of the range
+    assert_summary(panel.summary(end='2026-01-05', window=2), {
+        'A': (2, -0.10, 1, 0.95, 0.0, 0),
+        'B': (2, 0.0, 0, 2.1, NAN, NAN),
+        'C': (2, 0.0, 0, 0.5, NAN, NAN),
+    })
+    assert_summary(panel.summary(end='2026-01-05'), {
+        'A': (3, -0.10, 1, 0.966667, 0.0, 0),
+        'B': (3, 0.10, 1, 2.066667, 0.0, 3),
+        'C': (2, 0.0, 0, 0.5, NAN, NAN),
+    })
+
+
+def test_rolling(panel):
+    mean, volatility = panel.rolling(window=3)
+    assert mean.index.tolist() == ['A', 'B', 'C']
+    assert mean.columns.tolist() == DAYS.tolist()
+    np.testing.assert_allclose(mean.to_numpy(), [
+        [1.00, 1.00, 0.966667, 0.95],
+        [2.00, 2.05, 2.066667, 2.10],
+        [NAN, 0.50, 0.50, 0.50],
+    ], atol=1e-9)
+    # Three snapshots span two revisions
+    np.testing.assert_allclose(volatility.to_numpy(), [
+        [NAN, NAN, 0.0, 0.075],
+        [NAN, 0.0, 0.0, NAN],
+        [NAN, NAN, NAN, NAN],
+    ], atol=1e-9)
+    assert panel.rolling('Direct', window=3)[0].iat[0, 3] == pytest.approx(0.45)
+
+
+def test_from_history_sees_a_snapshot_saved_just_now(tmp_path, snapshots):
+    previous, current = snapshots
+    save_snapshot(previous, tmp_path, '2026-01-01')
+    assert TrendPanel.from_history(tmp_path).dates == [pd.Timestamp('2026-01-01')]
+    save_snapshot(current, tmp_path, '2026-01-02')
+    panel = TrendPanel.from_history(tmp_path)
+    assert panel.dates == [pd.Timestamp('2026-01-01'), pd.Timestamp('2026-01-02')]